@@ -1,22 +1,201 @@
+import contextlib
+
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.forms.models import BaseInlineFormSet
+from django.db import models
+from django.db.models import Case, F, OuterRef, Subquery, Sum, When
+from django.utils.functional import cached_property
 from django.urls import reverse
+from django.utils.html import format_html
 from django.http import HttpResponseRedirect
 
-from .models import Currency, Category, Bank, Account, AccountCategory, AccountRec, Risk, InvProj, InvRec
+from . import jobs
+from . import ledger
+from . import search
+from .db import use_replica
+from .models import Owned, Currency, Category, Bank, Account, AcctSnapshot, AccountCategory, AccountRec, Risk, InvProj, ProjSnapshot, InvRec, PriceHist, RateHist, Job, Archive
+
+
+class ReplicaAdmin(admin.ModelAdmin):
+
+    # GET的列表页只读，在只读连接上查询和渲染。
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET':
+            return super().changelist_view(request, extra_context)
+        with use_replica():
+            response = super().changelist_view(request, extra_context)
+            if hasattr(response, 'render'):
+                response.render()
+        return response
+
+
+def owned_choices(db_field, request, kwargs):
+    related = db_field.related_model
+    if issubclass(related, Owned) and 'queryset' not in kwargs:
+        kwargs['queryset'] = related.objects.owned_by(request.user)
+
+
+# 列表页的外键过滤器只列出自己的对象。
+class OwnedFieldListFilter(admin.RelatedFieldListFilter):
+
+    def field_choices(self, field, request, model_admin):
+        related = field.related_model
+        ordering = self.field_admin_ordering(field, request, model_admin)
+        qs = related.objects.owned_by(request.user)
+        if ordering:
+            qs = qs.order_by(*ordering)
+        return [(x.pk, str(x)) for x in qs]
+
+
+admin.FieldListFilter.register(
+    lambda f: f.remote_field and issubclass(f.related_model, Owned),
+    OwnedFieldListFilter, take_priority=True)
+
+
+# 外键很多时，列表页的过滤器用自动补全，不再列出所有对象。
+# 被过滤的模型的admin需要有search_fields。
+class AutocompleteFilter(admin.RelatedFieldListFilter):
+    template = 'admin/inv/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        qs = field.related_model.objects.owned_by(request.user)
+        widget = forms.ModelChoiceField(
+            qs, widget=AutocompleteSelect(field, model_admin.admin_site),
+            required=False).widget
+        self.widget_id = f'autocomplete_{field_path}'
+        self.widget_html = widget.render(self.lookup_kwarg, self.lookup_val,
+                                         attrs={'id': self.widget_id})
+
+    def field_choices(self, field, request, model_admin):
+        return []
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        yield {
+            'widget': self.widget_html,
+            'widget_id': self.widget_id,
+            'lookup_kwarg': self.lookup_kwarg,
+            'base_url': changelist.get_query_string(
+                remove=[self.lookup_kwarg, self.lookup_kwarg_isnull]),
+        }
+
+
+# 用了AutocompleteFilter的admin需要加载select2。
+class AutocompleteMedia(object):
+
+    @property
+    def media(self):
+        return super().media + AutocompleteSelect(None, self.admin_site).media
+
+
+class EstimatedCountPaginator(Paginator):
+    # 只精确数到CAP行，再多就估计，避免大表上的COUNT(*)。
+    # 按主键顺序取过滤后的第CAP+1行，用前CAP行占的主键跨度推算整个主键范围里的行数，
+    # 所有者、过滤、搜索和日期层级的条件都算在内。
+    CAP = 10000
+
+    @cached_property
+    def count(self):
+        qs = self.object_list.order_by()
+        n = qs.values('pk')[:self.CAP+1].count()
+        if n <= self.CAP:
+            return n
+        pks = qs.order_by('pk').values_list('pk', flat=True)
+        first, nth = pks[0], pks[self.CAP]
+        last = qs.order_by('-pk').values_list('pk', flat=True)[0]
+        return max(n, round(self.CAP * (last - first + 1) / (nth - first)))
+
+
+class OwnedAdmin(ReplicaAdmin):
+    exclude = ('owner',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).owned_by(request.user)
+
+    def save_model(self, request, obj, form, change):
+        if obj.owner_id is None:
+            obj.owner = request.user
+        super().save_model(request, obj, form, change)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        owned_choices(db_field, request, kwargs)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+# 列表页的批量删除默认直接queryset.delete()，不经过模型的delete，余额、快照、
+# 持仓批次和项目统计都不会更新。这里逐条删除，同一个项目的统计最后只重算一次。
+class PostingAdmin(object):
+
+    def delete_queryset(self, request, queryset):
+        with ledger.writing(request.user.id), contextlib.ExitStack() as stack:
+            objs = list(queryset)
+            if queryset.model is InvRec:
+                for proj in {obj.proj for obj in objs}:
+                    stack.enter_context(proj.deferred_stats())
+            for obj in objs:
+                obj.delete()
+
+
+class OwnedInline(admin.TabularInline):
+    exclude = ('owner',)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        owned_choices(db_field, request, kwargs)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+# 注释和名称走全文索引，不再扫描整个表。prefix_search_fields里的字段另外做前缀匹配，结果合并。
+class FullTextSearchAdmin(object):
+    prefix_search_fields = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        result = search.search(queryset, search_term)
+        for field in self.prefix_search_fields:
+            result |= queryset.filter(**{f'{field}__istartswith': search_term.strip()})
+        return result, False
+
+
+# 耗时的批量操作放进后台任务队列，由worker命令执行，页面立即返回。
+def enqueue(modeladmin, request, name, queryset):
+    job = jobs.enqueue(request.user, name, ids=list(queryset.values_list('id', flat=True)))
+    modeladmin.message_user(request, format_html(
+        '已加入后台任务{job}，<a href="{link}">查看进度</a>。',
+        job=job, link=reverse('inv:jobs')))
 
 
 @admin.register(Currency)
-class CurrencyAdmin(admin.ModelAdmin):
+class CurrencyAdmin(ReplicaAdmin):
     list_display = ('name', 'rate', 'accounts', 'investments', 'total', 'total_in_local')
     actions = ['update_current_price',]
 
+    # 币种是公共的，余额只统计当前用户自己的账户和投资。
+    def get_queryset(self, request):
+        money = models.DecimalField(max_digits=16, decimal_places=2)
+        accounts = Account.objects.owned_by(request.user).filter(
+            currency=OuterRef('pk')).values('currency').annotate(s=Sum(Case(
+                When(cat__cat__in=[2, 4], then=-F('value')),
+                default=F('value')))).values('s')
+        investments = InvProj.objects.owned_by(request.user).filter(
+            acct__currency=OuterRef('pk'), isopen=True).values(
+                'acct__currency').annotate(s=Sum('value')).values('s')
+        return super().get_queryset(request).annotate(
+            accounts_sum=Subquery(accounts, output_field=money),
+            investments_sum=Subquery(investments, output_field=money))
+
     def accounts(self, currency):
-        return sum(((-a.value if a.cat.cat in {2, 4} else a.value)
-                    for a in currency.account_set.all()))
+        return currency.accounts_sum or 0
     accounts.short_description = '账户余额'
 
     def investments(self, currency):
-        return sum((p.value for p in InvProj.objects.filter(acct__currency=currency, isopen=True).all()))
+        return currency.investments_sum or 0
     investments.short_description = '投资余额'
 
     def total(self, currency):
@@ -27,14 +206,14 @@ class CurrencyAdmin(admin.ModelAdmin):
         return '{0:0.2f}'.format(self.total(currency)*currency.rate)
     total_in_local.short_description = '以本币计总余额'
 
+    # 所有选中的币种在一个后台任务里共用一次汇率表请求。
     def update_current_price(self, request, queryset):
-        for c in queryset:
-            c.update_current_price()
+        enqueue(self, request, 'update_rates', queryset)
     update_current_price.short_description = '更新汇率'
 
 
 @admin.register(Category)
-class CategoryAdmin(admin.ModelAdmin):
+class CategoryAdmin(OwnedAdmin):
     list_display = ('name', 'cat', 'value', 'value_in_local')
 
     def value(self, cat):
@@ -51,12 +230,14 @@ class CategoryAdmin(admin.ModelAdmin):
     value_in_local.short_description = '以本币计总余额'
 
 
-class AccountInline(admin.TabularInline):
+class AccountInline(OwnedInline):
     model = Account
+    # 余额由收支记录过账得到，新建的账户从0开始。
+    readonly_fields = ('value',)
 
 
 @admin.register(Bank)
-class BankAdmin(admin.ModelAdmin):
+class BankAdmin(OwnedAdmin):
     list_display = ('name', 'value')
     inlines = [AccountInline,]
 
@@ -74,30 +255,61 @@ class BankAdmin(admin.ModelAdmin):
 
 
 @admin.register(Account)
-class AccountAdmin(admin.ModelAdmin):
+class AccountAdmin(OwnedAdmin):
     list_display = ('bank', 'name', 'currency', 'cat', 'value')
     list_display_links = ('name',)
-    list_editable = ('value',)
     list_filter = ['bank', 'currency', 'cat']
-    search_fields = ['name',]
+    search_fields = ['name', 'bank__name']
+    ordering = ('bank', 'name')
     # inlines = [AccountRecInline,]
 
+    # 余额只在新建时填写期初值，之后由过账维护。
+    def get_readonly_fields(self, request, obj=None):
+        if obj:
+            return ('value',)
+        return ()
+
+
+@admin.register(AcctSnapshot)
+class AcctSnapshotAdmin(ReplicaAdmin):
+    list_display = ('acct', 'date', 'value')
+    list_select_related = ('acct__bank',)
+    date_hierarchy = 'date'
+    list_filter = ['acct']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).filter(acct__owner=request.user)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 @admin.register(AccountCategory)
-class AccountCategoryAdmin(admin.ModelAdmin):
+class AccountCategoryAdmin(OwnedAdmin):
     list_display = ('name', 'cat')
+    search_fields = ['name']
+    ordering = ('cat', 'name')
 
 
 @admin.register(AccountRec)
-class AccountRecAdmin(admin.ModelAdmin):
+class AccountRecAdmin(FullTextSearchAdmin, AutocompleteMedia, PostingAdmin, OwnedAdmin):
     list_display = ('acct', 'date', 'cat', 'value', 'comment')
     list_display_links = ('date',)
-    list_editable = ('value', 'comment')
-    list_filter = ['acct', 'date', 'cat']
+    list_select_related = ('acct__bank', 'cat')
+    list_filter = [('acct', AutocompleteFilter), ('cat', AutocompleteFilter)]
+    date_hierarchy = 'date'
+    ordering = ('-date', '-id')
+    search_fields = ['comment']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    autocomplete_fields = ['acct', 'cat']
 
 
 @admin.register(Risk)
-class RiskAdmin(admin.ModelAdmin):
+class RiskAdmin(OwnedAdmin):
     list_display = ('name', 'value', 'percentage')
 
     def value(self, risk):
@@ -107,46 +319,169 @@ class RiskAdmin(admin.ModelAdmin):
 
     def percentage(self, risk):
         total = sum((p.value*p.acct.currency.rate
-                     for p in InvProj.objects.filter(isopen=True).all()))
+                     for p in InvProj.objects.filter(
+                         owner_id=risk.owner_id, isopen=True).all()))
         return '{0:0.2f}'.format(100*self.value(risk)/total)
     percentage.short_description = '百分比'
 
 
-class InvRecInline(admin.TabularInline):
+class RecentInlineFormSet(BaseInlineFormSet):
+    # 只编辑最近的若干条记录，更早的到投资记录列表里去看。
+
+    def get_queryset(self):
+        if not hasattr(self, '_recent'):
+            qs = super().get_queryset()
+            ids = list(qs.order_by('-date', '-id').values_list(
+                'pk', flat=True)[:self.recent])
+            self._recent = qs.filter(pk__in=ids).select_related(
+                'proj').order_by('date', 'id')
+        return self._recent
+
+
+class InvRecInline(OwnedInline):
     model = InvRec
+    formset = RecentInlineFormSet
+    recent = 20
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.recent = self.recent
+        return formset
+
+
+# 按保存在表里的净值过滤，走(owner, profit)索引。
+class ProfitFilter(admin.SimpleListFilter):
+    title = '盈亏'
+    parameter_name = 'profit'
+
+    def lookups(self, request, model_admin):
+        return (('gain', '盈利'), ('loss', '亏损'))
+
+    def queryset(self, request, queryset):
+        if self.value() == 'gain':
+            return queryset.filter(profit__gt=0)
+        if self.value() == 'loss':
+            return queryset.filter(profit__lt=0)
 
 
 @admin.register(InvProj)
-class InvProjAdmin(admin.ModelAdmin):
+class InvProjAdmin(FullTextSearchAdmin, OwnedAdmin):
     list_display = ('name', 'isopen', 'currency', 'bank', 'cat', 'risk',
                     'start', 'end', 'duration',
-                    'value', 'avg_price', 'current_price', 'net_value')
+                    'value', 'avg_price', 'current_price', 'mkt_value',
+                    'net_value', 'profit_rate')
     # list_display_links = ('start',)
     date_hierarchy = 'end'
-    list_filter = ['isopen', 'acct__currency', 'acct__bank', 'cat', 'risk']
-    exclude = ('start', 'amount', 'buy_amount', 'sell_amount',
-               'value', 'buy_value', 'sell_value', 'dividends', 'irr', 'local_irr')
+    list_filter = ['isopen', ProfitFilter, 'acct__currency', 'acct__bank', 'cat', 'risk']
+    search_fields = ['name', 'comment', 'code']
+    prefix_search_fields = ('code',)
+    ordering = ('-isopen', 'name')
+    exclude = ('owner', 'start', 'amount', 'buy_amount', 'sell_amount',
+               'value', 'buy_value', 'sell_value', 'dividends', 'irr', 'local_irr',
+               'mkt_value', 'profit', 'profit_rate')
+    readonly_fields = ('older_records',)
     inlines = [InvRecInline,]
     actions = ['update_current_price', 'update_from_rec']
 
     def view_on_site(self, obj):
         return reverse('inv:proj_stat', kwargs={'projid': obj.id})
 
-    def save_model(self, request, obj, form, change):
-        obj.update_from_rec()
-        super().save_model(request, obj, form, change)
+    def older_records(self, obj):
+        if not obj or not obj.pk:
+            return '-'
+        n = obj.invrec_set.count()
+        return format_html(
+            '共{n}条，下方只显示最近{recent}条。<a href="{link}?proj__id__exact={id}">查看全部</a>',
+            n=n, recent=InvRecInline.recent, id=obj.pk,
+            link=reverse('admin:inv_invrec_changelist'))
+    older_records.short_description = '投资记录'
+
+    # 记录全部保存之后只重算一次统计。
+    def save_related(self, request, form, formsets, change):
+        with form.instance.deferred_stats():
+            super().save_related(request, form, formsets, change)
 
     def update_current_price(self, request, queryset):
-        for p in queryset:
-            p.update_current_price()
+        enqueue(self, request, 'update_current_price', queryset)
     update_current_price.short_description = '更新现价'
 
     def update_from_rec(self, request, queryset):
-        for p in queryset:
-            p.update_from_rec()
+        enqueue(self, request, 'update_from_rec', queryset)
     update_from_rec.short_description = '更新统计'
 
 
+@admin.register(ProjSnapshot)
+class ProjSnapshotAdmin(ReplicaAdmin):
+    list_display = ('proj', 'date', 'value')
+    list_select_related = ('proj',)
+    date_hierarchy = 'date'
+    list_filter = ['proj']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).filter(proj__owner=request.user)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(InvRec)
-class InvRecAdmin(admin.ModelAdmin):
+class InvRecAdmin(AutocompleteMedia, PostingAdmin, OwnedAdmin):
     list_display = ('proj', 'date', 'cat', 'amount', 'price', 'value', 'rate', 'commission')
+    list_select_related = ('proj',)
+    list_filter = [('proj', AutocompleteFilter), 'cat']
+    raw_id_fields = ('proj',)
+    date_hierarchy = 'date'
+    ordering = ('-date', '-id')
+
+
+@admin.register(PriceHist)
+class PriceHistAdmin(ReplicaAdmin):
+    list_display = ('proj', 'date', 'price')
+    date_hierarchy = 'date'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).filter(proj__owner=request.user)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        owned_choices(db_field, request, kwargs)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+@admin.register(RateHist)
+class RateHistAdmin(ReplicaAdmin):
+    list_display = ('currency', 'date', 'rate')
+    date_hierarchy = 'date'
+    list_filter = ['currency']
+
+
+@admin.register(Job)
+class JobAdmin(OwnedAdmin):
+    list_display = ('id', 'task', 'status', 'progress', 'total', 'created',
+                    'duration')
+    list_filter = ['status', 'task']
+    ordering = ('-id',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Archive)
+class ArchiveAdmin(OwnedAdmin):
+    list_display = ('model', 'date', 'rollup', 'data')
+    list_filter = ['model']
+    date_hierarchy = 'date'
+    ordering = ('-date', '-id')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+import asyncio
+
+from asgiref.sync import sync_to_async
+
+from . import drivers
+from .transport import get_transport
+
+
+class Fetcher(object):
+
+    def __init__(self, client):
+        self.client = client
+        self.transport = get_transport()
+        # 同一批次里相同的url只下载一次，例如SGE的行情页。
+        self.pages = {}
+
+    async def download(self, url):
+        resp = await self.client.get(self.transport.url_for(url))
+        resp.raise_for_status()
+        return resp.content
+
+    # 共用的页面对每个驱动和代号各存一次，record模式的样本索引里每个代号都有一项。
+    async def get(self, url, driver=None, _id=None):
+        if url not in self.pages:
+            self.pages[url] = asyncio.ensure_future(self.download(url))
+        content = await self.pages[url]
+        await sync_to_async(self.transport.store, thread_sensitive=False)(
+            url, content, driver, _id)
+        return content
+
+    async def fetch(self, name, _id):
+        if name in drivers.http_drivers:
+            url, parse = drivers.http_drivers[name]
+            content = await self.get(url(_id), name, _id)
+            return await sync_to_async(parse, thread_sensitive=False)(content, _id)
+        func = drivers.get_driver(name)
+        if func is None:
+            return
+        # 没有异步接口的驱动（investpy, pycoingecko）放到线程池里跑。
+        return await sync_to_async(func, thread_sensitive=False)(_id)
+
+
+# quotes: [(key, driver, id), ...]，返回[(key, price, error), ...]
+async def fetch_all(quotes, concurrency=8, timeout=10):
+    import httpx
+    sem = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=timeout, trust_env=False) as client:
+        fetcher = Fetcher(client)
+
+        async def one(key, name, _id):
+            async with sem:
+                try:
+                    return key, await fetcher.fetch(name, _id), None
+                except Exception as err:
+                    return key, None, err
+
+        return await asyncio.gather(*[one(*q) for q in quotes])
+
+
+# 返回{币种名: (汇率, 错误)}，和drivers.currency_rates一样先取汇率表再逐个补缺。
+async def fetch_rates(names, concurrency=8, timeout=10):
+    import httpx
+    base = drivers.RateTable_base
+    async with httpx.AsyncClient(timeout=timeout, trust_env=False) as client:
+        try:
+            content = await Fetcher(client).get(drivers.RateTable_url(base))
+            table = drivers.RateTable_parse(content, base)
+        except Exception:
+            table = {}
+    result = {n: (r, None) for n, r in drivers.cross_rates(table, names).items()}
+    missing = [(n, 'InvestingCurrency', n) for n in names if n not in result]
+    for name, rate, err in await fetch_all(missing, concurrency, timeout):
+        result[name] = (rate, err)
+    return result
@@ -0,0 +1,168 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+import datetime
+import functools
+import hashlib
+
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.http import condition, require_GET
+
+from .models import Version
+from . import views
+from .db import replica
+
+
+def api_login_required(view):
+    @functools.wraps(view)
+    def inner(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'login required'}, status=401)
+        return view(request, *args, **kwargs)
+    return inner
+
+
+# 报表只依赖用户、数据版本、当天日期（收支表取最近一年）和查询参数。
+# 版本号是计数器，不同用户的计数可能相同。
+def etag(request, *args, **kwargs):
+    key = '|'.join([str(request.user.id), Version.of(request.user.id),
+                    str(datetime.date.today()),
+                    request.path, request.GET.urlencode()])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def last_modified(request, *args, **kwargs):
+    today = timezone.make_aware(datetime.datetime.combine(
+        datetime.date.today(), datetime.time()))
+    modified = Version.modified_of(request.user.id)
+    return max(modified, today) if modified else today
+
+
+def report(view):
+    # 先检查登录，再算ETag，未变化时直接304，不进入报表计算。
+    return api_login_required(require_GET(
+        condition(etag_func=etag, last_modified_func=last_modified)(
+            replica(view))))
+
+
+def sheet_json(env):
+    curs = [cur.name for cur in env['curs']]
+
+    def amounts(values):
+        return dict(zip(curs + ['total'], values))
+
+    sections = []
+    for i, name in enumerate(['流动资产', '流动负债', '固定资产', '长期负债', '投资'], 1):
+        rows = env['sheet'][i]
+        sections.append({
+            'cat': i,
+            'name': name,
+            'rows': [{'id': cat.id, 'name': cat.name, 'values': amounts(values)}
+                     for cat, values in rows[:-1]],
+            'subtotal': amounts(rows[-1][1]),
+        })
+    return {
+        'currencies': curs,
+        'sections': sections,
+        'assets': amounts(env['assets']),
+        'liabilities': amounts(env['liabilities']),
+        'equity': amounts(env['equity']),
+        'liquidity_ratio': env['liquidity_ratio'],
+        'debt_asset_ratio': env['debt_asset_ratio'],
+    }
+
+
+@report
+def balance_sheet(request):
+    try:
+        dates = views.balance_dates(request)
+    except ValueError:
+        return JsonResponse({'error': 'bad date'}, status=400)
+    if not dates:
+        return JsonResponse(sheet_json(views.balance_sheet_env(request.user)))
+    sheets = []
+    for date, env in views.balance_sheets(request.user, dates):
+        data = sheet_json(env)
+        data['date'] = date
+        sheets.append(data)
+    return JsonResponse({'sheets': sheets})
+
+
+@report
+def income_outgoing_sheet(request):
+    env = views.income_outgoing_env(*views.income_outgoing_data(request.user))
+
+    def items(l):
+        return [{'name': name, 'value': value} for name, value in l]
+
+    data = {k: items(env[k]) for k in ('income', 'outgoing', 'investments')}
+    for k in ('total_income', 'total_outgoing', 'net_income'):
+        data[k] = env[k]
+    # 比率里可能有numpy的浮点数。
+    for k in ('saving_rate', 'invest_income_rate', 'invest_outgoing_rate',
+              'invest_rate'):
+        data[k] = float(env[k])
+    return JsonResponse(data)
+
+
+def frame_json(df):
+    rows = []
+    for dt, row in df.iterrows():
+        values = {k: (None if v != v else float(v)) for k, v in row.items()}
+        rows.append({'month': dt, 'values': values})
+    return {'columns': list(df.columns), 'rows': rows}
+
+
+@report
+def income_details(request):
+    series = views.income_details_data(request.user)
+    return JsonResponse(frame_json(views.details_frame(series)))
+
+
+@report
+def outgoing_details(request):
+    series = views.outgoing_details_data(request.user)
+    return JsonResponse(frame_json(views.details_frame(series)))
+
+
+PROJ_FIELDS = ['id', 'name', 'code', 'url', 'isopen', 'start', 'end',
+               'current_price', 'buy_amount', 'sell_amount', 'amount',
+               'buy_value', 'sell_value', 'value', 'dividends', 'irr',
+               'local_irr', 'comment']
+
+
+@report
+def proj_stat(request, projid):
+    proj, recs = views.proj_stat_data(projid, request.user)
+    data = {f: getattr(proj, f) for f in PROJ_FIELDS}
+    data.update({
+        'account': proj.acct.name,
+        'bank': proj.acct.bank.name,
+        'currency': proj.acct.currency.name,
+        'cat': proj.cat.name,
+        'risk': proj.risk.name,
+        'market_value': proj.mkt_value,
+        'net_value': proj.profit,
+        'net_value_rate': proj.profit_rate,
+        'buy_price': proj.buy_price(),
+        'sell_price': proj.sell_price(),
+        'avg_price': proj.avg_price(),
+        'duration': proj.duration(),
+        'cost_method': proj.get_cost_method_display(),
+        'realized_gain': proj.realized_gain(),
+        'unrealized_gain': proj.unrealized_gain(),
+        'lots': [{'date': date, 'amount': amount, 'cost': cost}
+                 for date, amount, cost, price in proj.open_lots()],
+        'recs': [{
+            'date': r.date, 'cat': r.get_cat_display(), 'amount': r.amount,
+            'price': r.price, 'value': r.value,
+            'commission': r.commission, 'rate': r.rate,
+        } for r in recs],
+    })
+    return JsonResponse(data)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class InvConfig(AppConfig):
     name = 'inv'
+
+    def ready(self):
+        from . import signals
+        from . import db
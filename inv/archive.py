@@ -0,0 +1,247 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+import calendar
+import decimal
+import datetime
+
+from django.core import serializers
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+
+from . import ledger
+from . import lots
+from . import search
+from .models import Account, AccountRec, AcctSnapshot, InvProj, InvRec, LotBook, PriceHist, ProjSnapshot, Archive
+
+
+# 归档把旧的收支记录换成按月汇总的记录，把已经结束的投资项目连同记录整个移走。
+# 收支记录：每组（账户、收支类别、月）的合计不变，汇总记录仍然在原来的表里，记在月末，
+# 所以各个月末的余额、快照和按月统计的收支细节表都不变。
+# 投资项目：项目（带着最后的统计数据）、记录、价格历史和项目快照都序列化进归档表，
+# 项目的起止日期、IRR和持仓批次都依赖每一条记录，不能汇总。归档前先补齐账户和项目
+# 每个月末的快照，月末的余额和资产负债表从快照里得到，收入细节表从归档表里读已结束的项目。
+# 两种归档都会让归档月份里月中某天的余额少算当月的记录。
+# 归档和恢复都不经过过账，余额和快照本来就已经包含这些记录。
+# 收支表取最近一年的记录，只能归档去年之前的年份。
+
+CHUNK = 500
+
+# 项目和它的各种记录，按插入的顺序排列，删除时倒过来。
+PROJECT_MODELS = [
+    ('invproj', InvProj),
+    ('invrec', InvRec),
+    ('pricehist', PriceHist),
+    ('projsnapshot', ProjSnapshot),
+]
+
+
+def chunks(seq, size=CHUNK):
+    seq = list(seq)
+    for i in range(0, len(seq), size):
+        yield seq[i:i+size]
+
+
+def raw_delete(model, pks, using):
+    for chunk in chunks(pks):
+        model.objects.filter(pk__in=chunk)._raw_delete(using)
+
+
+def refresh_search(model, pks, using):
+    if model._meta.model_name in search.TABLES and search.available(using):
+        search.refresh(model, pks, using)
+
+
+def to_archive(owner, name, rollup, objs, date=lambda obj: obj.date):
+    return [Archive(owner=owner, model=name, rollup=rollup, date=date(obj), data=data)
+            for data, obj in zip(serializers.serialize('python', objs), objs)]
+
+
+def from_archive(qs):
+    return [d.object for d in serializers.deserialize(
+        'python', qs.values_list('data', flat=True).iterator())]
+
+
+def archived_projects(owner):
+    # 已归档的项目，带着归档时的统计数据，账户和币种一起读出。
+    projs = from_archive(Archive.objects.owned_by(owner).filter(model='invproj'))
+    prefetch_related_objects(projs, 'acct__currency')
+    return projs
+
+
+def project_snapshots(owner, start, until):
+    # 在start之后结束的已归档项目，和它们到until为止的快照，格式同ledger.load_snapshots。
+    projs = from_archive(Archive.objects.owned_by(owner).filter(
+        model='invproj', date__gt=start))
+    snaps = {}
+    for snap in from_archive(Archive.objects.owned_by(owner).filter(
+            model='projsnapshot', rollup__in=[p.pk for p in projs],
+            date__lte=until).order_by('date')):
+        dates, values = snaps.setdefault(snap.proj_id, ([], []))
+        dates.append(snap.date)
+        values.append(snap.value)
+    return projs, snaps
+
+
+def accountrec_rollup(owner, key, recs):
+    acct_id, cat_id, year, month = key
+    return AccountRec(owner=owner, acct_id=acct_id, cat_id=cat_id,
+                      date=datetime.date(year, month, calendar.monthrange(year, month)[1]),
+                      value=sum(r.value for r in recs),
+                      comment=f'{year}年{month}月归档汇总，{len(recs)}条')
+
+
+def totals(owner):
+    # 每个账户的余额变动和每个项目的数量、成本合计，归档表里的投资记录也算在内，
+    # 归档前后必须一致。sqlite的SUM是浮点运算，逐条用Decimal加。
+    cent, unit = decimal.Decimal('0.01'), decimal.Decimal('0.0001')
+    result = {}
+    for acct in Account.objects.owned_by(owner).values_list('id', flat=True):
+        result[('acct', acct)] = ledger.accountrec_sum(acct, None, datetime.date.max)
+    accts = dict(InvProj.objects.owned_by(owner).values_list('id', 'acct_id'))
+    accts.update((p.pk, p.acct_id) for p in from_archive(
+        Archive.objects.owned_by(owner).filter(model='invproj')))
+    recs = list(InvRec.objects.owned_by(owner)) + from_archive(
+        Archive.objects.owned_by(owner).filter(model='invrec'))
+    for r in recs:
+        key = ('acct', accts[r.proj_id])
+        result[key] = result.get(key, decimal.Decimal()) + (-r.value if r.cat == 1 else r.value)
+        a, v, c = result.get(('proj', r.proj_id, r.cat), (0, 0, 0))
+        result[('proj', r.proj_id, r.cat)] = (a+r.amount, v+r.value, c+(r.commission or 0))
+    for key, value in result.items():
+        if key[0] == 'acct':
+            result[key] = value.quantize(cent)
+        else:
+            a, v, c = value
+            result[key] = (a.quantize(unit), v.quantize(cent), decimal.Decimal(c).quantize(cent))
+    return result
+
+
+def archive_accountrecs(owner, before):
+    # 已经是汇总记录的不再归档。
+    rollups = Archive.objects.owned_by(owner).filter(model='accountrec').values('rollup')
+    qs = AccountRec.objects.owned_by(owner).filter(date__lt=before).exclude(id__in=rollups)
+    groups = {}
+    for r in qs.order_by('date', 'id'):
+        groups.setdefault((r.acct_id, r.cat_id, r.date.year, r.date.month), []).append(r)
+    archived = []
+    for key, recs in groups.items():
+        # 只有一条的组汇总了也不会变小。
+        if len(recs) < 2:
+            continue
+        obj = accountrec_rollup(owner, key, recs)
+        # 跳过模型自己的save，不重复过账。
+        super(AccountRec, obj).save()
+        archived.extend(to_archive(owner, 'accountrec', obj.pk, recs))
+        raw_delete(AccountRec, [r.pk for r in recs], qs.db)
+        refresh_search(AccountRec, [r.pk for r in recs], qs.db)
+    Archive.objects.bulk_create(archived, batch_size=CHUNK)
+    return {'accountrec': len(archived)}
+
+
+def fill_snapshots(projs, until):
+    # 项目的记录删掉以后，账户在这些月末的余额只能从快照里得到。
+    # 从项目开始的那个月起，补上每个缺少的月末快照。
+    starts = {}
+    for p in projs:
+        starts[p.acct_id] = min(p.start, starts.get(p.acct_id, p.start))
+    for acct_id, start in starts.items():
+        have = set(AcctSnapshot.objects.filter(acct_id=acct_id).values_list('date', flat=True))
+        for date in ledger.month_ends(start-datetime.timedelta(days=1), until):
+            if date not in have:
+                ledger.snapshot(acct_id, date)
+    ledger.take_proj_snapshots(projs, until)
+
+
+def archive_projects(owner, before):
+    # 归档before之前结束的项目，项目的pk记在rollup里。
+    projs = list(InvProj.objects.owned_by(owner).filter(
+        isopen=False, start__isnull=False, end__lt=before))
+    fill_snapshots(projs, before-datetime.timedelta(days=1))
+    result = {name: 0 for name, model in PROJECT_MODELS}
+    archived, pks = [], {}
+    for proj in projs:
+        for name, model in PROJECT_MODELS:
+            if model is InvProj:
+                objs = [proj]
+                archived.extend(to_archive(owner, name, proj.pk, objs, lambda p: p.end))
+            else:
+                objs = list(model.objects.filter(proj=proj).order_by('date', 'pk'))
+                archived.extend(to_archive(owner, name, proj.pk, objs))
+            pks.setdefault(model, []).extend(obj.pk for obj in objs)
+            result[name] += len(objs)
+    Archive.objects.bulk_create(archived, batch_size=CHUNK)
+    using = InvProj.objects.db
+    LotBook.objects.filter(proj__in=[p.pk for p in projs])._raw_delete(using)
+    for name, model in reversed(PROJECT_MODELS):
+        raw_delete(model, pks.get(model, []), using)
+    refresh_search(InvProj, pks.get(InvProj, []), using)
+    return result
+
+
+def archive(owner, year, dry_run=False):
+    # 归档year之前的记录和项目，返回{模型名: 归档的行数}。
+    if year > datetime.date.today().year-1:
+        raise ValueError('only years before last year can be archived')
+    before = datetime.date(year, 1, 1)
+    with ledger.writing(owner.id):
+        expect = totals(owner)
+        result = archive_accountrecs(owner, before)
+        result.update(archive_projects(owner, before))
+        if totals(owner) != expect:
+            raise ValueError('totals changed after archiving')
+        if dry_run:
+            transaction.set_rollback(True)
+    return result
+
+
+def restore_accountrecs(owner, year):
+    # 按汇总记录整组恢复。
+    qs = Archive.objects.owned_by(owner).filter(model='accountrec')
+    if year:
+        qs = qs.filter(date__year=year)
+    rollups = set(qs.values_list('rollup', flat=True))
+    archived = Archive.objects.owned_by(owner).filter(model='accountrec', rollup__in=rollups)
+    objs = from_archive(archived)
+    raw_delete(AccountRec, rollups, qs.db)
+    AccountRec.objects.bulk_create(objs, batch_size=CHUNK)
+    archived._raw_delete(qs.db)
+    refresh_search(AccountRec, list(rollups) + [o.pk for o in objs], qs.db)
+    return {'accountrec': len(objs)}
+
+
+def restore_projects(owner, year):
+    # 按项目整个恢复，year是项目结束的年份。持仓批次按记录重建。
+    qs = Archive.objects.owned_by(owner).filter(model='invproj')
+    if year:
+        qs = qs.filter(date__year=year)
+    rollups = set(qs.values_list('rollup', flat=True))
+    result = {}
+    for name, model in PROJECT_MODELS:
+        archived = Archive.objects.owned_by(owner).filter(model=name, rollup__in=rollups)
+        objs = from_archive(archived)
+        model.objects.bulk_create(objs, batch_size=CHUNK)
+        archived._raw_delete(qs.db)
+        result[name] = len(objs)
+    for proj in InvProj.objects.filter(pk__in=rollups):
+        lots.rebuild(proj)
+    refresh_search(InvProj, rollups, qs.db)
+    return result
+
+
+def restore(owner, year=None, dry_run=False):
+    # year只恢复那一年的收支记录和那一年结束的项目。返回{模型名: 恢复的行数}。
+    with ledger.writing(owner.id):
+        expect = totals(owner)
+        result = restore_accountrecs(owner, year)
+        result.update(restore_projects(owner, year))
+        if totals(owner) != expect:
+            raise ValueError('totals changed after restoring')
+        if dry_run:
+            transaction.set_rollback(True)
+    return result
@@ -0,0 +1,149 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+import asyncio
+import datetime
+
+from asgiref.sync import sync_to_async
+
+from django.core.cache import cache
+from django.http import HttpResponseBadRequest
+from django.shortcuts import render
+
+from .models import Currency, InvProj
+from . import portfolio
+from . import views
+from . import tables
+from .db import replica
+from .views import login_required
+
+
+# ORM只能在sync线程里跑，计算密集的部分（pandas, fsolve）放到线程池，不占用请求线程。
+def cpu(func):
+    return sync_to_async(func, thread_sensitive=False)
+
+
+async def arender(request, template, env):
+    return await sync_to_async(render)(request, template, env)
+
+
+@login_required
+@replica
+async def proj_stat(request, projid):
+    proj, recs = await sync_to_async(views.proj_stat_data)(projid, request.user)
+    env = {
+        'proj': proj,
+        'lots': proj.open_lots(),
+        'table': tables.InvRecTable(recs, request=request),
+    }
+    return await arender(request, 'inv/proj_stat.html', env)
+
+
+@login_required
+@replica
+@portfolio.scoped
+async def balance_sheet(request):
+    try:
+        dates = views.balance_dates(request)
+    except ValueError:
+        return HttpResponseBadRequest('bad date')
+    template, env = await sync_to_async(views.balance_sheet_view)(
+        request.user, dates)
+    return await arender(request, template, env)
+
+
+# 收支表和细节表缓存的片段命中时不计算，只有未命中时才在线程里查询和计算。
+@login_required
+@replica
+@portfolio.scoped
+async def income_outgoing_sheet(request):
+    today = datetime.date.today()
+    env = await sync_to_async(views.fragment_env)(
+        request.user, 'inv_ios', [today], views.income_outgoing_report,
+        request.user, today=today)
+    return await arender(request, 'inv/ios.html', env)
+
+
+@login_required
+@replica
+async def income_details(request):
+    env = await sync_to_async(views.details_report)(
+        '收入细节表', views.income_details_data, request.user, request.path)
+    return await arender(request, 'inv/raw.html', env)
+
+
+@login_required
+@replica
+async def outgoing_details(request):
+    env = await sync_to_async(views.details_report)(
+        '支出细节表', views.outgoing_details_data, request.user, request.path)
+    return await arender(request, 'inv/raw.html', env)
+
+
+@login_required
+@replica
+async def nav_report(request):
+    from . import nav
+    try:
+        start, end = views.nav_range(request)
+    except ValueError:
+        return HttpResponseBadRequest('bad date')
+    key = await sync_to_async(nav.cache_key)(start, end, request.user)
+    result = cache.get(key)
+    if result is None:
+        data = await sync_to_async(nav.load)(start, end, request.user)
+        result = await cpu(nav.build)(start, end, data)
+        cache.set(key, result, nav.CACHE_TIMEOUT)
+    env = await cpu(views.nav_env)(start, end, result)
+    return await arender(request, 'inv/nav.html', env)
+
+
+@login_required
+@replica
+async def risk_report(request):
+    from . import risk
+    try:
+        params = views.risk_params(request)
+    except ValueError:
+        return HttpResponseBadRequest('bad parameter')
+    bks, returns = await sync_to_async(risk.load)(request.user)
+    result = await cpu(risk.run)(bks, returns, **params)
+    env = await cpu(views.risk_env)(params, result)
+    return await arender(request, 'inv/risk.html', env)
+
+
+def refresh_targets(owner):
+    projs = list(InvProj.objects.owned_by(owner).select_related('cat').filter(
+        isopen=True, quote_id__isnull=False, cat__driver__isnull=False).exclude(
+            quote_id='').exclude(cat__driver=''))
+    curs = list(Currency.objects.exclude(name='CNY'))
+    return projs, curs
+
+
+def apply_prices(fetched):
+    results = []
+    for proj, price, err in fetched:
+        old = proj.current_price
+        proj.set_current_price(price)
+        results.append((proj, old, proj.current_price, err))
+    return results
+
+
+@login_required
+async def refresh(request):
+    from . import adrivers
+    results = None
+    if request.method == 'POST':
+        projs, curs = await sync_to_async(refresh_targets)(request.user)
+        quotes = [(p, p.cat.driver, p.quote_id) for p in projs]
+        fetched, rates = await asyncio.gather(
+            adrivers.fetch_all(quotes),
+            adrivers.fetch_rates([c.name for c in curs]))
+        results = await sync_to_async(apply_prices)(fetched)
+        results.extend(await sync_to_async(Currency.set_rates)(curs, rates))
+    return await arender(request, 'inv/refresh.html', {'results': results})
@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+import asyncio
+import contextlib
+import contextvars
+import functools
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+REPLICA = 'replica'
+
+reading = contextvars.ContextVar('reading', default=False)
+
+
+@contextlib.contextmanager
+def use_replica():
+    token = reading.set(True)
+    try:
+        yield
+    finally:
+        reading.reset(token)
+
+
+# 报表只读，整个视图都走只读连接。
+def replica(view):
+    if asyncio.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def inner(*args, **kwargs):
+            with use_replica():
+                return await view(*args, **kwargs)
+    else:
+        @functools.wraps(view)
+        def inner(*args, **kwargs):
+            with use_replica():
+                return view(*args, **kwargs)
+    return inner
+
+
+class ReportRouter(object):
+
+    def db_for_read(self, model, **hints):
+        if reading.get() and REPLICA in connections.databases:
+            return REPLICA
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+@receiver(connection_created)
+def set_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    readonly = 'mode=ro' in str(connection.settings_dict['NAME'])
+    pragmas = dict(getattr(settings, 'SQLITE_PRAGMAS', {}))
+    if readonly:
+        # 只读连接不能修改日志模式。
+        pragmas.pop('journal_mode', None)
+        pragmas['query_only'] = 1
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
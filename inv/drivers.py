@@ -7,49 +7,163 @@
 @license: BSD-3-clause
 '''
 from __future__ import unicode_literals
+import re
 import json
+import decimal
 
-from django.conf import settings
-import requests
-import investpy
-from bs4 import BeautifulSoup
 
+# requests, lxml, investpy都很重，只在第一次使用时导入。
 
 no_proxies = {
     "http": "",
     "https": "",
 }
 
+drivers = ['CoinGecko', 'SGE', 'EastmoneyFund', 'SinaFin',
+           'InvestingFund', 'InvestingCurrency']
+
+
+def get_driver(name):
+    if name not in drivers:
+        return
+    return globals()[name]
+
+
+# driver和_id是http_drivers里的驱动名和代号，record模式按它们建样本索引。
+def get(url, driver=None, _id=None):
+    import requests
+    from .transport import get_transport
+    transport = get_transport()
+    resp = requests.get(transport.url_for(url), proxies=no_proxies)
+    resp.raise_for_status()
+    transport.store(url, resp.content, driver, _id)
+    return resp.content
+
+
 def CoinGecko(_id):
     from pycoingecko import CoinGeckoAPI
     cg = CoinGeckoAPI()
     return cg.get_price(ids=_id, vs_currencies='usd')[_id]['usd']
 
 
+def SGE_url(_id):
+    return 'https://www.sge.com.cn/sjzx/yshqbg'
+
+
+# 等价于css选择器div.memberName tr.border_ea，直接选出代号匹配的那一行。
+SGE_xpath = ('//div[contains(concat(" ", normalize-space(@class), " "), " memberName ")]'
+             '//tr[contains(concat(" ", normalize-space(@class), " "), " border_ea ")]'
+             '[string(td[1]) = $id]/td[2]')
+
+
+def SGE_parse(content, _id):
+    import lxml.html
+    doc = lxml.html.fromstring(content)
+    for td in doc.xpath(SGE_xpath, id=_id):
+        return td.text_content()
+
+
 def SGE(_id):
-    resp = requests.get('https://www.sge.com.cn/sjzx/yshqbg', proxies=no_proxies)
-    doc = BeautifulSoup(resp.content, 'lxml')
-    for tr in doc.select('div.memberName tr.border_ea'):
-        data = [td.get_text() for td in tr.select('td')]
-        if data[0] == _id:
-            return data[1]
+    return SGE_parse(get(SGE_url(_id), 'SGE', _id), _id)
+
+
+def EastmoneyFund_url(_id):
+    return f'http://fund.eastmoney.com/{_id}.html'
+
+
+EastmoneyFund_re = re.compile(
+    rb'<span[^>]*\sclass="(?:[^"]*\s)?fix_dwjz(?:\s[^"]*)?"[^>]*>([^<]*)<')
+
+
+def EastmoneyFund_parse(content, _id):
+    # 只要一个数字，不需要建整棵树。正则匹配不到时（例如span里还有子节点）再用lxml。
+    m = EastmoneyFund_re.search(content)
+    if m:
+        return m.group(1).decode('utf-8')
+    import lxml.html
+    doc = lxml.html.fromstring(content)
+    for span in doc.xpath('//span[contains(concat(" ", normalize-space(@class), " "), " fix_dwjz ")]'):
+        return span.text_content()
 
 
 def EastmoneyFund(_id):
-    resp = requests.get(f'http://fund.eastmoney.com/{_id}.html', proxies=no_proxies)
-    doc = BeautifulSoup(resp.content, 'lxml')
-    for span in doc.select('span.fix_dwjz'):
-        return span.get_text()
+    return EastmoneyFund_parse(get(EastmoneyFund_url(_id), 'EastmoneyFund', _id), _id)
 
 
-def SinaFin(_id):
+def SinaFin_url(_id):
+    return f'http://hq.sinajs.cn/list={_id}'
+
+
+def SinaFin_parse(content, _id):
     # 股票名称、今日开盘价、昨日收盘价、当前价格、今日最高价、今日最低价、竞买价、竞卖价
     # 成交股数、成交金额、买1手、买1报价、买2手、买2报价、…、买5报价、…、卖5报价、日期、时间
-    resp = requests.get(f'http://hq.sinajs.cn/list={_id}', proxies=no_proxies)
-    return resp.text.split('"')[1].split(',')[3]
+    start = content.index(b'"') + 1
+    for _ in range(3):
+        start = content.index(b',', start) + 1
+    return content[start:content.index(b',', start)].decode()
+
+
+def SinaFin(_id):
+    return SinaFin_parse(get(SinaFin_url(_id), 'SinaFin', _id), _id)
+
+
+# 一次请求取回以RateTable_base为基准的全部汇率，其他币种之间交叉换算。
+RateTable_base = 'USD'
+
+
+def RateTable_url(base):
+    return f'https://open.er-api.com/v6/latest/{base}'
+
+
+def RateTable_parse(content, base):
+    # 返回{币种: 1单位基准货币可兑换的数量}。
+    data = json.loads(content, parse_float=decimal.Decimal,
+                      parse_int=decimal.Decimal)
+    if data.get('result', 'success') != 'success':
+        raise ValueError(data.get('error-type', 'rate table error'))
+    rates = data['rates']
+    rates[base] = decimal.Decimal(1)
+    return rates
+
+
+def RateTable(base):
+    return RateTable_parse(get(RateTable_url(base)), base)
+
+
+def cross_rates(table, names, quote='CNY'):
+    # X/quote = (quote/base) / (X/base)，表里没有的币种不出现在结果里。
+    if not table.get(quote):
+        return {}
+    return {n: table[quote]/table[n] for n in names if table.get(n)}
+
+
+def currency_rates(names, quote='CNY'):
+    # 返回{币种名: (汇率, 错误)}，汇率表取不到或者缺少的币种逐个用InvestingCurrency。
+    try:
+        table = RateTable(RateTable_base)
+    except Exception:
+        table = {}
+    result = {n: (r, None) for n, r in cross_rates(table, names, quote).items()}
+    for name in names:
+        if name in result:
+            continue
+        try:
+            result[name] = (InvestingCurrency(name), None)
+        except Exception as err:
+            result[name] = (None, err)
+    return result
+
+
+# 纯http的驱动，拆成url和parse两步，异步刷新时可以复用。
+http_drivers = {
+    'SGE': (SGE_url, SGE_parse),
+    'EastmoneyFund': (EastmoneyFund_url, EastmoneyFund_parse),
+    'SinaFin': (SinaFin_url, SinaFin_parse),
+}
 
 
 def InvestingFund(_id):
+    import investpy
     try:
         obj = json.loads(_id)
     except ValueError:
@@ -62,6 +176,7 @@ def InvestingFund(_id):
 
 
 def InvestingCurrency(_id):
+    import investpy
     df = investpy.get_currency_cross_recent_data(
         currency_cross=f'{_id}/CNY')
     if not df.empty:
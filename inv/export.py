@@ -0,0 +1,196 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+from .models import AccountRec, InvRec, InvProj, PriceHist, RateHist
+
+
+# 每个行组的行数，也是从数据库分批读取的大小。
+ROW_GROUP = 65536
+
+FORMATS = {
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+
+
+# 每张表: (查询, [(列名, 字段, 类型)])。
+# 金额按float64导出，分析足够快；需要精确到分的对账还是用数据库。
+# 名称类的列重复很多，用字典编码。
+def tables(owner):
+    return {
+        'accountrec': (
+            AccountRec.objects.owned_by(owner).order_by('date', 'id'), [
+                ('id', 'id', 'int'),
+                ('date', 'date', 'date'),
+                ('acct_id', 'acct_id', 'int'),
+                ('bank', 'acct__bank__name', 'dict'),
+                ('account', 'acct__name', 'dict'),
+                ('currency', 'acct__currency__name', 'dict'),
+                ('category', 'cat__name', 'dict'),
+                ('kind', 'cat__cat', 'small'),
+                ('value', 'value', 'float'),
+                ('comment', 'comment', 'str'),
+            ]),
+        'invrec': (
+            InvRec.objects.owned_by(owner).order_by('date', 'id'), [
+                ('id', 'id', 'int'),
+                ('date', 'date', 'date'),
+                ('proj_id', 'proj_id', 'int'),
+                ('project', 'proj__name', 'dict'),
+                ('currency', 'proj__acct__currency__name', 'dict'),
+                ('kind', 'cat', 'small'),
+                ('amount', 'amount', 'float'),
+                ('price', 'price', 'float'),
+                ('value', 'value', 'float'),
+                ('commission', 'commission', 'float'),
+                ('rate', 'rate', 'float'),
+            ]),
+        'invproj': (
+            InvProj.objects.owned_by(owner).order_by('id'), [
+                ('id', 'id', 'int'),
+                ('name', 'name', 'str'),
+                ('code', 'code', 'str'),
+                ('account', 'acct__name', 'dict'),
+                ('bank', 'acct__bank__name', 'dict'),
+                ('currency', 'acct__currency__name', 'dict'),
+                ('category', 'cat__name', 'dict'),
+                ('risk', 'risk__name', 'dict'),
+                ('isopen', 'isopen', 'bool'),
+                ('start', 'start', 'date'),
+                ('end', 'end', 'date'),
+                ('current_price', 'current_price', 'float'),
+                ('buy_amount', 'buy_amount', 'float'),
+                ('sell_amount', 'sell_amount', 'float'),
+                ('amount', 'amount', 'float'),
+                ('buy_value', 'buy_value', 'float'),
+                ('sell_value', 'sell_value', 'float'),
+                ('value', 'value', 'float'),
+                ('dividends', 'dividends', 'float'),
+                ('irr', 'irr', 'float'),
+                ('local_irr', 'local_irr', 'float'),
+            ]),
+        'pricehist': (
+            PriceHist.objects.filter(proj__owner_id=owner.id).order_by(
+                'proj', 'date'), [
+                ('proj_id', 'proj_id', 'int'),
+                ('project', 'proj__name', 'dict'),
+                ('date', 'date', 'date'),
+                ('price', 'price', 'float'),
+            ]),
+        'ratehist': (
+            RateHist.objects.order_by('currency', 'date'), [
+                ('currency', 'currency__name', 'dict'),
+                ('date', 'date', 'date'),
+                ('rate', 'rate', 'float'),
+            ]),
+    }
+
+
+def arrow_type(pa, kind):
+    return {
+        'int': pa.int64(),
+        'small': pa.int8(),
+        'bool': pa.bool_(),
+        'date': pa.date32(),
+        'float': pa.float64(),
+        'str': pa.string(),
+        'dict': pa.dictionary(pa.int32(), pa.string()),
+    }[kind]
+
+
+def schema(pa, columns):
+    return pa.schema([(name, arrow_type(pa, kind)) for name, field, kind in columns])
+
+
+def column(pa, kind, values):
+    if kind == 'float':
+        return pa.array([None if v is None else float(v) for v in values],
+                        type=pa.float64())
+    if kind == 'dict':
+        return pa.array(values, type=pa.string()).dictionary_encode()
+    return pa.array(values, type=arrow_type(pa, kind))
+
+
+def batches(pa, qs, columns, size):
+    fields = [field for name, field, kind in columns]
+    sch = schema(pa, columns)
+
+    def batch(rows):
+        return pa.RecordBatch.from_arrays(
+            [column(pa, c[2], v) for c, v in zip(columns, zip(*rows))], schema=sch)
+
+    rows = []
+    for row in qs.values_list(*fields).iterator(chunk_size=size):
+        rows.append(row)
+        if len(rows) >= size:
+            yield batch(rows)
+            rows = []
+    if rows:
+        yield batch(rows)
+
+
+def dump(sink, owner, name, fmt='parquet', row_group=ROW_GROUP, using=None):
+    # 生成器，每写完一个行组产出一次行数，调用方可以在中间把sink里的数据发出去。
+    import pyarrow as pa
+    qs, columns = tables(owner)[name]
+    if using:
+        qs = qs.using(using)
+    sch = schema(pa, columns)
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(sink, sch)
+
+        def write(batch):
+            writer.write_table(pa.Table.from_batches([batch]),
+                               row_group_size=row_group)
+    else:
+        writer = pa.ipc.new_stream(sink, sch)
+        write = writer.write_batch
+    with writer:
+        for batch in batches(pa, qs, columns, row_group):
+            write(batch)
+            yield batch.num_rows
+
+
+class Chunks(object):
+    # 只追加的输出，pyarrow写入，HTTP响应按块取走。
+
+    def __init__(self):
+        self.chunks = []
+        self.pos = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream(owner, name, fmt, row_group=ROW_GROUP, using=None):
+    sink = Chunks()
+    for _ in dump(sink, owner, name, fmt, row_group, using):
+        data = sink.take()
+        if data:
+            yield data
+    data = sink.take()
+    if data:
+        yield data
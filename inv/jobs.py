@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+import datetime
+import traceback
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Currency, InvProj, Job
+
+
+# 任务名 -> 函数(job, **args)。函数在worker的子进程里运行，用job.total和step()报告进度。
+tasks = {}
+
+
+def task(name):
+    def register(func):
+        tasks[name] = func
+        return func
+    return register
+
+
+def enqueue(owner, name, **args):
+    if name not in tasks:
+        raise KeyError(name)
+    return Job.objects.create(owner=owner, task=name, args=args)
+
+
+def claim():
+    # 先到先得。条件更新保证多个worker不会拿到同一个任务，
+    # 被别的worker抢走了就接着往后找，直到队列里真的没有等待的任务。
+    last = 0
+    while True:
+        ids = list(Job.objects.filter(status=Job.WAITING, id__gt=last).order_by(
+            'id').values_list('id', flat=True)[:8])
+        if not ids:
+            return
+        for job_id in ids:
+            now = timezone.now()
+            if Job.objects.filter(id=job_id, status=Job.WAITING).update(
+                    status=Job.RUNNING, started=now, heartbeat=now):
+                return job_id
+        last = ids[-1]
+
+
+def beat(job_ids):
+    Job.objects.filter(id__in=list(job_ids), status=Job.RUNNING).update(
+        heartbeat=timezone.now())
+
+
+def reap(stale):
+    # 心跳超过stale秒没有更新的运行中任务标记为失败，返回标记的个数。
+    # 加心跳之前开始的任务没有心跳，按开始时间算。
+    now = timezone.now()
+    before = now - datetime.timedelta(seconds=stale)
+    return Job.objects.filter(status=Job.RUNNING).filter(
+        Q(heartbeat__lt=before) | Q(heartbeat__isnull=True, started__lt=before)).update(
+            status=Job.FAILED, finished=now, error='worker stopped')
+
+
+def set_total(job, total):
+    job.total = total
+    Job.objects.filter(id=job.id).update(total=total)
+
+
+def step(job, n=1):
+    Job.objects.filter(id=job.id).update(progress=F('progress')+n)
+
+
+def finish(job_id, error=''):
+    Job.objects.filter(id=job_id).update(
+        status=Job.FAILED if error else Job.DONE,
+        finished=timezone.now(), error=error)
+
+
+def run(job_id):
+    job = Job.objects.get(id=job_id)
+    try:
+        tasks[job.task](job, **job.args)
+    except Exception:
+        finish(job_id, traceback.format_exc())
+        return False
+    finish(job_id)
+    return True
+
+
+def owned_projs(job, ids):
+    return InvProj.objects.filter(owner_id=job.owner_id, id__in=ids).order_by('id')
+
+
+@task('update_current_price')
+def update_current_price(job, ids):
+    projs = list(owned_projs(job, ids).select_related('cat'))
+    set_total(job, len(projs))
+    errors = []
+    for p in projs:
+        try:
+            p.update_current_price()
+        except Exception as err:
+            errors.append(f'{p}: {err}')
+        step(job)
+    if errors:
+        raise RuntimeError('\n'.join(errors))
+
+
+@task('update_from_rec')
+def update_from_rec(job, ids):
+    projs = list(owned_projs(job, ids))
+    set_total(job, len(projs))
+    for p in projs:
+        p.recompute()
+        step(job)
+
+
+@task('update_rates')
+def update_rates(job, ids):
+    curs = list(Currency.objects.filter(id__in=ids).exclude(name='CNY'))
+    set_total(job, len(curs))
+    results = Currency.update_rates(curs)
+    step(job, len(results))
+    errors = [f'{cur}: {err}' for cur, old, new, err in results if err]
+    if errors:
+        raise RuntimeError('\n'.join(errors))
@@ -0,0 +1,269 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+import bisect
+import decimal
+import datetime
+import contextlib
+
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Sum, When
+
+from .models import Currency, Account, AccountRec, InvProj, InvRec, RateHist, AcctSnapshot, ProjSnapshot, Version
+
+
+# 账户余额由AccountRec和InvRec的过账得到。
+# Account.value是当前余额，AcctSnapshot是某一天结束时的余额。
+# 任意一天的余额 = 之前最近的快照 + 快照之后到那天的过账之和。
+
+# 写记录的事务第一句就改版本号，sqlite立即拿到写锁，之后的读取都看到最新的数据。
+# 并发的写入者在busy timeout内排队；先读后写的事务升级写锁时如果别人刚提交过，
+# sqlite会直接报database is locked，不会等待。
+@contextlib.contextmanager
+def writing(owner_id):
+    with transaction.atomic():
+        Version.bump(f'owner:{owner_id}')
+        yield
+
+
+def post(acct_id, date, delta):
+    if not acct_id or not delta:
+        return
+    Account.objects.filter(pk=acct_id).update(value=F('value')+delta)
+    # 补录的历史记录同样要修正之后的快照。
+    AcctSnapshot.objects.filter(acct_id=acct_id, date__gte=date).update(
+        value=F('value')+delta)
+
+
+def post_proj(proj_id, date, delta):
+    if not delta:
+        return
+    ProjSnapshot.objects.filter(proj_id=proj_id, date__gte=date).update(
+        value=F('value')+delta)
+
+
+def repost(old, new, post=post):
+    if old is not None:
+        key, date, delta = old
+        post(key, date, -delta)
+    if new is not None:
+        post(*new)
+
+
+ACCOUNTREC_DELTA = Case(When(cat__cat=1, then=F('value')), default=-F('value'))
+INVREC_DELTA = Case(When(cat=1, then=-F('value')), default=F('value'))
+PROJ_DELTA = Case(When(cat=1, then=F('value')), default=-F('value'))
+
+CENT = decimal.Decimal('0.01')
+
+
+def cents(s):
+    # sqlite的SUM是浮点运算，结果带着尾数，按分取整。
+    return (s or decimal.Decimal()).quantize(CENT)
+
+
+def accountrec_sum(acct_id, start, end):
+    qs = AccountRec.objects.filter(acct_id=acct_id, date__lte=end)
+    if start:
+        qs = qs.filter(date__gt=start)
+    return cents(qs.aggregate(s=Sum(ACCOUNTREC_DELTA))['s'])
+
+
+def invrec_sum(acct_id, start, end):
+    qs = InvRec.objects.filter(proj__acct_id=acct_id, date__lte=end)
+    if start:
+        qs = qs.filter(date__gt=start)
+    return cents(qs.aggregate(s=Sum(INVREC_DELTA))['s'])
+
+
+def proj_value_at(proj_id, date):
+    snap = ProjSnapshot.objects.filter(
+        proj_id=proj_id, date__lte=date).order_by('-date').first()
+    qs = InvRec.objects.filter(proj_id=proj_id, date__lte=date)
+    if snap:
+        qs = qs.filter(date__gt=snap.date)
+    value = snap.value if snap else decimal.Decimal()
+    return value + cents(qs.aggregate(s=Sum(PROJ_DELTA))['s'])
+
+
+def balance_at(acct_id, date):
+    snap = AcctSnapshot.objects.filter(
+        acct_id=acct_id, date__lte=date).order_by('-date').first()
+    start = snap.date if snap else None
+    value = snap.value if snap else decimal.Decimal()
+    return value + accountrec_sum(acct_id, start, date) +\
+        invrec_sum(acct_id, start, date)
+
+
+def snapshot(acct_id, date):
+    value = balance_at(acct_id, date)
+    AcctSnapshot.objects.update_or_create(
+        acct_id=acct_id, date=date, defaults={'value': value})
+    return value
+
+
+def month_ends(start, end):
+    # start之后（不含）到end为止（含）的所有月末。
+    d = start.replace(day=1)
+    while True:
+        d = (d + datetime.timedelta(days=32)).replace(day=1)
+        month_end = d - datetime.timedelta(days=1)
+        if month_end > end:
+            return
+        if month_end > start:
+            yield month_end
+
+
+def take_snapshots(accts, until):
+    count = 0
+    for acct in accts:
+        last = AcctSnapshot.objects.filter(acct=acct).order_by('-date').first()
+        if last is None:
+            last = opening_snapshot(acct)
+        for date in month_ends(last.date, until):
+            snapshot(acct.id, date)
+            count += 1
+    return count
+
+
+def take_proj_snapshots(projs, until):
+    count = 0
+    for proj in projs:
+        if not proj.start:
+            continue
+        last = ProjSnapshot.objects.filter(proj=proj).order_by('-date').first()
+        if last is None:
+            last = ProjSnapshot.objects.create(
+                proj=proj, value=0,
+                date=proj.start-datetime.timedelta(days=1))
+        end = until if proj.isopen or not proj.end else min(until, proj.end)
+        for date in month_ends(last.date, end):
+            ProjSnapshot.objects.update_or_create(
+                proj=proj, date=date,
+                defaults={'value': proj_value_at(proj.id, date)})
+            count += 1
+    return count
+
+
+def opening_snapshot(acct):
+    # 以当前余额为准，倒推出第一笔过账之前的余额。
+    first = [d for d in (
+        AccountRec.objects.filter(acct=acct).order_by('date').values_list('date', flat=True).first(),
+        InvRec.objects.filter(proj__acct=acct).order_by('date').values_list('date', flat=True).first(),
+    ) if d]
+    date = min(first) if first else datetime.date.today()
+    date -= datetime.timedelta(days=1)
+    today = datetime.date.max
+    value = acct.value - accountrec_sum(acct.id, None, today) -\
+        invrec_sum(acct.id, None, today)
+    snap, _ = AcctSnapshot.objects.update_or_create(
+        acct=acct, date=date, defaults={'value': value})
+    return snap
+
+
+def load_snapshots(model, key, ids, until):
+    result = {}
+    qs = model.objects.filter(**{key+'__in': ids, 'date__lte': until})
+    for k, date, value in qs.order_by('date').values_list(key, 'date', 'value'):
+        dates, values = result.setdefault(k, ([], []))
+        dates.append(date)
+        values.append(value)
+    return result
+
+
+def latest(snaps, k, date):
+    dates, values = snaps.get(k, ((), ()))
+    i = bisect.bisect_right(dates, date)
+    if i == 0:
+        return None, decimal.Decimal()
+    return dates[i-1], values[i-1]
+
+
+def range_sums(qs, key, delta, intervals):
+    # intervals: {(start, end): [key, ...]}，同一个区间的对象用一个GROUP BY查询。
+    result = {}
+    for (start, end), ids in intervals.items():
+        if start == end:
+            continue
+        q = qs.filter(**{key+'__in': ids, 'date__lte': end})
+        if start:
+            q = q.filter(date__gt=start)
+        for k, s in q.values_list(key).annotate(s=Sum(delta)).values_list(key, 's'):
+            result[(k, end)] = result.get((k, end), decimal.Decimal()) + cents(s)
+    return result
+
+
+def values_at(dates, owner):
+    # 返回{date: (values, rates)}，values为{类别id: {币种名: 金额}}，
+    # rates为{币种名: 汇率}。查询次数和日期数有关，和账本长度无关。
+    until = max(dates)
+    accts = list(Account.objects.owned_by(owner).select_related('currency'))
+    projs = list(InvProj.objects.owned_by(owner).select_related(
+        'acct__currency').filter(start__lte=until).filter(
+            Q(isopen=True) | Q(end__isnull=True) | Q(end__gt=min(dates))))
+
+    acct_snaps = load_snapshots(AcctSnapshot, 'acct_id', [a.id for a in accts], until)
+    proj_snaps = load_snapshots(ProjSnapshot, 'proj_id', [p.id for p in projs], until)
+
+    acct_intervals, proj_intervals = {}, {}
+    for d in dates:
+        for a in accts:
+            start, _ = latest(acct_snaps, a.id, d)
+            acct_intervals.setdefault((start, d), []).append(a.id)
+        for p in projs:
+            start, _ = latest(proj_snaps, p.id, d)
+            proj_intervals.setdefault((start, d), []).append(p.id)
+
+    acct_sums = range_sums(AccountRec.objects, 'acct_id', ACCOUNTREC_DELTA,
+                           acct_intervals)
+    for k, v in range_sums(InvRec.objects, 'proj__acct_id', INVREC_DELTA,
+                           acct_intervals).items():
+        acct_sums[k] = acct_sums.get(k, decimal.Decimal()) + v
+    proj_sums = range_sums(InvRec.objects, 'proj_id', PROJ_DELTA, proj_intervals)
+
+    # 已归档的项目没有记录了，只能按之前最近的月末快照计。
+    from . import archive
+    archived, archived_snaps = archive.project_snapshots(owner, min(dates), until)
+    acct_currency = {a.id: a.currency.name for a in accts}
+
+    result = {}
+    for d in dates:
+        values = {}
+        for a in accts:
+            value = latest(acct_snaps, a.id, d)[1] +\
+                acct_sums.get((a.id, d), decimal.Decimal())
+            cat = values.setdefault(a.cat_id, {})
+            cat[a.currency.name] = value + cat.get(a.currency.name, 0)
+        for p in projs:
+            if p.start > d or (not p.isopen and p.end and p.end <= d):
+                continue
+            value = latest(proj_snaps, p.id, d)[1] +\
+                proj_sums.get((p.id, d), decimal.Decimal())
+            name = p.acct.currency.name
+            cat = values.setdefault(p.cat_id, {})
+            cat[name] = value + cat.get(name, 0)
+        for p in archived:
+            if p.start > d or p.end <= d:
+                continue
+            name = acct_currency[p.acct_id]
+            cat = values.setdefault(p.cat_id, {})
+            cat[name] = latest(archived_snaps, p.id, d)[1] + cat.get(name, 0)
+        result[d] = (values, rates_at(d))
+    return result
+
+
+def rates_at(date):
+    # 汇率历史是过去某天记下的，今天和以后用当前汇率，和实时的资产负债表一致。
+    if date >= datetime.date.today():
+        return {c.name: c.rate for c in Currency.objects.all()}
+    hist = RateHist.objects.filter(
+        currency=OuterRef('pk'), date__lte=date).order_by('-date')
+    rates = {}
+    for c in Currency.objects.annotate(hist=Subquery(hist.values('rate')[:1])):
+        rates[c.name] = c.hist if c.hist is not None else c.rate
+    return rates
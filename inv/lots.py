@@ -0,0 +1,173 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+import sys
+import array
+import decimal
+import datetime
+
+
+FIFO = 1
+AVERAGE = 2
+
+# 数量精确到万分之一，金额精确到分，全部用整数运算，不会有累积误差。
+AMOUNT_UNIT = 10000
+MONEY_UNIT = 100
+
+
+def to_units(d, unit):
+    # 没有保存过的记录上可能是直接赋值的int、float，先按字面值转成Decimal。
+    if not isinstance(d, decimal.Decimal):
+        d = decimal.Decimal(str(d))
+    return int((d * unit).to_integral_value(decimal.ROUND_HALF_EVEN))
+
+
+def from_units(n, unit, places):
+    return (decimal.Decimal(n) / unit).quantize(places)
+
+
+def round_div(a, b):
+    q, r = divmod(a, b)
+    return q + (2*r >= b)
+
+
+class Book(object):
+    # 每个批次是(日期序数, 数量, 成本)，三个int64数组并列存放。
+    # head之前的批次已经被卖完，保存时丢弃。
+    __slots__ = ('method', 'dates', 'amounts', 'costs', 'head', 'realized')
+
+    def __init__(self, method, data=b'', realized=0):
+        self.method = method
+        arr = array.array('q')
+        arr.frombytes(data)
+        if sys.byteorder == 'big':
+            arr.byteswap()
+        n = len(arr) // 3
+        self.dates = arr[:n]
+        self.amounts = arr[n:2*n]
+        self.costs = arr[2*n:]
+        self.head = 0
+        self.realized = realized
+
+    def tobytes(self):
+        arr = self.dates[self.head:] + self.amounts[self.head:] +\
+            self.costs[self.head:]
+        if sys.byteorder == 'big':
+            arr.byteswap()
+        return arr.tobytes()
+
+    def compact(self):
+        h = self.head
+        self.dates = self.dates[h:]
+        self.amounts = self.amounts[h:]
+        self.costs = self.costs[h:]
+        self.head = 0
+
+    def buy(self, date, amount, cost):
+        if self.method == AVERAGE and self.head < len(self.amounts):
+            self.amounts[-1] += amount
+            self.costs[-1] += cost
+            return
+        self.dates.append(date)
+        self.amounts.append(amount)
+        self.costs.append(cost)
+
+    def sell(self, amount, proceeds):
+        # 超出持仓的部分按零成本处理。
+        out = 0
+        while amount > 0 and self.head < len(self.amounts):
+            a, c = self.amounts[self.head], self.costs[self.head]
+            if a <= amount:
+                out += c
+                amount -= a
+                self.head += 1
+            else:
+                part = round_div(c*amount, a)
+                self.amounts[self.head] = a - amount
+                self.costs[self.head] = c - part
+                out += part
+                amount = 0
+        self.realized += proceeds - out
+        if self.head > 64 and 2*self.head > len(self.amounts):
+            self.compact()
+
+    def apply(self, date, cat, amount, value):
+        if cat == 1:
+            self.buy(date.toordinal(), to_units(amount, AMOUNT_UNIT),
+                     to_units(value, MONEY_UNIT))
+        elif cat == 2:
+            self.sell(to_units(amount, AMOUNT_UNIT), to_units(value, MONEY_UNIT))
+
+    def amount(self):
+        return sum(self.amounts[self.head:])
+
+    def cost(self):
+        return sum(self.costs[self.head:])
+
+    def lots(self):
+        places4, places2 = decimal.Decimal('1.0000'), decimal.Decimal('1.00')
+        for i in range(self.head, len(self.amounts)):
+            yield (datetime.date.fromordinal(self.dates[i]),
+                   from_units(self.amounts[i], AMOUNT_UNIT, places4),
+                   from_units(self.costs[i], MONEY_UNIT, places2))
+
+
+def replay(method, rows):
+    # rows: 按(日期, id)排好序的(日期, 类别, 数量, 总价)。
+    book = Book(method)
+    for row in rows:
+        book.apply(*row)
+    book.compact()
+    return book
+
+
+def fields(book):
+    return {
+        'method': book.method,
+        'amount': from_units(book.amount(), AMOUNT_UNIT, decimal.Decimal('1.0000')),
+        'cost': from_units(book.cost(), MONEY_UNIT, decimal.Decimal('1.00')),
+        'realized': from_units(book.realized, MONEY_UNIT, decimal.Decimal('1.00')),
+        'data': book.tobytes(),
+    }
+
+
+def rebuild(proj):
+    from .models import LotBook
+    recs = list(proj.invrec_set.order_by('date', 'id').values_list(
+        'id', 'date', 'cat', 'amount', 'value'))
+    book = replay(proj.cost_method, (r[1:] for r in recs))
+    last = recs[-1] if recs else (None, None)
+    values = fields(book)
+    values.update({'date': last[1], 'rec_id': last[0]})
+    # 不用update_or_create：它在事务里先读后写，sqlite的WAL模式下读事务升级成写事务时，
+    # 如果别的进程刚提交过会直接返回database is locked，不会等待。
+    lb = LotBook(proj=proj, **values)
+    if not LotBook.objects.filter(proj=proj).update(**values):
+        lb.save(force_insert=True)
+    return lb
+
+
+def book_of(lb):
+    return Book(lb.method, bytes(lb.data), to_units(lb.realized, MONEY_UNIT))
+
+
+def post(proj, rec):
+    # 追加在最后的新记录只处理这一条，插到中间的记录重放整个项目。
+    from .models import LotBook
+    lb = LotBook.objects.filter(proj_id=proj.id).first()
+    if lb is None or lb.method != proj.cost_method or (
+            lb.date is not None and (rec.date, rec.id) <= (lb.date, lb.rec_id)):
+        return rebuild(proj)
+    book = book_of(lb)
+    book.apply(rec.date, rec.cat, rec.amount, rec.value)
+    book.compact()
+    for k, v in fields(book).items():
+        setattr(lb, k, v)
+    lb.date, lb.rec_id = rec.date, rec.id
+    lb.save()
+    return lb
@@ -0,0 +1,48 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from inv import archive
+
+
+class Command(BaseCommand):
+    help = '把旧的收支记录换成按月汇总的记录，已经结束的投资项目整个移到归档表；--restore恢复'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--before', type=int,
+                            help='归档这一年之前的记录和结束的项目，默认去年之前，最近一年的收支表不受影响')
+        parser.add_argument('--restore', action='store_true',
+                            help='从归档表恢复原始记录和项目，删除汇总记录')
+        parser.add_argument('--year', type=int, help='只恢复这一年的记录和这一年结束的项目')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='只统计，不提交')
+
+    def handle(self, *args, **options):
+        try:
+            owner = get_user_model().objects.get(username=options['username'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'no such user: {options["username"]}')
+        try:
+            if options['restore']:
+                result = archive.restore(owner, options['year'], options['dry_run'])
+                verb = 'restored'
+            else:
+                year = options['before'] or datetime.date.today().year-1
+                result = archive.archive(owner, year, options['dry_run'])
+                verb = 'archived'
+        except ValueError as err:
+            raise CommandError(str(err))
+        for name, count in result.items():
+            self.stdout.write(f'{name}: {count} rows {verb}')
+        if options['dry_run']:
+            self.stdout.write('dry run, nothing committed')
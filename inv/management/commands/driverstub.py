@@ -0,0 +1,43 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from inv.transport import StubServer
+
+
+class Command(BaseCommand):
+    help = '启动报价驱动的回放服务，可以模拟上游的延迟、抖动和错误'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=settings.INV_DRIVER_CASSETTE,
+                            help='record模式保存的响应目录')
+        parser.add_argument('--addr', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0,
+                            help='每个响应的延迟，秒')
+        parser.add_argument('--jitter', type=float, default=0,
+                            help='延迟的随机抖动范围，秒')
+        parser.add_argument('--error-rate', type=float, default=0,
+                            help='返回503的概率')
+
+    def handle(self, *args, **options):
+        server = StubServer(
+            (options['addr'], options['port']), options['path'],
+            latency=options['latency'], jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            verbose=options['verbosity'] > 1)
+        self.stdout.write(f'serving {options["path"]} on '
+                          f'http://{options["addr"]}:{options["port"]}/')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
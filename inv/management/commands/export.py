@@ -0,0 +1,52 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+import os
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from inv import export
+
+
+class Command(BaseCommand):
+    help = '把账本、项目统计和价格/汇率历史导出成Parquet或Arrow文件，供离线分析'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='数据所属的用户')
+        parser.add_argument('outdir', help='输出目录')
+        parser.add_argument('--format', choices=list(export.FORMATS),
+                            default='parquet')
+        parser.add_argument('--tables', nargs='+',
+                            help='只导出这些表，默认全部')
+        parser.add_argument('--row-group', type=int, default=export.ROW_GROUP,
+                            help='每个行组的行数')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            owner = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'no such user: {options["username"]}')
+        try:
+            import pyarrow
+        except ImportError:
+            raise CommandError('pyarrow is required')
+        names = list(export.tables(owner))
+        for name in options['tables'] or []:
+            if name not in names:
+                raise CommandError(f'no such table: {name}, choose from {names}')
+        fmt = options['format']
+        os.makedirs(options['outdir'], exist_ok=True)
+        for name in options['tables'] or names:
+            path = os.path.join(options['outdir'], f'{name}.{fmt}')
+            start = time.perf_counter()
+            rows = sum(export.dump(path, owner, name, fmt, options['row_group']))
+            self.stdout.write(f'{path}: {rows} rows, {os.path.getsize(path)} bytes, '
+                              f'{time.perf_counter()-start:0.2f}s')
@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+import os
+import sys
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+HEAVY = ['pandas', 'numpy', 'scipy', 'investpy', 'bs4', 'lxml', 'requests',
+         'pycoingecko']
+
+SCRIPT = '''
+import django
+django.setup()
+from invmgr.wsgi import application
+import invmgr.urls
+import inv.admin
+'''
+
+
+def parse(stderr):
+    # import time: self [us] | cumulative | imported package
+    result = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        self_us, cumulative, name = int(parts[0]), int(parts[1]), parts[2]
+        level = (len(name) - len(name.lstrip())) // 2
+        result.append((name.strip(), level, self_us, cumulative))
+    return result
+
+
+class Command(BaseCommand):
+    help = '用 python -X importtime 测量worker的启动导入开销'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=15,
+                            help='显示最慢的N个模块')
+        parser.add_argument('--max-ms', type=float,
+                            help='总导入时间超过该值时返回失败')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='重复次数，取最小值')
+
+    def run_once(self):
+        env = dict(os.environ)
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'invmgr.settings')
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', SCRIPT],
+            env=env, capture_output=True, text=True)
+        if proc.returncode:
+            raise CommandError(proc.stderr)
+        return parse(proc.stderr)
+
+    def handle(self, *args, **options):
+        runs = [self.run_once() for _ in range(options['repeat'])]
+        totals = [sum(c for _, level, _, c in r if level == 0) for r in runs]
+        best = runs[totals.index(min(totals))]
+        total_ms = min(totals) / 1000
+
+        self.stdout.write(f'modules: {len(best)}, total: {total_ms:0.1f} ms')
+        for name, level, self_us, cumulative in sorted(
+                best, key=lambda r: -r[3])[:options['top']]:
+            self.stdout.write(f'{cumulative/1000:10.1f} ms  {name}')
+
+        loaded = {name.split('.')[0] for name, _, _, _ in best}
+        heavy = [m for m in HEAVY if m in loaded]
+        if heavy:
+            self.stdout.write(self.style.WARNING(
+                'heavy modules loaded at startup: ' + ', '.join(heavy)))
+
+        if options['max_ms'] is not None and total_ms > options['max_ms']:
+            raise CommandError(
+                f'import time {total_ms:0.1f} ms > {options["max_ms"]} ms')
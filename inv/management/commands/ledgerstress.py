@@ -0,0 +1,180 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+import os
+import time
+import random
+import decimal
+import datetime
+import warnings
+import tempfile
+import multiprocessing
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Sum
+
+from .sqlitebench import use_database
+
+
+USERNAME = 'stress'
+
+
+def seed(options):
+    from django.contrib.auth import get_user_model
+    from inv import ledger
+    from inv.models import (Currency, Category, Bank, Account, AccountCategory,
+                            Risk, InvProj)
+    owner = get_user_model().objects.create_user(USERNAME)
+    cny = Currency.objects.create(name='CNY', rate=1)
+    cash = Category.objects.create(name='现金', cat=1, owner=owner)
+    invest = Category.objects.create(name='投资', cat=5, owner=owner)
+    bank = Bank.objects.create(name='银行', owner=owner)
+    accts = [Account.objects.create(name=f'账户{i}', bank=bank, currency=cny, cat=cash)
+             for i in range(options['accounts'])]
+    for i in range(2):
+        AccountCategory.objects.create(name=f'收支{i}', cat=1+i, owner=owner)
+    risk = Risk.objects.create(name='风险', owner=owner)
+    for i in range(options['projects']):
+        InvProj.objects.create(name=f'项目{i}', acct=accts[i % len(accts)],
+                               cat=invest, risk=risk, isopen=True,
+                               current_price=decimal.Decimal('1.5'))
+    # 月末快照，补录的历史记录要修正它们。
+    ledger.take_snapshots(accts, datetime.date.today())
+
+
+def writer(args):
+    # 每个进程随机新增、修改和删除收支记录与投资记录。
+    # 最后四分之一只追加当天的投资记录，走增量的持仓批次过账，
+    # 这时丢失的更新不会被之后修改和删除引起的重建掩盖。
+    index, options = args
+    from django.db.utils import OperationalError
+    from inv.models import Account, AccountCategory, AccountRec, InvProj, InvRec
+    D = decimal.Decimal
+    rnd = random.Random(options['seed'] + index)
+    today = datetime.date.today()
+    accts = list(Account.objects.all())
+    acats = list(AccountCategory.objects.all())
+    projs = list(InvProj.objects.all())
+    mine, failed = [], 0
+    start = time.perf_counter()
+    try:
+        for i in range(options['records']):
+            date = today - datetime.timedelta(days=rnd.randrange(365))
+            op = rnd.random()
+            if i >= options['records']*3//4:
+                date, op = today, 0.5
+            try:
+                if op < 0.45:
+                    mine.append(AccountRec.objects.create(
+                        acct=rnd.choice(accts), cat=rnd.choice(acats), date=date,
+                        value=D(rnd.randrange(1, 100000))/100, comment=f'{index}-{i}'))
+                elif op < 0.8:
+                    amount = D(rnd.randrange(1, 100))
+                    price = D(rnd.randrange(50, 300))/100
+                    mine.append(InvRec.objects.create(
+                        proj=rnd.choice(projs), date=date, cat=rnd.choice([1, 1, 2, 3]),
+                        amount=amount, price=price, value=amount*price, commission=0))
+                elif op < 0.9 and mine:
+                    rec = rnd.choice(mine)
+                    rec.value = D(rnd.randrange(1, 100000))/100
+                    rec.date = date
+                    if isinstance(rec, AccountRec):
+                        rec.acct = rnd.choice(accts)
+                    else:
+                        rec.proj = rnd.choice(projs)
+                    rec.save()
+                elif mine:
+                    mine.pop(rnd.randrange(len(mine))).delete()
+            except OperationalError:
+                failed += 1
+    finally:
+        connections.close_all()
+    return options['records'], failed, time.perf_counter() - start
+
+
+def verify():
+    from inv import ledger, lots
+    from inv.models import Account, AcctSnapshot, InvProj, InvRec
+
+    # sqlite里的SUM是浮点运算，比较前按分取整。
+    def balance(acct_id, date):
+        return (ledger.accountrec_sum(acct_id, None, date) +
+                ledger.invrec_sum(acct_id, None, date)).quantize(decimal.Decimal('0.01'))
+
+    errors = []
+    for acct in Account.objects.all():
+        expect = balance(acct.id, datetime.date.max)
+        if acct.value != expect:
+            errors.append(f'{acct}: balance {acct.value} != {expect}')
+        for snap in AcctSnapshot.objects.filter(acct=acct):
+            expect = balance(acct.id, snap.date)
+            if snap.value != expect:
+                errors.append(f'{acct}: snapshot {snap.date} {snap.value} != {expect}')
+    for proj in InvProj.objects.all():
+        sums = {cat: InvRec.objects.filter(proj=proj, cat=cat).aggregate(
+            a=Sum('amount'), v=Sum('value')) for cat in (1, 2, 3)}
+        zero = decimal.Decimal()
+        amount = (sums[1]['a'] or zero) - (sums[2]['a'] or zero)
+        value = (sums[1]['v'] or zero) - (sums[2]['v'] or zero) - (sums[3]['v'] or zero)
+        if (proj.amount or zero) != amount or (proj.value or zero) != value:
+            errors.append(f'{proj}: stats {proj.amount}/{proj.value} != {amount}/{value}')
+        lb = proj.lot_book()
+        full = lots.replay(proj.cost_method, InvRec.objects.filter(proj=proj).order_by(
+            'date', 'id').values_list('date', 'cat', 'amount', 'value'))
+        if lb is None or bytes(lb.data) != full.tobytes():
+            errors.append(f'{proj}: lots differ from a full replay')
+    return errors
+
+
+class Command(BaseCommand):
+    help = '多个进程并发写入收支和投资记录，检查余额、快照、项目统计和持仓批次是否正确'
+
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--records', type=int, default=200,
+                            help='每个进程的操作数')
+        parser.add_argument('--accounts', type=int, default=3)
+        parser.add_argument('--projects', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('only sqlite is supported')
+        source = connections['default'].settings_dict['NAME']
+        # 随机数据上fsolve经常不收敛，警告会淹没结果。
+        warnings.simplefilter('ignore', RuntimeWarning)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            use_database(os.path.join(tmpdir, 'stress.sqlite3'))
+            try:
+                call_command('migrate', verbosity=0)
+                seed(options)
+                # fork之前关掉连接，每个进程用自己的。
+                connections.close_all()
+                start = time.perf_counter()
+                ctx = multiprocessing.get_context('fork')
+                with ctx.Pool(options['processes']) as pool:
+                    results = pool.map(writer, [(i, options)
+                                                for i in range(options['processes'])])
+                elapsed = time.perf_counter() - start
+                ops = sum(r[0] for r in results)
+                failed = sum(r[1] for r in results)
+                self.stdout.write(
+                    f'{options["processes"]} processes, {ops} operations in '
+                    f'{elapsed:0.2f}s, {ops/elapsed:0.1f} ops/s, {failed} failed')
+                errors = verify()
+            finally:
+                use_database(source)
+        for e in errors[:20]:
+            self.stdout.write(e)
+        if errors or failed:
+            raise CommandError(f'{len(errors)} inconsistencies, {failed} failed writes')
+        self.stdout.write('balances, snapshots, project stats and lots are consistent')
@@ -0,0 +1,297 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+import os
+import sys
+import time
+import random
+import asyncio
+import decimal
+import datetime
+import warnings
+import tempfile
+import importlib
+import threading
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.urls import clear_url_caches
+
+from .sqlitebench import percentile, use_database
+
+
+# (名称, 权重, 路径)，路径里的{proj}替换成随机的项目id。
+ENDPOINTS = [
+    ('bal', 4, '/inv/bal'),
+    ('ios', 2, '/inv/ios'),
+    ('ind', 1, '/inv/ind'),
+    ('ogd', 1, '/inv/ogd'),
+    ('st', 4, '/inv/st/{proj}'),
+    ('admin:accountrec', 2, '/admin/inv/accountrec/'),
+    ('admin:invproj', 2, '/admin/inv/invproj/'),
+    ('admin:invrec', 1, '/admin/inv/invrec/'),
+    ('admin:account', 1, '/admin/inv/account/'),
+]
+
+USERNAME = 'loadtest'
+
+
+def seed(options):
+    # 绕过逐条过账，批量写入后再统一补齐余额、快照和项目统计。
+    from django.contrib.auth import get_user_model
+    from inv import ledger, lots
+    from inv.models import (Currency, RateHist, Category, Bank, Account, AcctSnapshot,
+                            AccountCategory, AccountRec, Risk, InvProj,
+                            InvRec, PriceHist)
+    D = decimal.Decimal
+    rnd = random.Random(options['seed'])
+    today = datetime.date.today()
+    first = today - datetime.timedelta(days=365*options['years'])
+
+    def day():
+        return first + datetime.timedelta(days=rnd.randrange((today-first).days))
+
+    owner = get_user_model().objects.create_superuser(USERNAME, '', USERNAME)
+    cny = Currency.objects.create(name='CNY', rate=1)
+    usd = Currency.objects.create(name='USD', rate=D('7.1'))
+    RateHist.objects.bulk_create(
+        RateHist(currency=usd, date=d, rate=D('6.5')+D(rnd.randrange(100))/100)
+        for d in ledger.month_ends(first, today))
+    cats = {i: Category.objects.create(name=f'类别{i}', cat=i, owner=owner)
+            for i in range(1, 6)}
+    banks = [Bank.objects.create(name=f'银行{i}', owner=owner) for i in range(3)]
+    accts = [Account.objects.create(
+        name=f'账户{i}', bank=banks[i % 3], currency=usd if i % 4 == 0 else cny,
+        cat=cats[1] if i % 5 else cats[2]) for i in range(options['accounts'])]
+    acats = [AccountCategory.objects.create(name=f'收支{i}', cat=1 + i % 2, owner=owner)
+             for i in range(6)]
+    risks = [Risk.objects.create(name=f'风险{i}', owner=owner) for i in range(3)]
+
+    AccountRec.objects.bulk_create((AccountRec(
+        acct=rnd.choice(accts), date=day(), cat=rnd.choice(acats),
+        value=D(rnd.randrange(100, 1000000))/100, comment=f'记录{i}', owner=owner)
+        for i in range(options['recs'])), batch_size=1000)
+
+    projs = []
+    for i in range(options['projects']):
+        projs.append(InvProj.objects.create(
+            name=f'项目{i}', acct=rnd.choice(accts), cat=cats[5],
+            risk=rnd.choice(risks), isopen=i % 4 != 0,
+            current_price=D(rnd.randrange(50, 300))/100))
+    invrecs, prices = [], []
+    for p in projs:
+        for j in range(options['invrecs']):
+            price = D(rnd.randrange(50, 300))/100
+            amount = D(rnd.randrange(1, 100)*100)
+            invrecs.append(InvRec(
+                proj=p, date=day(), cat=1 if j % 3 else rnd.choice([2, 3]),
+                amount=amount, price=price, value=amount*price, commission=0,
+                owner=owner))
+        prices.extend(PriceHist(proj=p, date=d,
+                                price=D(rnd.randrange(50, 300))/100)
+                      for d in ledger.month_ends(first, today))
+    InvRec.objects.bulk_create(invrecs, batch_size=1000)
+    PriceHist.objects.bulk_create(prices, batch_size=1000)
+
+    # 建账户时按今天余额为0做了快照，这里改成从0开始的全部历史。
+    AcctSnapshot.objects.filter(acct__in=accts).delete()
+    for acct in accts:
+        acct.value = ledger.accountrec_sum(acct.id, None, today) +\
+            ledger.invrec_sum(acct.id, None, today)
+        acct.save()
+        ledger.opening_snapshot(acct)
+    ledger.take_snapshots(accts, today)
+    for p in projs:
+        lots.rebuild(p)
+        p.update_from_rec()
+    ledger.take_proj_snapshots(projs, today)
+    return owner
+
+
+def session_cookie(owner):
+    from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+    from django.contrib.sessions.backends.db import SessionStore
+    session = SessionStore()
+    session[SESSION_KEY] = str(owner.pk)
+    session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+    session[HASH_SESSION_KEY] = owner.get_session_auth_hash()
+    session.save()
+    return {settings.SESSION_COOKIE_NAME: session.session_key}
+
+
+def plan(n, projs, rnd):
+    names = [e[0] for e in ENDPOINTS]
+    weights = [e[1] for e in ENDPOINTS]
+    paths = {e[0]: e[2] for e in ENDPOINTS}
+    result = []
+    for name in rnd.choices(names, weights, k=n):
+        result.append((name, paths[name].format(proj=rnd.choice(projs))))
+    return result
+
+
+def load_app(kind):
+    # 报表在urls导入时选择同步或异步视图，切换前要重新加载URL配置。
+    settings.INV_ASYNC_VIEWS = kind == 'asgi'
+    for name in ('inv.urls', 'invmgr.urls'):
+        if name in sys.modules:
+            importlib.reload(sys.modules[name])
+    clear_url_caches()
+    if kind == 'asgi':
+        from django.core.asgi import get_asgi_application
+        return get_asgi_application()
+    from django.core.wsgi import get_wsgi_application
+    return get_wsgi_application()
+
+
+class Command(BaseCommand):
+    help = '在合成数据库上对WSGI/ASGI应用做并发压测，按接口输出延迟分位数'
+
+    # 系统检查会提前导入URL配置。
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--app', choices=['wsgi', 'asgi', 'both'],
+                            default='both')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=400,
+                            help='每轮的请求总数')
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument('--db', help='合成数据库路径，已存在则直接使用')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--years', type=int, default=5)
+        parser.add_argument('--accounts', type=int, default=20)
+        parser.add_argument('--recs', type=int, default=20000,
+                            help='收支记录数')
+        parser.add_argument('--projects', type=int, default=40)
+        parser.add_argument('--invrecs', type=int, default=50,
+                            help='每个项目的投资记录数')
+        parser.add_argument('--debug', action='store_true',
+                            help='保留DEBUG，会记录每条SQL，数字偏慢')
+
+    def handle(self, *args, **options):
+        import httpx
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('only sqlite is supported')
+        source = connections['default'].settings_dict['NAME']
+        settings.DEBUG = options['debug']
+        # 合成数据上fsolve经常不收敛，警告会淹没结果。
+        warnings.simplefilter('ignore', RuntimeWarning)
+        settings.ALLOWED_HOSTS = list(settings.ALLOWED_HOSTS) + ['localhost']
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = options['db'] or os.path.join(tmpdir, 'loadtest.sqlite3')
+            exists = os.path.exists(path)
+            use_database(path)
+            try:
+                self.prepare(path, exists, options)
+                from inv.models import InvProj
+                from django.contrib.auth import get_user_model
+                owner = get_user_model().objects.get(username=USERNAME)
+                projs = list(InvProj.objects.owned_by(owner).values_list('id', flat=True))
+                cookies = session_cookie(owner)
+                connections.close_all()
+
+                kinds = ['wsgi', 'asgi'] if options['app'] == 'both' else [options['app']]
+                for kind in kinds:
+                    app = load_app(kind)
+                    rnd = random.Random(options['seed'])
+                    self.run(httpx, kind, app, cookies,
+                             plan(options['warmup'], projs, rnd), options, False)
+                    self.run(httpx, kind, app, cookies,
+                             plan(options['requests'], projs, rnd), options, True)
+            finally:
+                use_database(source)
+
+    def prepare(self, path, exists, options):
+        call_command('migrate', verbosity=0)
+        if exists:
+            self.stdout.write(f'using {path}')
+            return
+        start = time.perf_counter()
+        seed(options)
+        self.stdout.write(f'seeded {path} in {time.perf_counter()-start:0.1f}s')
+
+    def run(self, httpx, kind, app, cookies, requests, options, report):
+        results = []
+        start = time.perf_counter()
+        if kind == 'wsgi':
+            self.run_wsgi(httpx, app, cookies, requests, options, results)
+        else:
+            asyncio.run(self.run_asgi(httpx, app, cookies, requests, options,
+                                      results))
+        elapsed = time.perf_counter() - start
+        connections.close_all()
+        if report:
+            self.report(kind, results, elapsed, options)
+
+    def run_wsgi(self, httpx, app, cookies, requests, options, results):
+        it = iter(requests)
+        lock = threading.Lock()
+
+        def worker():
+            transport = httpx.WSGITransport(app=app)
+            with httpx.Client(transport=transport, base_url='http://localhost',
+                              cookies=cookies) as client:
+                while True:
+                    with lock:
+                        item = next(it, None)
+                    if item is None:
+                        break
+                    results.append(self.fetch(client, *item))
+            connections.close_all()
+
+        threads = [threading.Thread(target=worker)
+                   for _ in range(options['concurrency'])]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    async def run_asgi(self, httpx, app, cookies, requests, options, results):
+        queue = asyncio.Queue()
+        for item in requests:
+            queue.put_nowait(item)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://localhost',
+                                     cookies=cookies) as client:
+
+            async def worker():
+                while not queue.empty():
+                    name, url = queue.get_nowait()
+                    t = time.perf_counter()
+                    r = await client.get(url)
+                    results.append((name, time.perf_counter()-t, r.status_code))
+
+            await asyncio.gather(*[worker() for _ in range(options['concurrency'])])
+
+    def fetch(self, client, name, url):
+        t = time.perf_counter()
+        r = client.get(url)
+        return name, time.perf_counter()-t, r.status_code
+
+    def report(self, kind, results, elapsed, options):
+        self.stdout.write(
+            f'\n{kind}: {len(results)} requests, concurrency {options["concurrency"]}, '
+            f'{elapsed:0.2f}s, {len(results)/elapsed:0.1f} req/s')
+        self.stdout.write(f'{"endpoint":18} {"n":>5} {"err":>4} {"p50":>8} '
+                          f'{"p95":>8} {"p99":>8} {"max":>8}')
+        names = [e[0] for e in ENDPOINTS]
+        for name in names + ['all']:
+            rows = [r for r in results if name in ('all', r[0])]
+            if not rows:
+                continue
+            latency = [r[1] for r in rows]
+            errors = sum(1 for r in rows if r[2] >= 400)
+            self.stdout.write(
+                f'{name:18} {len(rows):5} {errors:4} '
+                f'{1000*percentile(latency, 50):6.1f}ms '
+                f'{1000*percentile(latency, 95):6.1f}ms '
+                f'{1000*percentile(latency, 99):6.1f}ms '
+                f'{1000*max(latency):6.1f}ms')
@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+import os
+import json
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inv import drivers
+
+
+FIXTURES = os.path.join(os.path.dirname(drivers.__file__), 'testdata', 'drivers')
+
+
+class Command(BaseCommand):
+    help = '用保存的响应测量各个驱动的解析耗时和内存'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fixtures', default=FIXTURES,
+                            help='包含index.json的目录，也可以是record模式保存响应的目录')
+        parser.add_argument('--number', type=int, default=200,
+                            help='每个样本解析的次数')
+
+    def handle(self, *args, **options):
+        path = options['fixtures']
+        with open(os.path.join(path, 'index.json')) as fi:
+            index = json.load(fi)
+
+        failed = 0
+        for item in index:
+            url, parse = drivers.http_drivers[item['driver']]
+            with open(os.path.join(path, item['file']), 'rb') as fi:
+                content = fi.read()
+            result = parse(content, item['id'])
+
+            start = time.perf_counter()
+            for _ in range(options['number']):
+                parse(content, item['id'])
+            elapsed = (time.perf_counter() - start) / options['number']
+
+            tracemalloc.start()
+            parse(content, item['id'])
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            ok = 'expect' not in item or result == item['expect']
+            failed += not ok
+            self.stdout.write(
+                f'{item["driver"]:15} {item["id"]:10} {len(content)/1024:7.1f} KB '
+                f'{1e6*elapsed:9.1f} us/quote {peak/1024:8.1f} KB py-peak '
+                f'{result!r} {"ok" if ok else "MISMATCH"}')
+
+        if failed:
+            raise CommandError(f'{failed} fixtures parsed to unexpected values')
@@ -0,0 +1,113 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+import os
+import copy
+import time
+import datetime
+import warnings
+import tempfile
+import statistics
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+
+from .loadtest import USERNAME
+from .loadtest import Command as LoadTest
+from .sqlitebench import use_database
+
+
+def uncached_loaders():
+    # DEBUG下原来的配置：每次请求都重新读取和编译模板。
+    templates = copy.deepcopy(settings.TEMPLATES)
+    for t in templates:
+        t['OPTIONS']['loaders'] = [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]
+    return templates
+
+
+def endpoints(owner):
+    from inv.models import InvProj
+    month_end = datetime.date.today().replace(day=1) - datetime.timedelta(days=1)
+    proj = InvProj.objects.owned_by(owner).values_list('id', flat=True).first()
+    return [
+        ('bal', '/inv/bal'),
+        ('bal:asof', f'/inv/bal?asof={month_end}'),
+        ('ios', '/inv/ios'),
+        ('ind', '/inv/ind'),
+        ('ogd', '/inv/ogd'),
+        ('st', f'/inv/st/{proj}'),
+    ]
+
+
+class Command(BaseCommand):
+    help = '比较不缓存模板、缓存加载器和片段缓存命中时各个报表的响应时间'
+
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--db', help='合成数据库路径，和loadtest共用，已存在则直接使用')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--years', type=int, default=5)
+        parser.add_argument('--accounts', type=int, default=20)
+        parser.add_argument('--recs', type=int, default=20000,
+                            help='收支记录数')
+        parser.add_argument('--projects', type=int, default=40)
+        parser.add_argument('--invrecs', type=int, default=50,
+                            help='每个项目的投资记录数')
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('only sqlite is supported')
+        source = connections['default'].settings_dict['NAME']
+        settings.DEBUG = False
+        warnings.simplefilter('ignore', RuntimeWarning)
+        settings.ALLOWED_HOSTS = list(settings.ALLOWED_HOSTS) + ['testserver']
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = options['db'] or os.path.join(tmpdir, 'loadtest.sqlite3')
+            use_database(path)
+            try:
+                LoadTest(stdout=self.stdout).prepare(path, os.path.exists(path), options)
+                from django.contrib.auth import get_user_model
+                owner = get_user_model().objects.get(username=USERNAME)
+                client = Client()
+                client.force_login(owner)
+                self.run(client, endpoints(owner), options['repeat'])
+            finally:
+                connections.close_all()
+                use_database(source)
+
+    def measure(self, client, path, repeat, warm):
+        times = []
+        for _ in range(repeat):
+            if not warm:
+                cache.clear()
+            start = time.perf_counter()
+            response = client.get(path)
+            times.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise CommandError(f'{path}: {response.status_code}')
+        return 1000*statistics.median(times)
+
+    def run(self, client, paths, repeat):
+        self.stdout.write(f'{"endpoint":10} {"uncached":>10} {"cached":>10} '
+                          f'{"fragment":>10}  (ms, median)')
+        for name, path in paths:
+            with override_settings(TEMPLATES=uncached_loaders()):
+                uncached = self.measure(client, path, repeat, False)
+            cached = self.measure(client, path, repeat, False)
+            client.get(path)
+            fragment = self.measure(client, path, repeat, True)
+            self.stdout.write(f'{name:10} {uncached:10.1f} {cached:10.1f} {fragment:10.1f}')
@@ -0,0 +1,64 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+import json
+import math
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from inv import risk
+
+
+class Command(BaseCommand):
+    help = '对开放的投资项目做蒙特卡洛风险模拟'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='组合所属的用户')
+        parser.add_argument('--horizon', type=float, default=1.0,
+                            help='模拟期限，年')
+        parser.add_argument('--steps', type=int, help='步数，默认每月一步')
+        parser.add_argument('--paths', type=int, default=20000, help='路径数')
+        parser.add_argument('--target', type=float, help='目标市值，CNY')
+        parser.add_argument('--seed', type=int, help='随机数种子')
+        parser.add_argument('--years', type=int, default=3,
+                            help='估计参数用的历史年数')
+        parser.add_argument('--assumptions',
+                            help='JSON文件，{组合名: {"mu": 0.05, "sigma": 0.2}}')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            owner = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'no such user: {options["username"]}')
+        if not math.isfinite(options['horizon']) or options['horizon'] <= 0:
+            raise CommandError(f'bad horizon: {options["horizon"]}')
+        assumptions = None
+        if options['assumptions']:
+            with open(options['assumptions']) as fi:
+                assumptions = json.load(fi)
+
+        start = time.perf_counter()
+        bks, returns = risk.load(owner, options['years'])
+        loaded = time.perf_counter()
+        result = risk.run(
+            bks, returns, horizon=options['horizon'],
+            steps=options['steps'] or max(1, round(12*options['horizon'])),
+            paths=options['paths'], target=options['target'],
+            seed=options['seed'], assumptions=assumptions)
+        done = time.perf_counter()
+        if result is None:
+            raise CommandError('no open projects')
+
+        self.stdout.write(result.allocation().to_string(float_format='{0:0.2f}'.format))
+        self.stdout.write('')
+        self.stdout.write(result.summary().to_string(float_format='{0:0.2f}'.format))
+        self.stdout.write(f'\nload {1000*(loaded-start):.0f} ms, '
+                          f'simulate {1000*(done-loaded):.0f} ms')
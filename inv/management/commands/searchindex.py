@@ -0,0 +1,26 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from inv import search
+from inv.models import AccountRec, InvProj
+
+
+class Command(BaseCommand):
+    help = '重建收支注释和投资项目的全文索引，批量导入或直接改库之后使用'
+
+    def handle(self, *args, **options):
+        if not search.available():
+            raise CommandError('full text search needs sqlite')
+        with transaction.atomic():
+            for model in (AccountRec, InvProj):
+                search.rebuild(model)
+                self.stdout.write(f'{model._meta.model_name}: '
+                                  f'{model.objects.count()} rows indexed')
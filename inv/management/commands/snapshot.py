@@ -0,0 +1,29 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from inv import ledger
+from inv.models import Account, InvProj
+
+
+class Command(BaseCommand):
+    help = '为所有账户和投资项目补齐月末快照'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--until', help='截止日期YYYY-MM-DD，默认今天')
+
+    def handle(self, *args, **options):
+        until = datetime.date.today()
+        if options['until']:
+            until = datetime.datetime.strptime(options['until'], '%Y-%m-%d').date()
+        count = ledger.take_snapshots(Account.objects.all(), until)
+        count += ledger.take_proj_snapshots(InvProj.objects.all(), until)
+        self.stdout.write(f'{count} snapshots created')
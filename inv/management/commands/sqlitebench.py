@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
+
+from inv.db import use_replica
+from inv.models import AccountRec, Version
+
+
+# 一个长时间持有读锁的报表查询。
+HEAVY_READ = '''SELECT count(*) FROM inv_accountrec a
+JOIN inv_accountrec b ON a.value >= b.value'''
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values)-1, int(len(values)*p/100))]
+
+
+def use_database(path):
+    connections.close_all()
+    connections.databases['default']['NAME'] = path
+    if 'replica' in connections.databases:
+        connections.databases['replica']['NAME'] = f'file:{path}?mode=ro'
+
+
+class Command(BaseCommand):
+    help = '在数据库副本上测量报表读取和写入并发时的写入延迟'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writes', type=int, default=50)
+
+    def reader(self, stop, counter, replica):
+        try:
+            while not stop.is_set():
+                if replica:
+                    with use_replica():
+                        alias = router.db_for_read(AccountRec)
+                else:
+                    alias = router.db_for_read(AccountRec)
+                with connections[alias].cursor() as cursor:
+                    cursor.execute(HEAVY_READ)
+                    cursor.fetchone()
+                counter.append(1)
+        finally:
+            connections.close_all()
+
+    def writer(self, n, latency):
+        try:
+            for _ in range(n):
+                t = time.perf_counter()
+                with transaction.atomic():
+                    Version.bump('sqlitebench')
+                latency.append(time.perf_counter() - t)
+                time.sleep(0.005)
+        finally:
+            connections.close_all()
+
+    def run(self, journal_mode, replica, options):
+        settings.SQLITE_PRAGMAS['journal_mode'] = journal_mode
+        connections.close_all()
+        stop, counter, latency = threading.Event(), [], []
+        readers = [threading.Thread(target=self.reader,
+                                    args=(stop, counter, replica))
+                   for _ in range(options['readers'])]
+        for t in readers:
+            t.start()
+        time.sleep(0.1)
+        start = time.perf_counter()
+        w = threading.Thread(target=self.writer,
+                             args=(options['writes'], latency))
+        w.start()
+        w.join()
+        elapsed = time.perf_counter() - start
+        stop.set()
+        for t in readers:
+            t.join()
+        self.stdout.write(
+            f'{journal_mode:6} replica={replica!s:5} '
+            f'write p50={1000*percentile(latency, 50):7.1f}ms '
+            f'p95={1000*percentile(latency, 95):7.1f}ms '
+            f'max={1000*max(latency):7.1f}ms '
+            f'reads={len(counter)} in {elapsed:0.2f}s')
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('only sqlite is supported')
+        source = connections['default'].settings_dict['NAME']
+        pragmas = dict(settings.SQLITE_PRAGMAS)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'bench.sqlite3')
+            src, dst = sqlite3.connect(source), sqlite3.connect(path)
+            src.backup(dst)
+            src.close()
+            dst.close()
+            use_database(path)
+            try:
+                # 默认配置：回滚日志，读写同一个连接配置。
+                self.run('DELETE', False, options)
+                # 性能配置：WAL，报表读取走只读连接。
+                self.run('WAL', True, options)
+            finally:
+                settings.SQLITE_PRAGMAS.clear()
+                settings.SQLITE_PRAGMAS.update(pragmas)
+                use_database(source)
@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from inv import jobs
+
+
+def run_job(job_id):
+    # 在子进程里运行，用自己的数据库连接。
+    try:
+        return jobs.run(job_id)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = '运行后台任务队列，IRR和pandas等计算密集的任务放在进程池里并行'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='队列为空时的轮询间隔，秒')
+        parser.add_argument('--once', action='store_true',
+                            help='队列清空后退出')
+        parser.add_argument('--stale', type=float, default=60,
+                            help='运行中的任务超过这么多秒没有心跳就标记为失败（worker异常退出）')
+
+    def handle(self, *args, **options):
+        running = {}
+        # 心跳间隔是超时的四分之一，偶尔慢一次不会被别的worker误判。
+        interval = max(options['stale']/4, options['interval'])
+        last_beat = 0
+        with ProcessPoolExecutor(options['processes']) as pool:
+            try:
+                while True:
+                    if time.perf_counter() - last_beat >= interval:
+                        jobs.beat(job_id for job_id, start in running.values())
+                        n = jobs.reap(options['stale'])
+                        if n:
+                            self.stdout.write(f'{n} stale jobs failed')
+                        last_beat = time.perf_counter()
+                    while len(running) < options['processes']:
+                        job_id = jobs.claim()
+                        if job_id is None:
+                            break
+                        # fork之前关掉连接，子进程不能共用父进程的sqlite连接。
+                        connections.close_all()
+                        running[pool.submit(run_job, job_id)] = (job_id, time.perf_counter())
+                    if not running:
+                        if options['once']:
+                            break
+                        time.sleep(options['interval'])
+                        continue
+                    done, _ = wait(running, timeout=options['interval'],
+                                   return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self.report(future, *running.pop(future))
+            except KeyboardInterrupt:
+                pass
+
+    def report(self, future, job_id, start):
+        try:
+            ok = future.result()
+        except Exception as err:
+            # 子进程异常退出，任务自己来不及记录。
+            jobs.finish(job_id, f'worker process failed: {err!r}')
+            ok = False
+        status = 'done' if ok else 'failed'
+        self.stdout.write(f'job {job_id} {status} in {time.perf_counter()-start:0.2f}s')
@@ -0,0 +1,55 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inv', '0002_auto_20210208_1229'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Version',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=20, unique=True, verbose_name='名称')),
+                ('version', models.IntegerField(default=0, verbose_name='版本')),
+                ('modified', models.DateTimeField(auto_now=True, verbose_name='修改时间')),
+            ],
+            options={
+                'verbose_name': '数据版本',
+                'verbose_name_plural': '数据版本',
+            },
+        ),
+        migrations.CreateModel(
+            name='RateHist',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日期')),
+                ('rate', models.DecimalField(decimal_places=4, max_digits=12, verbose_name='汇率')),
+                ('currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inv.currency', verbose_name='币种')),
+            ],
+            options={
+                'verbose_name': '汇率历史',
+                'verbose_name_plural': '汇率历史',
+                'unique_together': {('currency', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='PriceHist',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日期')),
+                ('price', models.DecimalField(decimal_places=4, max_digits=16, verbose_name='价格')),
+                ('proj', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inv.invproj', verbose_name='投资项目')),
+            ],
+            options={
+                'verbose_name': '价格历史',
+                'verbose_name_plural': '价格历史',
+                'unique_together': {('proj', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,117 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# 原来的数据都属于唯一的使用者，分配给第一个超级用户。
+def assign_owner(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    owner = User.objects.filter(is_superuser=True).order_by('id').first()
+    if owner is None:
+        return
+    for name in ['Bank', 'Category', 'AccountCategory', 'Risk', 'Account',
+                 'AccountRec', 'InvProj', 'InvRec']:
+        apps.get_model('inv', name).objects.filter(
+            owner__isnull=True).update(owner=owner)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('inv', '0003_nav_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='owner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL, verbose_name='所有者'),
+        ),
+        migrations.AddField(
+            model_name='accountcategory',
+            name='owner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL, verbose_name='所有者'),
+        ),
+        migrations.AddField(
+            model_name='accountrec',
+            name='owner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL, verbose_name='所有者'),
+        ),
+        migrations.AddField(
+            model_name='bank',
+            name='owner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL, verbose_name='所有者'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='owner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL, verbose_name='所有者'),
+        ),
+        migrations.AddField(
+            model_name='invproj',
+            name='owner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL, verbose_name='所有者'),
+        ),
+        migrations.AddField(
+            model_name='invrec',
+            name='owner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL, verbose_name='所有者'),
+        ),
+        migrations.AddField(
+            model_name='risk',
+            name='owner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL, verbose_name='所有者'),
+        ),
+        migrations.AddIndex(
+            model_name='account',
+            index=models.Index(fields=['owner', 'cat'], name='inv_account_owner_i_171247_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='account',
+            index=models.Index(fields=['owner', 'bank'], name='inv_account_owner_i_7ea27a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accountcategory',
+            index=models.Index(fields=['owner', 'cat'], name='inv_account_owner_i_af4124_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accountrec',
+            index=models.Index(fields=['owner', 'date'], name='inv_account_owner_i_0b8aa3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accountrec',
+            index=models.Index(fields=['owner', 'cat', 'date'], name='inv_account_owner_i_f75fe6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bank',
+            index=models.Index(fields=['owner', 'name'], name='inv_bank_owner_i_e578e6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['owner', 'cat'], name='inv_categor_owner_i_8362b4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invproj',
+            index=models.Index(fields=['owner', 'isopen'], name='inv_invproj_owner_i_b11bb6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invproj',
+            index=models.Index(fields=['owner', 'cat', 'isopen'], name='inv_invproj_owner_i_0f94df_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invrec',
+            index=models.Index(fields=['owner', 'date'], name='inv_invrec_owner_i_65bbc5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invrec',
+            index=models.Index(fields=['owner', 'proj', 'date'], name='inv_invrec_owner_i_3c1726_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='risk',
+            index=models.Index(fields=['owner', 'name'], name='inv_risk_owner_i_b8c2f5_idx'),
+        ),
+        migrations.RunPython(assign_owner, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:27
+
+import datetime
+import decimal
+
+from django.db import migrations, models
+from django.db.models import Case, F, Min, Sum, When
+import django.db.models.deletion
+
+
+# 以当前余额为准，倒推出第一笔过账之前的期初余额，作为第一个快照。
+def opening_snapshots(apps, schema_editor):
+    Account = apps.get_model('inv', 'Account')
+    AccountRec = apps.get_model('inv', 'AccountRec')
+    InvRec = apps.get_model('inv', 'InvRec')
+    AcctSnapshot = apps.get_model('inv', 'AcctSnapshot')
+    for acct in Account.objects.all():
+        recs = AccountRec.objects.filter(acct=acct).aggregate(
+            first=Min('date'), s=Sum(Case(When(cat__cat=1, then=F('value')),
+                                          default=-F('value'))))
+        invs = InvRec.objects.filter(proj__acct=acct).aggregate(
+            first=Min('date'), s=Sum(Case(When(cat=1, then=-F('value')),
+                                          default=F('value'))))
+        first = [d for d in (recs['first'], invs['first']) if d]
+        date = min(first) if first else datetime.date.today()
+        value = acct.value - (recs['s'] or decimal.Decimal()) -\
+            (invs['s'] or decimal.Decimal())
+        AcctSnapshot.objects.create(
+            acct=acct, date=date-datetime.timedelta(days=1), value=value)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inv', '0004_owner'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AcctSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日期')),
+                ('value', models.DecimalField(decimal_places=2, max_digits=16, verbose_name='余额')),
+            ],
+            options={
+                'verbose_name': '账户快照',
+                'verbose_name_plural': '账户快照',
+            },
+        ),
+        migrations.AlterField(
+            model_name='account',
+            name='value',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='余额'),
+        ),
+        migrations.AddIndex(
+            model_name='accountrec',
+            index=models.Index(fields=['acct', 'date'], name='inv_account_acct_id_b2535a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invrec',
+            index=models.Index(fields=['proj', 'date'], name='inv_invrec_proj_id_6f0339_idx'),
+        ),
+        migrations.AddField(
+            model_name='acctsnapshot',
+            name='acct',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inv.account', verbose_name='账户'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='acctsnapshot',
+            unique_together={('acct', 'date')},
+        ),
+        migrations.RunPython(opening_snapshots, migrations.RunPython.noop),
+    ]
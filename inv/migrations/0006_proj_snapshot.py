@@ -0,0 +1,42 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:29
+
+import datetime
+
+from django.db import migrations, models
+from django.db.models import Min
+import django.db.models.deletion
+
+
+# 项目在第一笔记录之前价值为0，以此作为第一个快照。
+def opening_snapshots(apps, schema_editor):
+    InvProj = apps.get_model('inv', 'InvProj')
+    ProjSnapshot = apps.get_model('inv', 'ProjSnapshot')
+    for proj in InvProj.objects.annotate(first=Min('invrec__date')).filter(
+            first__isnull=False):
+        ProjSnapshot.objects.create(
+            proj=proj, date=proj.first-datetime.timedelta(days=1), value=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inv', '0005_ledger_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日期')),
+                ('value', models.DecimalField(decimal_places=2, max_digits=16, verbose_name='现存价值')),
+                ('proj', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inv.invproj', verbose_name='投资项目')),
+            ],
+            options={
+                'verbose_name': '项目快照',
+                'verbose_name_plural': '项目快照',
+                'unique_together': {('proj', 'date')},
+            },
+        ),
+        migrations.RunPython(opening_snapshots, migrations.RunPython.noop),
+    ]
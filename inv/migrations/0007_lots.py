@@ -0,0 +1,51 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_lots(apps, schema_editor):
+    from inv import lots
+    InvProj = apps.get_model('inv', 'InvProj')
+    InvRec = apps.get_model('inv', 'InvRec')
+    LotBook = apps.get_model('inv', 'LotBook')
+    for proj in InvProj.objects.all():
+        recs = list(InvRec.objects.filter(proj=proj).order_by('date', 'id').values_list(
+            'id', 'date', 'cat', 'amount', 'value'))
+        book = lots.replay(proj.cost_method, (r[1:] for r in recs))
+        last = recs[-1] if recs else (None, None)
+        LotBook.objects.create(proj=proj, date=last[1], rec_id=last[0],
+                               **lots.fields(book))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inv', '0006_proj_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LotBook',
+            fields=[
+                ('proj', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='lotbook', serialize=False, to='inv.invproj', verbose_name='投资项目')),
+                ('method', models.IntegerField(choices=[(1, '先进先出'), (2, '移动平均')], verbose_name='成本计算')),
+                ('date', models.DateField(null=True, verbose_name='最后记录日期')),
+                ('rec_id', models.IntegerField(null=True, verbose_name='最后记录')),
+                ('amount', models.DecimalField(decimal_places=4, max_digits=16, verbose_name='持仓量')),
+                ('cost', models.DecimalField(decimal_places=2, max_digits=16, verbose_name='持仓成本')),
+                ('realized', models.DecimalField(decimal_places=2, max_digits=16, verbose_name='已实现收益')),
+                ('data', models.BinaryField(verbose_name='批次')),
+            ],
+            options={
+                'verbose_name': '持仓批次',
+                'verbose_name_plural': '持仓批次',
+            },
+        ),
+        migrations.AddField(
+            model_name='invproj',
+            name='cost_method',
+            field=models.IntegerField(choices=[(1, '先进先出'), (2, '移动平均')], default=1, verbose_name='成本计算'),
+        ),
+        migrations.RunPython(build_lots, migrations.RunPython.noop),
+    ]
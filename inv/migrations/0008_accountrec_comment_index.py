@@ -0,0 +1,15 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:39
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inv', '0007_lots'),
+    ]
+
+    # 注释搜索用0011的全文索引，这里不再建前缀索引。
+    # 保留这个空的迁移，已经迁移过的库和后面迁移的依赖都不变。
+    operations = [
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('inv', '0008_accountrec_comment_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(max_length=40, verbose_name='任务')),
+                ('args', models.JSONField(default=dict, verbose_name='参数')),
+                ('status', models.IntegerField(choices=[(0, '等待'), (1, '运行'), (2, '完成'), (3, '失败')], default=0, verbose_name='状态')),
+                ('progress', models.IntegerField(default=0, verbose_name='进度')),
+                ('total', models.IntegerField(default=0, verbose_name='总数')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('started', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='结束时间')),
+                ('error', models.TextField(blank=True, default='', verbose_name='错误')),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL, verbose_name='所有者')),
+            ],
+            options={
+                'verbose_name': '后台任务',
+                'verbose_name_plural': '后台任务',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['status', 'id'], name='inv_job_status_7239fa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['owner', 'created'], name='inv_job_owner_i_8ebe13_idx'),
+        ),
+    ]
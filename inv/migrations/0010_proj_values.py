@@ -0,0 +1,61 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:51
+
+import decimal
+
+from django.db import migrations, models
+
+
+# 和InvProj.update_values一样的算法，迁移里不能用模型的方法。
+def fill_values(apps, schema_editor):
+    InvProj = apps.get_model('inv', 'InvProj')
+    projs = list(InvProj.objects.all())
+    for p in projs:
+        value = p.value or 0
+        p.mkt_value = decimal.Decimal(0)
+        p.profit_rate = None
+        if p.isopen and p.current_price and p.amount is not None:
+            p.mkt_value = (p.amount*p.current_price).quantize(decimal.Decimal('0.01'))
+            if value:
+                p.profit_rate = (100*p.mkt_value/value - 100).quantize(
+                    decimal.Decimal('0.0001'))
+        p.profit = p.mkt_value - value
+    InvProj.objects.bulk_update(projs, ['mkt_value', 'profit', 'profit_rate'],
+                                batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inv', '0009_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invproj',
+            name='mkt_value',
+            field=models.DecimalField(decimal_places=2, max_digits=16, null=True, verbose_name='市值'),
+        ),
+        migrations.AddField(
+            model_name='invproj',
+            name='profit',
+            field=models.DecimalField(decimal_places=2, max_digits=16, null=True, verbose_name='净值'),
+        ),
+        migrations.AddField(
+            model_name='invproj',
+            name='profit_rate',
+            field=models.DecimalField(decimal_places=4, max_digits=16, null=True, verbose_name='未实现收益率'),
+        ),
+        migrations.AddIndex(
+            model_name='invproj',
+            index=models.Index(fields=['owner', 'profit'], name='inv_invproj_owner_i_012215_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invproj',
+            index=models.Index(fields=['owner', 'profit_rate'], name='inv_invproj_owner_i_93f926_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invproj',
+            index=models.Index(fields=['owner', 'mkt_value'], name='inv_invproj_owner_i_c4cba4_idx'),
+        ),
+        migrations.RunPython(fill_values, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-19 14:02
+
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    from inv import search
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    search.create(schema_editor)
+    for name in search.TABLES:
+        search.rebuild(apps.get_model('inv', name), schema_editor.connection.alias)
+
+
+def drop_index(apps, schema_editor):
+    from inv import search
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    search.drop(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inv', '0010_proj_values'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.2.25 on 2026-10-19 14:00
+
+from django.conf import settings
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('inv', '0011_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Archive',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=20, verbose_name='模型')),
+                ('rollup', models.IntegerField(verbose_name='汇总记录')),
+                ('date', models.DateField(verbose_name='日期')),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='数据')),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL, verbose_name='所有者')),
+            ],
+            options={
+                'verbose_name': '归档记录',
+                'verbose_name_plural': '归档记录',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archive',
+            index=models.Index(fields=['owner', 'model', 'rollup'], name='inv_archive_owner_i_1d13a7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archive',
+            index=models.Index(fields=['owner', 'date'], name='inv_archive_owner_i_45003f_idx'),
+        ),
+    ]
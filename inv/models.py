@@ -4,14 +4,70 @@ from __future__ import unicode_literals
 import json
 import decimal
 import datetime
-
-from scipy.optimize import fsolve
-
-from django.db import models
+import contextlib
+import contextvars
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import F
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.html import format_html
 
 
+class Version(models.Model):
+
+    class Meta:
+        verbose_name = '数据版本'
+        verbose_name_plural = '数据版本'
+
+    name = models.CharField('名称', max_length=20, unique=True)
+    version = models.IntegerField('版本', default=0)
+    modified = models.DateTimeField('修改时间', auto_now=True)
+
+    def __str__(self):
+        return f'{self.name}({self.version})'
+
+    @classmethod
+    def bump(cls, name='default'):
+        if not cls.objects.filter(name=name).update(
+                version=F('version')+1, modified=timezone.now()):
+            cls.objects.get_or_create(name=name, defaults={'version': 1})
+
+    # 全局数据（汇率等）和某个用户自己的数据，任何一个变化都会改变版本。
+    @classmethod
+    def of(cls, owner_id):
+        names = ['default', f'owner:{owner_id}']
+        versions = dict(cls.objects.filter(name__in=names).values_list(
+            'name', 'version'))
+        return '.'.join(str(versions.get(n, 0)) for n in names)
+
+    @classmethod
+    def modified_of(cls, owner_id):
+        names = ['default', f'owner:{owner_id}']
+        return cls.objects.filter(name__in=names).aggregate(
+            m=models.Max('modified'))['m']
+
+
+class OwnedQuerySet(models.QuerySet):
+
+    def owned_by(self, user):
+        return self.filter(owner_id=user.id)
+
+
+class Owned(models.Model):
+
+    class Meta:
+        abstract = True
+
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, verbose_name='所有者',
+                              on_delete=models.PROTECT, blank=True, null=True)
+
+    objects = OwnedQuerySet.as_manager()
+
+
 class Currency(models.Model):
 
     class Meta:
@@ -27,18 +83,72 @@ class Currency(models.Model):
     def update_current_price(self):
         if self.name == 'CNY':
             return
+        [(cur, old, new, err)] = Currency.update_rates([self])
+        if err:
+            raise err
+
+    @classmethod
+    def update_rates(cls, curs):
         from . import drivers
-        price = drivers.InvestingCurrency(self.name)
-        if price:
-            self.rate = decimal.Decimal(price)
-            self.save()
+        curs = [c for c in curs if c.name != 'CNY']
+        return cls.set_rates(curs, drivers.currency_rates([c.name for c in curs]))
+
+    # rates: {币种名: (汇率, 错误)}。所有币种一次bulk_update，当天的汇率历史也批量写入。
+    # 返回[(币种, 原汇率, 新汇率, 错误), ...]。
+    @classmethod
+    def set_rates(cls, curs, rates):
+        places = decimal.Decimal('0.0001')
+        results, changed = [], []
+        for c in curs:
+            rate, err = rates.get(c.name, (None, None))
+            old = c.rate
+            if rate:
+                c.rate = decimal.Decimal(str(rate)).quantize(places)
+                changed.append(c)
+            results.append((c, old, c.rate, err))
+        if not changed:
+            return results
+        today = datetime.date.today()
+        with transaction.atomic():
+            cls.objects.bulk_update(changed, ['rate'])
+            hists = {h.currency_id: h for h in RateHist.objects.filter(
+                date=today, currency__in=changed)}
+            for c in changed:
+                if c.id in hists:
+                    hists[c.id].rate = c.rate
+            RateHist.objects.bulk_update(list(hists.values()), ['rate'])
+            RateHist.objects.bulk_create(
+                RateHist(currency=c, date=today, rate=c.rate)
+                for c in changed if c.id not in hists)
+            # bulk操作不发信号，汇率影响所有人的报表。
+            Version.bump()
+        return results
+
+
+class RateHist(models.Model):
 
+    class Meta:
+        verbose_name = '汇率历史'
+        verbose_name_plural = '汇率历史'
+        unique_together = [('currency', 'date')]
+
+    currency = models.ForeignKey(Currency, verbose_name='币种',
+                                 on_delete=models.CASCADE)
+    date = models.DateField('日期')
+    rate = models.DecimalField('汇率', max_digits=12, decimal_places=4)
+
+    def __str__(self):
+        return f'{self.currency.name}({self.date})'
 
-class Category(models.Model):
+
+class Category(Owned):
 
     class Meta:
         verbose_name = '类别'
         verbose_name_plural = '类别'
+        indexes = [
+            models.Index(fields=['owner', 'cat']),
+        ]
 
     CAT_CHOICES = (
         (1, '流动资产'),
@@ -55,20 +165,15 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
-    def values_by_currency(self):
-        values = {}
-        for a in self.account_set.all():
-            values[a.currency.name] = a.value + values.get(a.currency.name, 0)
-        for p in self.invproj_set.filter(isopen=True).all():
-            values[p.acct.currency.name] = p.value + values.get(p.acct.currency.name, 0)
-        return values
-        
 
-class Bank(models.Model):
+class Bank(Owned):
 
     class Meta:
         verbose_name = '银行'
         verbose_name_plural = '银行'
+        indexes = [
+            models.Index(fields=['owner', 'name']),
+        ]
 
     name = models.CharField('名称', max_length=20)
 
@@ -76,28 +181,68 @@ class Bank(models.Model):
         return self.name
 
 
-class Account(models.Model):
+class Account(Owned):
 
     class Meta:
         verbose_name = '账户'
         verbose_name_plural = '账户'
+        indexes = [
+            models.Index(fields=['owner', 'cat']),
+            models.Index(fields=['owner', 'bank']),
+        ]
 
     bank = models.ForeignKey(Bank, verbose_name='银行', on_delete=models.PROTECT)
     name = models.CharField('名称', max_length=20)
     currency = models.ForeignKey(Currency, verbose_name='币种',
                                  on_delete=models.PROTECT)
     cat = models.ForeignKey(Category, verbose_name='类别', on_delete=models.PROTECT)
-    value = models.DecimalField('余额', max_digits=16, decimal_places=2)
+    value = models.DecimalField('余额', max_digits=16, decimal_places=2,
+                                default=0)
 
     def __str__(self):
         return f'{self.bank.name}-{self.name}'
 
+    # 新建账户时的余额作为期初快照，之后余额只由过账改变。
+    def save(self, *args, **kwargs):
+        if self.owner_id is None:
+            self.owner_id = self.bank.owner_id
+        created = not self.pk
+        r = super().save(*args, **kwargs)
+        if created:
+            AcctSnapshot.objects.create(
+                acct=self, value=self.value,
+                date=datetime.date.today()-datetime.timedelta(days=1))
+        return r
+
+    def balance_at(self, date):
+        from . import ledger
+        return ledger.balance_at(self.id, date)
 
-class AccountCategory(models.Model):
+
+class AcctSnapshot(models.Model):
+
+    class Meta:
+        verbose_name = '账户快照'
+        verbose_name_plural = '账户快照'
+        unique_together = [('acct', 'date')]
+
+    acct = models.ForeignKey(Account, verbose_name='账户',
+                             on_delete=models.CASCADE)
+    date = models.DateField('日期')
+    value = models.DecimalField('余额', max_digits=16, decimal_places=2)
+
+    def __str__(self):
+        return f'{self.acct}({self.date})'
+
+
+class AccountCategory(Owned):
 
     class Meta:
         verbose_name = '账户收支类别'
         verbose_name_plural = '账户收支类别'
+        indexes = [
+            models.Index(fields=['owner', 'cat']),
+        ]
 
     CAT_CHOICES = (
         (1, '收入'),
@@ -111,11 +256,40 @@ class AccountCategory(models.Model):
         return self.name
 
 
-class AccountRec(models.Model):
+class AccountRecQuerySet(OwnedQuerySet):
+
+    # admin的date_hierarchy按年、月列出有记录的日期。sqlite上django_date_trunc
+    # 是逐行调用的Python函数，账本大了很慢。这里在首尾之间逐个区间探测，
+    # 每次都是(owner, date)索引上的范围查询。
+    def dates(self, field_name, kind, order='ASC'):
+        if field_name != 'date' or kind not in ('year', 'month'):
+            return super().dates(field_name, kind, order)
+        r = self.aggregate(first=models.Min('date'), last=models.Max('date'))
+        if r['first'] is None:
+            return []
+        result = []
+        d = r['first'].replace(month=1 if kind == 'year' else r['first'].month, day=1)
+        while d <= r['last']:
+            if kind == 'year':
+                nxt = d.replace(year=d.year+1)
+            else:
+                nxt = (d + datetime.timedelta(days=32)).replace(day=1)
+            if self.filter(date__gte=d, date__lt=nxt).exists():
+                result.append(d)
+            d = nxt
+        return result if order == 'ASC' else result[::-1]
+
+
+class AccountRec(Owned):
 
     class Meta:
         verbose_name = '账户收支'
         verbose_name_plural = '账户收支'
+        indexes = [
+            models.Index(fields=['owner', 'date']),
+            models.Index(fields=['owner', 'cat', 'date']),
+            models.Index(fields=['acct', 'date']),
+        ]
 
     acct = models.ForeignKey(Account, verbose_name='账户',
                              on_delete=models.PROTECT, blank=True, null=True)
@@ -125,15 +299,44 @@ class AccountRec(models.Model):
     value = models.DecimalField('金额', max_digits=16, decimal_places=2)
     comment = models.CharField('注释', max_length=200, blank=True, null=True)
 
+    objects = AccountRecQuerySet.as_manager()
+
     def __str__(self):
         return f'{self.acct}({self.date})'
 
+    def posting(self):
+        if not self.acct_id:
+            return
+        delta = self.value if self.cat.cat == 1 else -self.value
+        return self.acct_id, self.date, delta
+
+    def save(self, *args, **kwargs):
+        from . import ledger
+        if self.owner_id is None and self.acct_id:
+            self.owner_id = self.acct.owner_id
+        with ledger.writing(self.owner_id):
+            old = AccountRec.objects.filter(pk=self.pk).first() if self.pk else None
+            r = super().save(*args, **kwargs)
+            ledger.repost(old and old.posting(), self.posting())
+        return r
+
+    def delete(self, *args, **kwargs):
+        from . import ledger
+        old = self.posting()
+        with ledger.writing(self.owner_id):
+            r = super().delete(*args, **kwargs)
+            ledger.repost(old, None)
+        return r
 
-class Risk(models.Model):
+
+class Risk(Owned):
 
     class Meta:
         verbose_name = '风险级别'
         verbose_name_plural = '风险级别'
+        indexes = [
+            models.Index(fields=['owner', 'name']),
+        ]
 
     name = models.CharField('名称', max_length=20)
 
@@ -141,11 +344,21 @@ class Risk(models.Model):
         return self.name
 
 
-class InvProj(models.Model):
+deferred_projs = contextvars.ContextVar('deferred_projs', default=frozenset())
+
+
+class InvProj(Owned):
 
     class Meta:
         verbose_name = '投资项目'
         verbose_name_plural = '投资项目'
+        indexes = [
+            models.Index(fields=['owner', 'isopen']),
+            models.Index(fields=['owner', 'cat', 'isopen']),
+            models.Index(fields=['owner', 'profit']),
+            models.Index(fields=['owner', 'profit_rate']),
+            models.Index(fields=['owner', 'mkt_value']),
+        ]
 
     name = models.CharField('名称', max_length=100)
     code = models.CharField('代码', max_length=50, blank=True, null=True)
@@ -162,6 +375,12 @@ class InvProj(models.Model):
     quote_id = models.CharField('查询代号', max_length=500, blank=True, null=True)
     current_price = models.DecimalField('现价', max_digits=16, decimal_places=4,
                                         blank=True, null=True)
+    COST_METHOD_CHOICES = (
+        (1, '先进先出'),
+        (2, '移动平均'),
+    )
+    cost_method = models.IntegerField('成本计算', choices=COST_METHOD_CHOICES,
+                                      default=1)
     buy_amount = models.DecimalField(max_digits=16, decimal_places=4, null=True)
     sell_amount = models.DecimalField(max_digits=16, decimal_places=4, null=True)
     amount = models.DecimalField(max_digits=16, decimal_places=4, null=True)
@@ -173,30 +392,63 @@ class InvProj(models.Model):
                                     null=True)
     irr = models.DecimalField('年化率', max_digits=16, decimal_places=4, null=True)
     local_irr = models.DecimalField('本币年化率', max_digits=16, decimal_places=4, null=True)
+    # 以下三列由update_values在保存时算出，admin和报表可以直接在SQL里排序和过滤。
+    mkt_value = models.DecimalField('市值', max_digits=16, decimal_places=2,
+                                    null=True)
+    profit = models.DecimalField('净值', max_digits=16, decimal_places=2, null=True)
+    profit_rate = models.DecimalField('未实现收益率', max_digits=16,
+                                      decimal_places=4, null=True)
     comment = models.CharField('注释', max_length=200, blank=True, null=True)
 
     def __str__(self):
         return f'{self.name}'
 
+    def save(self, *args, **kwargs):
+        if self.owner_id is None:
+            self.owner_id = self.acct.owner_id
+        self.update_values()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {
+                'mkt_value', 'profit', 'profit_rate'}
+        return super().save(*args, **kwargs)
+
+    # 存续并且有现价的项目按现价计市值，其他的市值为0，净值就是收回的钱减去投入。
+    def update_values(self):
+        value = self.value or 0
+        self.mkt_value = decimal.Decimal(0)
+        self.profit_rate = None
+        if self.isopen and self.current_price and self.amount is not None:
+            self.mkt_value = (self.amount*self.current_price).quantize(
+                decimal.Decimal('0.01'))
+            if value:
+                self.profit_rate = (100*self.mkt_value/value - 100).quantize(
+                    decimal.Decimal('0.0001'))
+        self.profit = self.mkt_value - value
+
+    # 请求内已经加载了组合快照时从快照里取账户，不再逐行查询账户、银行和币种。
+    def account(self):
+        from . import portfolio
+        pf = portfolio.current(self.owner_id)
+        return (pf and pf.accts.get(self.acct_id)) or self.acct
+
     def currency(self):
-        return self.acct.currency
+        return self.account().currency
     currency.short_description = '币种'
 
     def bank(self):
+        bank = self.account().bank
         return format_html(
             '<a href="/admin/inv/account/?bank__id__exact={bank_id}">{bank}</a>',
-            bank_id=self.acct.bank.id, bank=self.acct.bank)
+            bank_id=bank.id, bank=bank)
     bank.short_description = '银行'
 
     def net_value(self):
-        value = -self.value
-        if self.isopen and self.current_price:
-            value += self.amount*self.current_price
         return format_html(
             '<a href="{link}">{value}</a>',
             link=reverse('inv:proj_stat', kwargs={'projid': self.id}),
-            value='{0:0.2f}'.format(value))
+            value='{0:0.2f}'.format(self.profit or 0))
     net_value.short_description = '净值'
+    net_value.admin_order_field = 'profit'
 
     def buy_price(self):
         if self.buy_amount:
@@ -218,14 +470,69 @@ class InvProj(models.Model):
         return 100*income/self.buy_value - 100
 
     def net_value_rate(self):
-        if self.isopen and self.current_price and self.value:
-            return 100*(self.amount*self.current_price)/self.value - 100
+        return self.profit_rate
+
+    def lot_book(self):
+        try:
+            return self.lotbook
+        except ObjectDoesNotExist:
+            return None
+
+    # 按批次匹配后，卖出收入减去对应买入成本，不含分红。
+    def realized_gain(self):
+        lb = self.lot_book()
+        if lb:
+            return lb.realized
+    realized_gain.short_description = '已实现收益'
+
+    def unrealized_gain(self):
+        lb = self.lot_book()
+        if lb and self.isopen and self.current_price:
+            return lb.amount*self.current_price - lb.cost
+    unrealized_gain.short_description = '未实现收益'
+
+    def open_lots(self):
+        from . import lots
+        lb = self.lot_book()
+        if not lb:
+            return []
+        return [(date, amount, cost, cost/amount if amount else None)
+                for date, amount, cost in lots.book_of(lb).lots()]
+
+    # 批量修改记录时（例如admin的inline），每条记录保存时不再重算统计，
+    # 全部保存完后重建一次持仓批次和统计数据。
+    # 按id记录，同一个项目在不同的实例上也能识别出来。
+    @contextlib.contextmanager
+    def deferred_stats(self):
+        token = deferred_projs.set(deferred_projs.get() | {self.id})
+        try:
+            yield
+        finally:
+            deferred_projs.reset(token)
+        self.recompute()
+
+    def stats_deferred(self):
+        return self.id in deferred_projs.get()
+
+    # 重建持仓批次和统计。拿到写锁之后重新读一次项目，
+    # 统计基于最新的记录，保存时也不会覆盖别人刚写入的修改。
+    # 账户余额和快照是F()表达式的原地加减（见ledger.post），项目统计不是：
+    # IRR要用fsolve对全部记录求解，起止日期和持仓批次也依赖记录的日期和顺序，
+    # 都不能写成对旧值的增量。这里的先读后写靠写锁串行，sqlite同一时刻
+    # 本来就只有一个写事务，串行不会让并发的写入变慢。
+    def recompute(self):
+        from . import ledger, lots
+        with ledger.writing(self.owner_id):
+            self.refresh_from_db()
+            lots.rebuild(self)
+            self.update_from_rec()
 
     def update_from_rec(self):
         self.buy_amount, self.sell_amount = 0, 0
         self.buy_value, self.sell_value = 0, 0
         self.dividends = 0
-        for r in self.invrec_set.all():
+        recs = list(self.invrec_set.all())
+        for r in recs:
             if r.cat == 1:
                 self.buy_amount += r.amount
                 self.buy_value += r.value
@@ -237,12 +544,12 @@ class InvProj(models.Model):
         self.amount = self.buy_amount - self.sell_amount
         self.value = self.buy_value - self.sell_value - self.dividends
 
-        if self.invrec_set.count():
-            self.start = min((r.date for r in self.invrec_set.all()))
+        if recs:
+            self.start = min((r.date for r in recs))
             if not self.isopen:
-                self.end = max((r.date for r in self.invrec_set.all()))
-            self.irr = self.calc_irr(False)
-            self.local_irr = self.calc_irr(True)
+                self.end = max((r.date for r in recs))
+            self.irr = self.calc_irr(False, recs)
+            self.local_irr = self.calc_irr(True, recs)
 
         self.save()
 
@@ -252,8 +559,10 @@ class InvProj(models.Model):
         return ((self.end or datetime.date.today())-self.start).days
     duration.short_description = '存续天数'
 
-    def calc_iotab(self, td, local):
-        for r in self.invrec_set.all():
+    def calc_iotab(self, td, local, recs=None):
+        if recs is None:
+            recs = self.invrec_set.all()
+        for r in recs:
             value = float(r.value if r.cat == 1 else -r.value)
             if local and r.rate:
                 value *= float(r.rate)
@@ -261,16 +570,19 @@ class InvProj(models.Model):
         if self.isopen and self.current_price:
             value = float(self.amount*self.current_price)
             if local:
-                value *= float(self.acct.currency.rate)
+                value *= float(self.currency().rate)
             yield 0, -value
 
-    def calc_irr(self, local):
+    def calc_irr(self, local, recs=None):
+        if recs is None:
+            recs = list(self.invrec_set.all())
         if self.isopen and self.current_price:
             td = datetime.date.today()
         else:
-            td = max((r.date for r in self.invrec_set.all()))
+            td = max((r.date for r in recs))
 
-        iotab = list(self.calc_iotab(td, local))
+        from scipy.optimize import fsolve
+        iotab = list(self.calc_iotab(td, local, recs))
         def f(r):
             return sum((value*r**dur for dur, value in iotab))
 
@@ -281,22 +593,87 @@ class InvProj(models.Model):
         if not self.quote_id or not self.cat.driver:
             return
         from . import drivers
-        try:
-            func = getattr(drivers, self.cat.driver)
-        except AttributeError:
+        func = drivers.get_driver(self.cat.driver)
+        if func is None:
             return
-        price = func(self.quote_id)
+        self.set_current_price(func(self.quote_id))
+
+    def set_current_price(self, price):
+        from . import ledger
         if price:
-            self.current_price = decimal.Decimal(price)
-            self.update_from_rec()
-            self.save()
+            with ledger.writing(self.owner_id):
+                self.refresh_from_db()
+                self.current_price = decimal.Decimal(price)
+                self.update_from_rec()
+                PriceHist.objects.update_or_create(
+                    proj=self, date=datetime.date.today(),
+                    defaults={'price': self.current_price})
+
+
+class ProjSnapshot(models.Model):
+
+    class Meta:
+        verbose_name = '项目快照'
+        verbose_name_plural = '项目快照'
+        unique_together = [('proj', 'date')]
+
+    proj = models.ForeignKey(InvProj, verbose_name='投资项目',
+                             on_delete=models.CASCADE)
+    date = models.DateField('日期')
+    value = models.DecimalField('现存价值', max_digits=16, decimal_places=2)
+
+    def __str__(self):
+        return f'{self.proj.name}({self.date})'
+
+
+# 持仓批次以定长整数数组的形式存在data里，见lots.Book。
+class LotBook(models.Model):
+
+    class Meta:
+        verbose_name = '持仓批次'
+        verbose_name_plural = '持仓批次'
+
+    proj = models.OneToOneField(InvProj, verbose_name='投资项目',
+                                on_delete=models.CASCADE, primary_key=True,
+                                related_name='lotbook')
+    method = models.IntegerField('成本计算', choices=InvProj.COST_METHOD_CHOICES)
+    date = models.DateField('最后记录日期', null=True)
+    rec_id = models.IntegerField('最后记录', null=True)
+    amount = models.DecimalField('持仓量', max_digits=16, decimal_places=4)
+    cost = models.DecimalField('持仓成本', max_digits=16, decimal_places=2)
+    realized = models.DecimalField('已实现收益', max_digits=16, decimal_places=2)
+    data = models.BinaryField('批次')
+
+    def __str__(self):
+        return f'{self.proj.name}'
+
 
+class PriceHist(models.Model):
+
+    class Meta:
+        verbose_name = '价格历史'
+        verbose_name_plural = '价格历史'
+        unique_together = [('proj', 'date')]
+
+    proj = models.ForeignKey(InvProj, verbose_name='投资项目',
+                             on_delete=models.CASCADE)
+    date = models.DateField('日期')
+    price = models.DecimalField('价格', max_digits=16, decimal_places=4)
+
+    def __str__(self):
+        return f'{self.proj.name}({self.date})'
 
-class InvRec(models.Model):
+
+class InvRec(Owned):
 
     class Meta:
         verbose_name = '投资记录'
         verbose_name_plural = '投资记录'
+        indexes = [
+            models.Index(fields=['owner', 'date']),
+            models.Index(fields=['owner', 'proj', 'date']),
+            models.Index(fields=['proj', 'date']),
+        ]
 
     CAT_CHOICES = (
         (1, '买'),
@@ -332,17 +709,109 @@ class InvRec(models.Model):
              and self.value is not None and self.commission is not None:
             self.price = (self.value-self.commission) / self.amount
 
-    # 如果同时创建一个proj的多个rec，会导致update_from_rec被执行多次。
-    # 暂时不管了。未来可能通过flag解决。
+    def posting(self):
+        delta = -self.value if self.cat == 1 else self.value
+        return self.proj.acct_id, self.date, delta
+
+    # 对项目现存价值（成本）的影响，正好和账户相反。
+    def proj_posting(self):
+        delta = self.value if self.cat == 1 else -self.value
+        return self.proj_id, self.date, delta
+
+    # 同时修改一个proj的多个rec时，用proj.deferred_stats()包起来，
+    # 避免update_from_rec被执行多次。
     def save(self, *args, **kwargs):
+        from . import ledger, lots
         self.auto_complete()
-        if not self.pk:
-            self.proj.acct.value -= (self.value if self.cat == 1 else -self.value)
-        r = super().save(*args, **kwargs)
-        self.proj.update_from_rec()
+        if self.owner_id is None:
+            self.owner_id = self.proj.owner_id
+        with ledger.writing(self.owner_id):
+            old = InvRec.objects.filter(pk=self.pk).first() if self.pk else None
+            r = super().save(*args, **kwargs)
+            ledger.repost(old and old.posting(), self.posting())
+            ledger.repost(old and old.proj_posting(), self.proj_posting(),
+                          ledger.post_proj)
+            if old is not None and old.proj_id != self.proj_id:
+                old.proj.recompute()
+            if self.proj.stats_deferred():
+                return r
+            if old is None:
+                # 追加的记录只处理这一条，同样先重新读项目。
+                self.proj.refresh_from_db()
+                lots.post(self.proj, self)
+                self.proj.update_from_rec()
+            else:
+                self.proj.recompute()
         return r
 
     def delete(self, *args, **kwargs):
-        r = super().delete(*args, **kwargs)
-        self.proj.update_from_rec()
+        from . import ledger
+        old, old_proj = self.posting(), self.proj_posting()
+        with ledger.writing(self.owner_id):
+            r = super().delete(*args, **kwargs)
+            ledger.repost(old, None)
+            ledger.repost(old_proj, None, ledger.post_proj)
+            if not self.proj.stats_deferred():
+                self.proj.recompute()
         return r
+
+
+class Job(Owned):
+
+    class Meta:
+        verbose_name = '后台任务'
+        verbose_name_plural = '后台任务'
+        indexes = [
+            models.Index(fields=['status', 'id']),
+            models.Index(fields=['owner', 'created']),
+        ]
+
+    WAITING, RUNNING, DONE, FAILED = range(4)
+    STATUS_CHOICES = (
+        (WAITING, '等待'),
+        (RUNNING, '运行'),
+        (DONE, '完成'),
+        (FAILED, '失败'),
+    )
+
+    task = models.CharField('任务', max_length=40)
+    args = models.JSONField('参数', default=dict)
+    status = models.IntegerField('状态', choices=STATUS_CHOICES, default=WAITING)
+    progress = models.IntegerField('进度', default=0)
+    total = models.IntegerField('总数', default=0)
+    created = models.DateTimeField('创建时间', auto_now_add=True)
+    started = models.DateTimeField('开始时间', blank=True, null=True)
+    finished = models.DateTimeField('结束时间', blank=True, null=True)
+    # 运行中的任务由worker定期更新，太久没有更新说明worker已经退出了。
+    heartbeat = models.DateTimeField('心跳', blank=True, null=True)
+    error = models.TextField('错误', blank=True, default='')
+
+    def __str__(self):
+        return f'{self.task}({self.id})'
+
+    def duration(self):
+        if not self.started:
+            return None
+        return (self.finished or timezone.now()) - self.started
+    duration.short_description = '耗时'
+
+
+# 归档的原始记录。原来的行从热表里删掉，换成按月汇总的记录，rollup指向汇总记录。
+# 恢复时删除汇总记录，按原主键插回原始记录。
+class Archive(Owned):
+
+    class Meta:
+        verbose_name = '归档记录'
+        verbose_name_plural = '归档记录'
+        indexes = [
+            models.Index(fields=['owner', 'model', 'rollup']),
+            models.Index(fields=['owner', 'date']),
+        ]
+
+    model = models.CharField('模型', max_length=20)
+    rollup = models.IntegerField('汇总记录')
+    date = models.DateField('日期')
+    data = models.JSONField('数据', encoder=DjangoJSONEncoder)
+
+    def __str__(self):
+        return f'{self.model}({self.data.get("pk")})'
@@ -0,0 +1,203 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import Currency, InvProj, InvRec, PriceHist, RateHist, Version
+
+
+CACHE_TIMEOUT = 3600
+
+
+def observations(rows, index, columns):
+    # rows: (列, 日期, 值)。同一天多次观测取最后一次。
+    if not rows:
+        return pd.DataFrame(index=index, columns=columns, dtype=float)
+    df = pd.DataFrame(rows, columns=['col', 'date', 'value'])
+    df['date'] = pd.to_datetime(df['date'])
+    df['value'] = df['value'].astype(float)
+    tab = df.pivot_table(index='date', columns='col', values='value',
+                         aggfunc='last')
+    # 窗口之前的观测值也要参与前向填充。
+    tab = tab.reindex(tab.index.union(index)).sort_index().ffill()
+    return tab.reindex(index=index, columns=columns)
+
+
+def twr(nav, flow):
+    # 资金流视为当日收盘时发生：r = (NAV_t - CF_t) / NAV_{t-1} - 1。
+    prev = nav.shift(1)
+    r = ((nav - flow) / prev - 1).where(prev > 0, 0.0).fillna(0.0)
+    index = (1 + r).cumprod()
+    drawdown = index / index.cummax() - 1
+    return index, drawdown
+
+
+class NavResult(object):
+
+    def __init__(self, start, end, nav, flow, index, drawdown, labels):
+        self.start = start
+        self.end = end
+        self.nav = nav
+        self.flow = flow
+        self.index = index
+        self.drawdown = drawdown
+        self.labels = labels
+
+    def summary(self):
+        days = max((self.end - self.start).days, 1)
+        total = self.index.iloc[-1] - 1
+        df = pd.DataFrame({
+            '名称': [self.labels[c] for c in self.nav.columns],
+            '净值': self.nav.iloc[-1],
+            '资金净流入': self.flow.sum(),
+            '时间加权收益率': 100*total,
+            '年化收益率': 100*((1+total)**(365/days) - 1),
+            '最大回撤': 100*self.drawdown.min(),
+        })
+        df.index = pd.MultiIndex.from_tuples(df.index, names=['层级', 'id'])
+        return df
+
+    def monthly(self, level):
+        cols = [c for c in self.nav.columns if c[0] == level]
+        df = self.nav[cols]
+        df = df.groupby(df.index.to_period('M')).last()
+        df.columns = [self.labels[c] for c in cols]
+        df.index = df.index.astype(str)
+        return df
+
+
+class NavData(object):
+
+    def __init__(self, projs, recs, prices, rates, curs):
+        self.projs = projs
+        self.recs = recs
+        self.prices = prices
+        self.rates = rates
+        self.curs = curs
+
+
+def load(start, end, owner):
+    projs = list(InvProj.objects.owned_by(owner).select_related('acct', 'cat', 'risk').filter(
+        Q(isopen=True) | Q(end__gte=start) | Q(end__isnull=True)).exclude(
+            start__gt=end))
+    ids = [p.id for p in projs]
+    recs = list(InvRec.objects.filter(proj_id__in=ids, date__lte=end).values_list(
+        'proj_id', 'date', 'cat', 'amount', 'price', 'value', 'rate'))
+    prices = list(PriceHist.objects.filter(
+        proj_id__in=ids, date__lte=end).values_list('proj_id', 'date', 'price'))
+    rates = list(RateHist.objects.filter(date__lte=end).values_list(
+        'currency_id', 'date', 'rate'))
+    curs = list(Currency.objects.all())
+    return NavData(projs, recs, prices, rates, curs)
+
+
+def build(start, end, data):
+    days = pd.date_range(start, end, freq='D')
+    today = pd.Timestamp(datetime.date.today())
+    projs, recs = data.projs, data.recs
+    ids = [p.id for p in projs]
+
+    rec = pd.DataFrame(recs, columns=['proj', 'date', 'cat', 'amount',
+                                      'price', 'value', 'rate'])
+    rec['date'] = pd.to_datetime(rec['date'])
+    for c in ('amount', 'price', 'value', 'rate'):
+        rec[c] = rec[c].astype(float)
+    sign = np.select([rec['cat'] == 1, rec['cat'] == 2], [1.0, -1.0], 0.0)
+    rec['damount'] = sign * rec['amount']
+    # 分红视作资金流出。
+    rec['flow'] = np.where(rec['cat'] == 1, rec['value'], -rec['value'])
+    # 窗口之前的记录并入第一天，用来得到期初持仓。
+    rec['day'] = rec['date'].clip(lower=days[0])
+
+    def daily(col):
+        tab = rec.pivot_table(index='day', columns='proj', values=col,
+                              aggfunc='sum')
+        return tab.reindex(index=days, columns=ids).fillna(0.0)
+
+    amount = daily('damount').cumsum()
+    cost = daily('flow').cumsum()
+    flow = daily('flow')
+    flow.iloc[0] = 0.0
+
+    price_obs = [(r[0], r[1], r[4]) for r in recs
+                 if r[2] in (1, 2) and r[4] is not None]
+    price_obs.extend(data.prices)
+    if today <= days[-1]:
+        price_obs.extend((p.id, today, p.current_price) for p in projs
+                         if p.isopen and p.current_price)
+    price = observations(price_obs, days, ids)
+
+    curs = {c.id: c for c in data.curs}
+    proj_cur = {p.id: p.acct.currency_id for p in projs}
+    rate_obs = [(proj_cur[r[0]], r[1], r[6]) for r in recs if r[6]]
+    rate_obs.extend(data.rates)
+    rate_obs.extend((c.id, min(today, days[-1]), c.rate) for c in curs.values()
+                    if c.name != 'CNY')
+    rates = observations(rate_obs, days, list(curs))
+    for c in curs.values():
+        if c.name == 'CNY':
+            rates[c.id] = 1.0
+    rates = rates.bfill().fillna(1.0)
+    fx = rates[[proj_cur[i] for i in ids]]
+    fx.columns = ids
+
+    # 没有任何价格的项目（例如存款）以成本计价。
+    value = (amount * price).where(price.notna(), cost)
+    # 已结束的项目在结束日之后价值归零。
+    for p in projs:
+        if not p.isopen and p.end:
+            value.loc[value.index > pd.Timestamp(p.end), p.id] = 0.0
+    nav = value * fx
+    flow = flow * fx
+
+    labels = {('total', 0): '总计'}
+    groups = {'total': {i: 0 for i in ids}, 'cat': {}, 'risk': {}, 'proj': {}}
+    for p in projs:
+        groups['proj'][p.id] = p.id
+        groups['cat'][p.id] = p.cat_id
+        groups['risk'][p.id] = p.risk_id
+        labels[('proj', p.id)] = p.name
+        labels[('cat', p.cat_id)] = p.cat.name
+        labels[('risk', p.risk_id)] = p.risk.name
+
+    def grouped(df):
+        parts = []
+        for level in ('total', 'cat', 'risk', 'proj'):
+            g = df.T.groupby(groups[level]).sum().T
+            g.columns = pd.MultiIndex.from_product([[level], g.columns])
+            parts.append(g)
+        return pd.concat(parts, axis=1)
+
+    nav = grouped(nav)
+    flow = grouped(flow)
+    index, drawdown = twr(nav, flow)
+    return NavResult(start, end, nav, flow, index, drawdown, labels)
+
+
+def compute(start, end, owner):
+    return build(start, end, load(start, end, owner))
+
+
+def cache_key(start, end, owner):
+    version = Version.of(owner.id)
+    return f'inv:nav:{owner.id}:{start}:{end}:{version}'
+
+
+def get_nav(start, end, owner):
+    key = cache_key(start, end, owner)
+    result = cache.get(key)
+    if result is None:
+        result = compute(start, end, owner)
+        cache.set(key, result, CACHE_TIMEOUT)
+    return result
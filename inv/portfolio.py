@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+import asyncio
+import contextlib
+import contextvars
+import functools
+
+from .models import Currency, Category, Bank, Account, Risk, InvProj
+
+
+# 一个用户的币种、银行、账户、类别、风险级别和存续项目，固定6次查询读进内存，
+# 对象之间直接引用，报表、admin列和IRR不再逐个走外键查询。
+
+class Node(object):
+    __slots__ = ('id', 'name')
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+
+class Cur(Node):
+    __slots__ = ('rate',)
+
+    def __init__(self, id, name, rate):
+        super().__init__(id, name)
+        self.rate = rate
+
+
+class Cat(Node):
+    __slots__ = ('cat', 'driver')
+
+    def __init__(self, id, name, cat, driver):
+        super().__init__(id, name)
+        self.cat = cat
+        self.driver = driver
+
+
+class Acct(Node):
+    __slots__ = ('bank', 'currency', 'cat', 'value')
+
+    def __init__(self, id, name, bank, currency, cat, value):
+        super().__init__(id, name)
+        self.bank = bank
+        self.currency = currency
+        self.cat = cat
+        self.value = value
+
+    def __str__(self):
+        return f'{self.bank.name}-{self.name}'
+
+
+class Proj(Node):
+    __slots__ = ('acct', 'cat', 'risk', 'amount', 'value', 'current_price')
+
+    def __init__(self, id, name, acct, cat, risk, amount, value, current_price):
+        super().__init__(id, name)
+        self.acct = acct
+        self.cat = cat
+        self.risk = risk
+        self.amount = amount
+        self.value = value
+        self.current_price = current_price
+
+
+class Portfolio(object):
+    __slots__ = ('owner_id', 'curs', 'banks', 'cats', 'risks', 'accts', 'projs')
+
+    def __init__(self, owner_id):
+        self.owner_id = owner_id
+
+    def categories(self, cat=None):
+        return [c for c in self.cats.values() if cat is None or c.cat == cat]
+
+    def values(self):
+        # {类别id: {币种名: 金额}}，账户余额加上存续项目的成本。
+        result = {}
+        for a in self.accts.values():
+            values = result.setdefault(a.cat.id, {})
+            values[a.currency.name] = a.value + values.get(a.currency.name, 0)
+        for p in self.projs.values():
+            values = result.setdefault(p.cat.id, {})
+            cur = p.acct.currency.name
+            values[cur] = p.value + values.get(cur, 0)
+        return result
+
+
+def load(owner_id):
+    pf = Portfolio(owner_id)
+    pf.curs = {r[0]: Cur(*r) for r in Currency.objects.order_by('id').values_list(
+        'id', 'name', 'rate')}
+    pf.banks = {r[0]: Node(*r) for r in Bank.objects.filter(
+        owner_id=owner_id).order_by('id').values_list('id', 'name')}
+    pf.cats = {r[0]: Cat(*r) for r in Category.objects.filter(
+        owner_id=owner_id).order_by('id').values_list('id', 'name', 'cat', 'driver')}
+    pf.risks = {r[0]: Node(*r) for r in Risk.objects.filter(
+        owner_id=owner_id).order_by('id').values_list('id', 'name')}
+    pf.accts = {}
+    for i, name, bank, cur, cat, value in Account.objects.filter(
+            owner_id=owner_id).order_by('id').values_list(
+                'id', 'name', 'bank_id', 'currency_id', 'cat_id', 'value'):
+        pf.accts[i] = Acct(i, name, pf.banks[bank], pf.curs[cur], pf.cats[cat], value)
+    pf.projs = {}
+    for i, name, acct, cat, risk, amount, value, price in InvProj.objects.filter(
+            owner_id=owner_id, isopen=True).order_by('id').values_list(
+                'id', 'name', 'acct_id', 'cat_id', 'risk_id', 'amount', 'value',
+                'current_price'):
+        pf.projs[i] = Proj(i, name, pf.accts[acct], pf.cats[cat], pf.risks[risk],
+                           amount, value, price)
+    return pf
+
+
+# 请求范围内按用户缓存，值是可变的dict，sync_to_async的线程里加载的也能共享。
+loaded = contextvars.ContextVar('portfolio', default=None)
+
+
+@contextlib.contextmanager
+def scope():
+    token = loaded.set({})
+    try:
+        yield
+    finally:
+        loaded.reset(token)
+
+
+def scoped(view):
+    if asyncio.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def inner(*args, **kwargs):
+            with scope():
+                return await view(*args, **kwargs)
+    else:
+        @functools.wraps(view)
+        def inner(*args, **kwargs):
+            with scope():
+                return view(*args, **kwargs)
+    return inner
+
+
+def current(owner_id):
+    # 不在请求范围内时返回None，调用方走原来的ORM查询。
+    cache = loaded.get()
+    if cache is None or owner_id is None:
+        return None
+    pf = cache.get(owner_id)
+    if pf is None:
+        pf = cache[owner_id] = load(owner_id)
+    return pf
+
+
+def get(owner):
+    return current(owner.id) or load(owner.id)
@@ -0,0 +1,195 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from .models import Currency, InvProj
+from . import nav
+
+
+# 历史不足时使用的年化假设。
+DEFAULT_MU = 0.0
+DEFAULT_SIGMA = 0.2
+MIN_MONTHS = 6
+BATCH = 5000
+
+
+class Bucket(object):
+
+    def __init__(self, key, label, value, projs):
+        self.key = key
+        self.label = label
+        self.value = value
+        self.projs = projs
+
+
+# 还没有记录的项目统计字段都是空的，按0计。
+def market_value(proj):
+    if proj.current_price and proj.amount:
+        return proj.amount*proj.current_price
+    return proj.value or 0
+
+
+def buckets(owner):
+    # 开放项目按(风险级别, 类别, 币种)分组，以CNY计价。
+    rates = {c.id: c.rate for c in Currency.objects.all()}
+    result = {}
+    for p in InvProj.objects.owned_by(owner).select_related(
+            'acct__currency', 'cat', 'risk').filter(isopen=True):
+        cur = p.acct.currency
+        rate = 1 if cur.name == 'CNY' else rates[cur.id]
+        key = (p.risk_id, p.cat_id, cur.id)
+        if key not in result:
+            label = f'{p.risk.name}/{p.cat.name}/{cur.name}'
+            result[key] = Bucket(key, label, 0.0, [])
+        result[key].value += float(market_value(p)*rate)
+        result[key].projs.append(p.id)
+    return [b for b in result.values() if b.value > 0]
+
+
+def monthly_returns(result, bks):
+    # 用净值曲线按月算各组的收益率，资金流视为月末发生。
+    navs = result.nav['proj']
+    flow = result.flow['proj']
+    months = navs.index.to_period('M')
+    cols = {}
+    for b in bks:
+        ids = [i for i in b.projs if i in navs.columns]
+        if not ids:
+            continue
+        v = navs[ids].sum(axis=1).groupby(months).last()
+        f = flow[ids].sum(axis=1).groupby(months).sum()
+        prev = v.shift(1)
+        cols[b.label] = ((v - f) / prev - 1).where(prev > 0)
+    return pd.DataFrame(cols)
+
+
+def estimate(bks, returns):
+    # 年化的期望收益和协方差，样本太少的组用默认假设，和其他组不相关。
+    n = len(bks)
+    mu = np.full(n, DEFAULT_MU)
+    sigma = np.full(n, DEFAULT_SIGMA)
+    corr = np.eye(n)
+    estimated = np.zeros(n, dtype=bool)
+    for i, b in enumerate(bks):
+        if b.label in returns and returns[b.label].count() >= MIN_MONTHS:
+            s = returns[b.label]
+            mu[i] = 12*s.mean()
+            sigma[i] = np.sqrt(12)*s.std()
+            estimated[i] = sigma[i] > 0
+    if not estimated.any():
+        return mu, sigma, corr, estimated
+    labels = [b.label for b in bks]
+    c = returns.reindex(columns=labels).corr(min_periods=MIN_MONTHS).values
+    both = np.outer(estimated, estimated)
+    corr = np.where(both & ~np.isnan(c), c, corr)
+    np.fill_diagonal(corr, 1.0)
+    return mu, sigma, corr, estimated
+
+
+def cholesky(cov):
+    # 估计出来的相关矩阵未必正定，把负特征值截掉。
+    try:
+        return np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        w, v = np.linalg.eigh(cov)
+        return v * np.sqrt(np.clip(w, 0, None))
+
+
+class RiskResult(object):
+
+    def __init__(self, bks, mu, sigma, source, final, drawdown, target,
+                 horizon, paths):
+        self.bks = bks
+        self.mu = mu
+        self.sigma = sigma
+        self.source = source
+        self.final = final
+        self.drawdown = drawdown
+        self.target = target
+        self.horizon = horizon
+        self.paths = paths
+        self.value = sum(b.value for b in bks)
+
+    def allocation(self):
+        df = pd.DataFrame({
+            '组合': [b.label for b in self.bks],
+            '市值': [b.value for b in self.bks],
+            '占比': [100*b.value/self.value for b in self.bks],
+            '年化收益': 100*self.mu,
+            '年化波动': 100*self.sigma,
+            '来源': self.source,
+        })
+        return df.set_index('组合')
+
+    def summary(self, levels=(0.95, 0.99)):
+        rows = [('当前市值', self.value),
+                ('期末市值中位数', np.median(self.final))]
+        for lv in levels:
+            q = np.quantile(self.final, 1-lv)
+            tail = self.final[self.final <= q]
+            rows.append((f'VaR {100*lv:g}%', self.value - q))
+            rows.append((f'CVaR {100*lv:g}%', self.value - tail.mean()))
+        for p in (50, 95, 99):
+            rows.append((f'最大回撤 P{p} (%)',
+                         100*np.percentile(self.drawdown, p)))
+        if self.target:
+            rows.append(('目标市值', self.target))
+            rows.append(('达到目标概率 (%)',
+                         100*(self.final >= self.target).mean()))
+        return pd.DataFrame(rows, columns=['指标', '数值']).set_index('指标')
+
+
+def simulate(bks, mu, sigma, corr, horizon, steps, paths, seed=None):
+    # 几何布朗运动，按批生成路径，内存只和BATCH*steps*组数有关。
+    rng = np.random.default_rng(seed)
+    values = np.array([b.value for b in bks])
+    dt = horizon/steps
+    chol = cholesky(corr * np.outer(sigma, sigma) * dt)
+    drift = (mu - 0.5*sigma**2) * dt
+    total = values.sum()
+    final = np.empty(paths)
+    drawdown = np.empty(paths)
+    for start in range(0, paths, BATCH):
+        n = min(BATCH, paths-start)
+        z = rng.standard_normal((n, steps, len(bks)))
+        growth = np.exp(np.cumsum(z @ chol.T + drift, axis=1))
+        path = growth @ values
+        peak = np.maximum.accumulate(np.maximum(path, total), axis=1)
+        final[start:start+n] = path[:, -1]
+        drawdown[start:start+n] = -(path/peak - 1).min(axis=1)
+    return final, drawdown
+
+
+def load(owner, years=3):
+    end = datetime.date.today()
+    start = end - datetime.timedelta(days=365*years)
+    bks = buckets(owner)
+    if not bks:
+        return bks, pd.DataFrame()
+    return bks, monthly_returns(nav.get_nav(start, end, owner), bks)
+
+
+def run(bks, returns, horizon=1.0, steps=12, paths=20000, target=None,
+        seed=None, assumptions=None):
+    # assumptions: {组合名: {'mu': 年化收益, 'sigma': 年化波动}}，覆盖估计值。
+    if not bks:
+        return None
+    mu, sigma, corr, estimated = estimate(bks, returns)
+    source = ['历史估计' if e else '默认假设' for e in estimated]
+    for i, b in enumerate(bks):
+        if assumptions and b.label in assumptions:
+            mu[i] = assumptions[b.label].get('mu', mu[i])
+            sigma[i] = assumptions[b.label].get('sigma', sigma[i])
+            source[i] = '指定'
+    final, drawdown = simulate(bks, mu, sigma, corr, horizon, steps, paths, seed)
+    return RiskResult(bks, mu, sigma, source, final, drawdown, target,
+                      horizon, paths)
@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+import re
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+
+# 每个模型一张FTS5表，rowid就是对象的主键，更新和删除按rowid定位。
+# 按模型名索引，迁移里的历史模型也能用。
+TABLES = {
+    'accountrec': ('inv_accountrec_fts', ('comment',)),
+    'invproj': ('inv_invproj_fts', ('name', 'comment')),
+}
+
+
+def table_of(model):
+    return TABLES[model._meta.model_name]
+
+# unicode61分词器把连续的汉字当成一个词，“三月工资”搜不到“工资”。
+# 索引和查询时都把汉字一个个拆开，查询用短语匹配相邻的字。
+CJK = re.compile(r'([぀-ヿ㐀-䶿一-鿿豈-﫿ｦ-ﾟ])')
+
+
+def split_cjk(text):
+    return CJK.sub(r' \1 ', text or '')
+
+
+def available(using='default'):
+    return connections[using].vendor == 'sqlite'
+
+
+def create(schema_editor):
+    for table, fields in TABLES.values():
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE {table} USING fts5({", ".join(fields)})')
+
+
+def drop(schema_editor):
+    for table, fields in TABLES.values():
+        schema_editor.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+def index(instance, using='default'):
+    table, fields = table_of(instance)
+    values = [split_cjk(getattr(instance, f)) for f in fields]
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'INSERT OR REPLACE INTO {table} (rowid, {", ".join(fields)}) '
+            f'VALUES (%s{", %s"*len(fields)})', [instance.pk] + values)
+
+
+def remove(instance, using='default'):
+    table, fields = table_of(instance)
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE rowid = %s', [instance.pk])
+
+
+def rebuild(model, using='default'):
+    table, fields = table_of(model)
+    rows = model._base_manager.using(using).values_list('pk', *fields).iterator()
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table}')
+        cursor.executemany(
+            f'INSERT INTO {table} (rowid, {", ".join(fields)}) '
+            f'VALUES (%s{", %s"*len(fields)})',
+            ([pk] + [split_cjk(v) for v in values] for pk, *values in rows))
+
+
+def refresh(model, pks, using='default', size=500):
+    # 批量增删之后按主键重建对应的索引行，已经删除的对象只删掉索引。
+    table, fields = table_of(model)
+    pks = list(pks)
+    with connections[using].cursor() as cursor:
+        for i in range(0, len(pks), size):
+            chunk = pks[i:i+size]
+            marks = ', '.join(['%s']*len(chunk))
+            cursor.execute(f'DELETE FROM {table} WHERE rowid IN ({marks})', chunk)
+            rows = model._base_manager.using(using).filter(pk__in=chunk).values_list(
+                'pk', *fields)
+            cursor.executemany(
+                f'INSERT INTO {table} (rowid, {", ".join(fields)}) '
+                f'VALUES (%s{", %s"*len(fields)})',
+                [[pk] + [split_cjk(v) for v in values] for pk, *values in rows])
+
+
+def parse(term):
+    # 用户输入按空格分成多个词，都要匹配。每个词作为一个短语，避免FTS5的查询语法；
+    # 以字母数字结尾的词做前缀匹配，汉字已经拆成单字，前缀匹配不影响结果。
+    phrases = []
+    for word in term.split():
+        if not any(c.isalnum() for c in word):
+            continue
+        phrase = '"' + ' '.join(split_cjk(word).split()).replace('"', '""') + '"'
+        if word[-1].isalnum():
+            phrase += '*'
+        phrases.append(phrase)
+    return ' '.join(phrases)
+
+
+def matching(model, query):
+    # 返回匹配的主键子查询，用在filter(id__in=...)里，和所有者等其他条件组合。
+    table, fields = table_of(model)
+    return RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [query])
+
+
+def search(qs, term):
+    fields = table_of(qs.model)[1]
+    if not available(qs.db):
+        q = Q()
+        for f in fields:
+            q |= Q(**{f'{f}__icontains': term})
+        return qs.filter(q)
+    query = parse(term)
+    if not query:
+        return qs.none()
+    return qs.filter(id__in=matching(qs.model, query))
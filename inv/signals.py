@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import search
+from .models import Version, PriceHist, Job, AccountRec, InvProj
+from .models import LotBook, AcctSnapshot, ProjSnapshot
+
+
+# 这些模型自己没有所有者，数据属于对应项目或账户的所有者。
+PARENTS = {
+    PriceHist: 'proj',
+    LotBook: 'proj',
+    ProjSnapshot: 'proj',
+    AcctSnapshot: 'acct',
+}
+
+
+def owner_of(instance):
+    parent = PARENTS.get(type(instance))
+    if parent is not None:
+        return getattr(instance, parent).owner_id
+    return getattr(instance, 'owner_id', None)
+
+
+# 任何数据变动都会让报表缓存失效。没有所有者的数据（汇率）影响所有人。
+# 后台任务本身不是报表数据。
+@receiver(post_save)
+@receiver(post_delete)
+def bump_version(sender, instance, **kwargs):
+    if sender._meta.app_label != 'inv' or sender in (Version, Job):
+        return
+    owner_id = owner_of(instance)
+    if owner_id is None:
+        Version.bump()
+    else:
+        Version.bump(f'owner:{owner_id}')
+
+
+# 全文索引和数据在同一个事务里更新。只更新了统计字段的保存不用重建索引。
+@receiver(post_save, sender=AccountRec)
+@receiver(post_save, sender=InvProj)
+def update_search(sender, instance, update_fields=None, using='default', **kwargs):
+    fields = search.table_of(sender)[1]
+    if not search.available(using):
+        return
+    if update_fields is not None and not set(fields) & set(update_fields):
+        return
+    search.index(instance, using)
+
+
+@receiver(post_delete, sender=AccountRec)
+@receiver(post_delete, sender=InvProj)
+def remove_search(sender, instance, using='default', **kwargs):
+    if search.available(using):
+        search.remove(instance, using)
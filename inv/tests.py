@@ -1,3 +1,882 @@
-from django.test import TestCase
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+import os
+import time
+import random
+import decimal
+import datetime
+import functools
+import tempfile
+import warnings
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+
+D = decimal.Decimal
+
+
+def in_threads(*calls):
+    # 每个(函数, 参数...)在自己的线程里执行，用自己的连接，返回各自的结果。
+    results, errors = [None]*len(calls), []
+
+    def run(i, func, args):
+        try:
+            results[i] = func(*args)
+        except BaseException as err:
+            errors.append(err)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=run, args=(i, call[0], call[1:]))
+               for i, call in enumerate(calls)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+class FileDatabaseTestCase(TransactionTestCase):
+    # 测试库在内存里，副本没法以只读方式打开同一个库。这里换成临时文件，
+    # 数据库操作都放到线程里，主线程已经打开的测试库连接不受影响。
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.saved = {alias: connections.databases[alias]['NAME']
+                      for alias in ('default', 'replica')}
+        path = os.path.join(self.tmpdir.name, 'test.sqlite3')
+        connections.databases['default']['NAME'] = path
+        connections.databases['replica']['NAME'] = f'file:{path}?mode=ro'
+        in_threads((call_command, 'migrate', '--verbosity', '0'))
+
+    def tearDown(self):
+        for alias, name in self.saved.items():
+            connections.databases[alias]['NAME'] = name
+        self.tmpdir.cleanup()
+
+
+def quiet(func):
+    # 随机数据上算IRR时fsolve经常不收敛，警告和测试无关。
+    @functools.wraps(func)
+    def inner(*args, **kwargs):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return func(*args, **kwargs)
+    return inner
+
+
+def create_owner(accounts=1, projects=0):
+    from django.contrib.auth import get_user_model
+    from inv.models import Currency, Category, Bank, Account, AccountCategory, Risk, InvProj
+    owner = get_user_model().objects.create_user('test')
+    cny = Currency.objects.create(name='CNY', rate=1)
+    cash = Category.objects.create(name='现金', cat=1, owner=owner)
+    invest = Category.objects.create(name='投资', cat=5, owner=owner)
+    bank = Bank.objects.create(name='银行', owner=owner)
+    accts = [Account.objects.create(name=f'账户{i}', bank=bank, currency=cny, cat=cash)
+             for i in range(accounts)]
+    for i in range(2):
+        AccountCategory.objects.create(name=f'收支{i}', cat=1+i, owner=owner)
+    risk = Risk.objects.create(name='风险', owner=owner)
+    for i in range(projects):
+        InvProj.objects.create(name=f'项目{i}', acct=accts[i % accounts], cat=invest,
+                               risk=risk, isopen=True, cost_method=1+i % 2)
+    return owner
+
+
+class ReplicaTest(FileDatabaseTestCase):
+
+    HOLD = 10
+    WRITES = 20
+
+    def test_write_latency_during_long_read(self):
+        # WAL模式下，只读连接上长时间的读事务不阻塞写入，读事务一直看到开始时的数据。
+        from inv.models import Account, AccountCategory, AccountRec
+        in_threads((create_owner,))
+        holding, done = threading.Event(), threading.Event()
+
+        def reader():
+            with transaction.atomic(using='replica'):
+                with connections['replica'].cursor() as cursor:
+                    cursor.execute('SELECT count(*) FROM inv_accountrec')
+                    before = cursor.fetchone()[0]
+                    holding.set()
+                    done.wait(self.HOLD)
+                    cursor.execute('SELECT count(*) FROM inv_accountrec')
+                    return before, cursor.fetchone()[0], done.is_set()
+
+        def writer():
+            holding.wait(self.HOLD)
+            acct, cat = Account.objects.get(), AccountCategory.objects.get(cat=1)
+            latency = []
+            for i in range(self.WRITES):
+                start = time.perf_counter()
+                AccountRec.objects.create(acct=acct, cat=cat, value=decimal.Decimal(i),
+                                          date=datetime.date.today())
+                latency.append(time.perf_counter() - start)
+            done.set()
+            return latency
+
+        (before, after, released), latency = in_threads((reader,), (writer,))
+        # 写入全部完成时读事务还没有结束。
+        self.assertTrue(released)
+        self.assertLess(max(latency), 1)
+        self.assertEqual((before, after), (0, 0))
+        self.assertEqual(in_threads((AccountRec.objects.count,)), [self.WRITES])
+
+
+class BookTest(TestCase):
+
+    def book(self, method, rows):
+        from inv import lots
+        return lots.fields(lots.replay(method, rows))
+
+    def test_fifo(self):
+        from inv import lots
+        book = lots.replay(lots.FIFO, [
+            (datetime.date(2024, 1, 1), 1, D(10), D(1000)),
+            (datetime.date(2024, 2, 1), 1, D(10), D(1200)),
+            (datetime.date(2024, 3, 1), 2, D(15), D(2000)),
+        ])
+        self.assertEqual(list(book.lots()), [(datetime.date(2024, 2, 1), D(5), D(600))])
+        self.assertEqual(lots.fields(book)['realized'], D(400))
+
+    def test_average(self):
+        from inv import lots
+        book = lots.replay(lots.AVERAGE, [
+            (datetime.date(2024, 1, 1), 1, D(10), D(1000)),
+            (datetime.date(2024, 2, 1), 1, D(10), D(1200)),
+            (datetime.date(2024, 3, 1), 2, D(15), D(2000)),
+            (datetime.date(2024, 3, 2), 3, D(0), D(50)),
+        ])
+        self.assertEqual(list(book.lots()), [(datetime.date(2024, 1, 1), D(5), D(550))])
+        self.assertEqual(lots.fields(book)['realized'], D(350))
+
+    def test_oversell(self):
+        # 超出持仓的部分按零成本处理，卖光之后重新买入开始新的批次。
+        from inv import lots
+        rows = [
+            (datetime.date(2024, 1, 1), 1, D(10), D(1000)),
+            (datetime.date(2024, 2, 1), 2, D(15), D(1800)),
+        ]
+        fields = self.book(lots.FIFO, rows)
+        self.assertEqual((fields['amount'], fields['cost'], fields['realized']),
+                         (D(0), D(0), D(800)))
+        rows.append((datetime.date(2024, 3, 1), 1, D(2), D(300)))
+        self.assertEqual(list(lots.replay(lots.AVERAGE, rows).lots()),
+                         [(datetime.date(2024, 3, 1), D(2), D(300))])
+
+    def test_int_and_float_inputs(self):
+        from inv import lots
+        rows = [
+            (datetime.date(2024, 1, 1), 1, D(100), D('1050')),
+            (datetime.date(2024, 2, 1), 2, D('10.5'), D('120.75')),
+        ]
+        loose = [
+            (datetime.date(2024, 1, 1), 1, 100, 1050),
+            (datetime.date(2024, 2, 1), 2, 10.5, 120.75),
+        ]
+        for method in (lots.FIFO, lots.AVERAGE):
+            self.assertEqual(self.book(method, loose), self.book(method, rows))
+
+    def test_tobytes(self):
+        from inv import lots
+        book = lots.replay(lots.FIFO, [
+            (datetime.date(2024, 1, d), 1, D(d), D(10*d)) for d in range(1, 10)])
+        book.sell(lots.to_units(D(12), lots.AMOUNT_UNIT), 0)
+        book.compact()
+        self.assertEqual(list(lots.Book(lots.FIFO, book.tobytes()).lots()),
+                         list(book.lots()))
+
+    @quiet
+    def test_invrec_with_int_fields(self):
+        from inv import lots
+        from inv.models import InvProj, InvRec
+        create_owner(projects=1)
+        proj = InvProj.objects.get()
+        InvRec.objects.create(proj=proj, cat=1, amount=100, price=D('10.5'),
+                              value=D('1050'), date=datetime.date(2024, 1, 1))
+        InvRec.objects.create(proj=proj, cat=2, amount=40, price=11, value=440,
+                              date=datetime.date(2024, 2, 1))
+        proj.refresh_from_db()
+        self.assertEqual((proj.amount, proj.value), (D(60), D(610)))
+        full = lots.replay(proj.cost_method, proj.invrec_set.order_by(
+            'date', 'id').values_list('date', 'cat', 'amount', 'value'))
+        self.assertEqual(bytes(proj.lot_book().data), full.tobytes())
+
+
+def random_records(owner, rnd, n, today):
+    from inv.models import Account, AccountCategory, AccountRec, InvProj, InvRec
+    accts = list(Account.objects.owned_by(owner))
+    acats = list(AccountCategory.objects.owned_by(owner))
+    projs = list(InvProj.objects.owned_by(owner))
+    for i in range(n):
+        date = today - datetime.timedelta(days=rnd.randrange(400))
+        if rnd.random() < 0.6:
+            AccountRec.objects.create(acct=rnd.choice(accts), cat=rnd.choice(acats),
+                                      date=date, value=D(rnd.randrange(1, 100000))/100)
+        else:
+            amount, price = D(rnd.randrange(1, 100)), D(rnd.randrange(50, 300))/100
+            InvRec.objects.create(proj=rnd.choice(projs), date=date,
+                                  cat=rnd.choice([1, 1, 2, 3]), amount=amount,
+                                  price=price, value=amount*price, commission=0)
+
+
+class LedgerTest(TestCase):
+    # 快照加上快照之后的过账，和从头累加所有记录的结果一致，补录和修改的记录也要修正快照。
+
+    @quiet
+    def setUp(self):
+        from inv import ledger
+        from inv.models import Account, AccountRec, InvProj, InvRec
+        self.owner = create_owner(accounts=2, projects=3)
+        self.today = datetime.date.today()
+        rnd = random.Random(1)
+        random_records(self.owner, rnd, 60, self.today)
+        ledger.take_snapshots(Account.objects.owned_by(self.owner), self.today)
+        ledger.take_proj_snapshots(InvProj.objects.owned_by(self.owner), self.today)
+        random_records(self.owner, rnd, 60, self.today)
+        for model in (AccountRec, InvRec):
+            recs = list(model.objects.order_by('id'))
+            for rec in recs[::7]:
+                rec.value += 1
+                rec.date -= datetime.timedelta(days=40)
+                rec.save()
+            for rec in recs[3::11]:
+                rec.delete()
+        self.dates = list(ledger.month_ends(self.today-datetime.timedelta(days=420),
+                                            self.today))
+        self.dates += [self.today-datetime.timedelta(days=d) for d in (0, 10, 100, 250)]
+
+    def replay(self, date):
+        # 不用快照，从头累加到date为止的所有记录。
+        from inv.models import Account, AccountRec, InvProj, InvRec
+        accts = {a.id: D() for a in Account.objects.owned_by(self.owner)}
+        projs = {}
+        for rec in AccountRec.objects.filter(date__lte=date).select_related('cat'):
+            accts[rec.acct_id] += rec.value if rec.cat.cat == 1 else -rec.value
+        for rec in InvRec.objects.filter(date__lte=date).select_related('proj'):
+            accts[rec.proj.acct_id] += -rec.value if rec.cat == 1 else rec.value
+            projs[rec.proj_id] = projs.get(rec.proj_id, D()) +\
+                (rec.value if rec.cat == 1 else -rec.value)
+        values = {}
+        for acct in Account.objects.owned_by(self.owner):
+            cat = values.setdefault(acct.cat_id, {})
+            cat['CNY'] = cat.get('CNY', D()) + accts[acct.id]
+        for proj in InvProj.objects.owned_by(self.owner).filter(id__in=projs):
+            cat = values.setdefault(proj.cat_id, {})
+            cat['CNY'] = cat.get('CNY', D()) + projs[proj.id]
+        return accts, values
+
+    def test_balance_at(self):
+        from inv import ledger
+        from inv.models import Account
+        for date in self.dates:
+            accts, _ = self.replay(date)
+            for acct_id, expect in accts.items():
+                self.assertEqual(ledger.balance_at(acct_id, date), expect, (acct_id, date))
+        for acct in Account.objects.owned_by(self.owner):
+            self.assertEqual(acct.value, self.replay(datetime.date.max)[0][acct.id])
+
+    def test_values_at(self):
+        from inv import ledger
+        result = ledger.values_at(self.dates, self.owner)
+        for date in self.dates:
+            self.assertEqual(result[date][0], self.replay(date)[1], date)
+
+
+class ArchiveTest(TestCase):
+
+    @quiet
+    def setUp(self):
+        from inv.models import Account, AccountCategory, AccountRec, InvProj, InvRec, PriceHist
+        self.owner = create_owner(accounts=2, projects=4)
+        self.year = datetime.date.today().year - 3
+        rnd = random.Random(1)
+        accts = list(Account.objects.owned_by(self.owner))
+        acats = list(AccountCategory.objects.owned_by(self.owner))
+        for i in range(300):
+            date = datetime.date(self.year, 1, 1) + datetime.timedelta(days=rnd.randrange(900))
+            AccountRec.objects.create(acct=rnd.choice(accts), cat=rnd.choice(acats),
+                                      date=date, value=D(rnd.randrange(1, 100000))/100,
+                                      comment=f'记录{i}')
+        # 前两个项目在归档的年份之前结束，第三个结束得晚，第四个还在存续。
+        for proj, days in zip(InvProj.objects.order_by('id'), (300, 600, 800, 900)):
+            start = datetime.date(self.year, 1, 1) + datetime.timedelta(days=rnd.randrange(60))
+            for i in range(8):
+                date = start + datetime.timedelta(days=i*days//8)
+                price = D(rnd.randrange(90, 110))/100
+                InvRec.objects.create(proj=proj, cat=1, amount=100, price=price,
+                                      value=100*price, commission=0, date=date)
+                PriceHist.objects.create(proj=proj, date=date, price=price)
+            if proj.name != '项目3':
+                price = D(rnd.randrange(90, 130))/100
+                InvRec.objects.create(proj=proj, cat=2, amount=800, price=price,
+                                      value=800*price, commission=1,
+                                      date=start+datetime.timedelta(days=days))
+                proj.refresh_from_db()
+                proj.isopen = False
+                proj.save()
+                proj.recompute()
+
+    def records(self):
+        from inv.models import AccountRec, InvProj, InvRec, LotBook, PriceHist
+        return (
+            sorted(AccountRec.objects.values_list(
+                'id', 'acct_id', 'cat_id', 'date', 'value', 'comment')),
+            sorted(InvProj.objects.values_list()),
+            sorted(InvRec.objects.values_list()),
+            sorted(PriceHist.objects.values_list()),
+            sorted(LotBook.objects.values_list()),
+        )
+
+    def reports(self):
+        from inv import ledger, views
+        from inv.models import Account
+        dates = list(ledger.month_ends(datetime.date(self.year-1, 12, 1),
+                                       datetime.date.today()))
+        return (
+            {(a.id, d): a.balance_at(d)
+             for a in Account.objects.owned_by(self.owner) for d in dates},
+            ledger.values_at(dates, self.owner),
+            views.details_frame(views.income_details_data(self.owner)).to_dict(),
+            views.details_frame(views.outgoing_details_data(self.owner)).to_dict(),
+        )
+
+    @quiet
+    def test_round_trip(self):
+        from inv import archive, search
+        from inv.models import AccountRec, Archive, InvProj
+        recs, reports = self.records(), self.reports()
+        until = datetime.date(self.year+2, 1, 1)
+
+        # 同一个月只有一条的记录不用汇总。
+        counts = archive.archive(self.owner, self.year+2, dry_run=True)
+        self.assertEqual(self.records(), recs)
+        self.assertGreater(counts['accountrec'], 0)
+        self.assertEqual((counts['invproj'], counts['invrec'], counts['pricehist']), (2, 18, 16))
+
+        self.assertEqual(archive.archive(self.owner, self.year+2), counts)
+        self.assertEqual(Archive.objects.count(), sum(counts.values()))
+        self.assertLessEqual(AccountRec.objects.filter(date__lt=until).count(), 2*2*24)
+        self.assertEqual(sorted(InvProj.objects.values_list('name', flat=True)), ['项目2', '项目3'])
+        self.assertEqual(self.reports(), reports)
+        self.assertEqual(search.search(AccountRec.objects.all(), '记录').count(),
+                         AccountRec.objects.filter(comment__startswith='记录').count())
+        self.assertEqual(search.search(InvProj.objects.all(), '项目').count(), 2)
+
+        self.assertEqual(archive.restore(self.owner), counts)
+        self.assertEqual(self.records(), recs)
+        self.assertEqual(Archive.objects.count(), 0)
+        self.assertEqual(search.search(AccountRec.objects.all(), '记录').count(), len(recs[0]))
+        self.assertEqual(search.search(InvProj.objects.all(), '项目').count(), 4)
+
+
+class LedgerStressTest(FileDatabaseTestCase):
+    # manage.py ledgerstress的缩小版：几个线程并发增删改记录，之后检查所有派生数据。
+
+    OPTIONS = {'accounts': 3, 'projects': 3, 'records': 40, 'seed': 1}
+
+    @quiet
+    def test_concurrent_writers(self):
+        from inv.management.commands import ledgerstress
+        in_threads((ledgerstress.seed, self.OPTIONS))
+        results = in_threads(*[(ledgerstress.writer, (i, self.OPTIONS)) for i in range(4)])
+        self.assertEqual(sum(r[1] for r in results), 0)
+        self.assertEqual(in_threads((ledgerstress.verify,)), [[]])
+
+
+# 内存里的测试库不能再开一个只读连接，报表直接读主库。
+@override_settings(DATABASE_ROUTERS=[])
+class FragmentCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.owner = create_owner()
+        self.client = Client()
+        self.client.force_login(self.owner)
+
+    def test_hit_skips_computing(self):
+        page = self.client.get('/inv/bal')
+        self.assertEqual(page.status_code, 200)
+        with mock.patch('inv.views.balance_sheet_env', side_effect=AssertionError):
+            self.assertEqual(self.client.get('/inv/bal').content, page.content)
+
+    def test_error_is_not_cached(self):
+        # 计算出错时返回500，不能渲染出空白页面并缓存下来。
+        with mock.patch('inv.views.balance_sheet_env', side_effect=TypeError):
+            with self.assertRaises(TypeError):
+                self.client.get('/inv/bal')
+        self.assertIn('现金'.encode('utf-8'), self.client.get('/inv/bal').content)
+
+
+@override_settings(DATABASE_ROUTERS=[])
+class AdminDeleteTest(TestCase):
+    # admin的批量删除也要冲销过账，重算项目统计。
+
+    @quiet
+    def setUp(self):
+        from inv.models import Account, AccountCategory, AccountRec, InvProj, InvRec
+        self.owner = create_owner(projects=1)
+        self.owner.is_staff = self.owner.is_superuser = True
+        self.owner.save()
+        self.client = Client()
+        self.client.force_login(self.owner)
+        acct, proj = Account.objects.get(), InvProj.objects.get()
+        for i, cat in enumerate(AccountCategory.objects.all()):
+            for d in range(1, 4):
+                AccountRec.objects.create(acct=acct, cat=cat, value=D(100*d+i),
+                                          date=datetime.date(2024, 1, d))
+        for d in range(1, 4):
+            InvRec.objects.create(proj=proj, cat=1, amount=D(10), price=D(d),
+                                  value=D(10*d), commission=0, date=datetime.date(2024, 2, d))
+
+    def delete_selected(self, model, ids):
+        response = self.client.post(f'/admin/inv/{model}/', {
+            'action': 'delete_selected', '_selected_action': ids, 'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+
+    @quiet
+    def test_delete_selected(self):
+        from inv import ledger
+        from inv.models import Account, AccountRec, InvProj, InvRec
+        self.delete_selected('accountrec', list(AccountRec.objects.values_list('id', flat=True)[:3]))
+        self.delete_selected('invrec', list(InvRec.objects.values_list('id', flat=True)[:2]))
+        self.assertEqual(AccountRec.objects.count(), 3)
+        acct, proj = Account.objects.get(), InvProj.objects.get()
+        self.assertEqual(acct.value, ledger.balance_at(acct.id, datetime.date.max))
+        self.assertEqual(acct.value, ledger.accountrec_sum(acct.id, None, datetime.date.max) +
+                         ledger.invrec_sum(acct.id, None, datetime.date.max))
+        rec = InvRec.objects.get()
+        self.assertEqual((proj.amount, proj.value), (rec.amount, rec.value))
+        self.assertEqual(proj.lot_book().amount, rec.amount)
+
+
+@override_settings(DATABASE_ROUTERS=[])
+class RiskTest(TestCase):
+
+    def setUp(self):
+        self.owner = create_owner(projects=1)
+        self.client = Client()
+        self.client.force_login(self.owner)
+
+    def bucket(self, label, value):
+        from inv import risk
+        return risk.Bucket(label, label, value, [])
+
+    def test_project_without_records(self):
+        from inv import risk
+        self.assertEqual(risk.buckets(self.owner), [])
+        self.assertEqual(self.client.get('/inv/risk').status_code, 200)
+
+    def test_bad_params(self):
+        for query in ('horizon=inf', 'horizon=nan', 'horizon=-1', 'horizon=0',
+                      'paths=0', 'target=inf', 'horizon=x'):
+            self.assertEqual(self.client.get(f'/inv/risk?{query}').status_code, 400, query)
+
+    def test_estimate(self):
+        import numpy as np
+        import pandas as pd
+        from inv import risk
+        rng = np.random.default_rng(1)
+        z = rng.standard_normal((36, 2))
+        returns = pd.DataFrame({
+            'a': 0.01 + 0.05*z[:, 0],
+            'b': 0.005 + 0.03*(0.6*z[:, 0] + 0.8*z[:, 1]),
+            'c': [0.02]*3 + [np.nan]*33,
+        })
+        bks = [self.bucket(label, 1000.0) for label in 'abcd']
+        mu, sigma, corr, estimated = risk.estimate(bks, returns)
+        self.assertEqual(list(estimated), [True, True, False, False])
+        self.assertAlmostEqual(mu[0], 12*returns['a'].mean())
+        self.assertAlmostEqual(sigma[1], np.sqrt(12)*returns['b'].std())
+        self.assertAlmostEqual(corr[0, 1], returns['a'].corr(returns['b']))
+        self.assertAlmostEqual(corr[0, 1], 0.6, delta=0.15)
+        # 样本不够的组用默认假设，和其他组不相关。
+        self.assertEqual((mu[2], sigma[3]), (risk.DEFAULT_MU, risk.DEFAULT_SIGMA))
+        self.assertEqual(list(corr[2]), [0, 0, 1, 0])
+
+    def test_var_and_target(self):
+        # 单个组合一年后的市值是对数正态分布，和解析解比较。
+        import numpy as np
+        import pandas as pd
+        from scipy.stats import norm
+        from inv import risk
+        bks = [self.bucket('a', 1000.0)]
+        result = risk.run(bks, pd.DataFrame(), horizon=1, steps=12, paths=20000, target=1100,
+                          seed=1, assumptions={'a': {'mu': 0.05, 'sigma': 0.2}})
+        summary = result.summary()['数值']
+        drift = 0.05 - 0.5*0.2**2
+        self.assertAlmostEqual(summary['VaR 95%'], 1000*(1-np.exp(drift+0.2*norm.ppf(0.05))),
+                               delta=5)
+        self.assertAlmostEqual(summary['VaR 99%'], 1000*(1-np.exp(drift+0.2*norm.ppf(0.01))),
+                               delta=8)
+        self.assertAlmostEqual(summary['达到目标概率 (%)'],
+                               100*norm.sf((np.log(1.1)-drift)/0.2), delta=1.5)
+        again = risk.run(bks, pd.DataFrame(), horizon=1, steps=12, paths=20000, target=1100,
+                         seed=1, assumptions={'a': {'mu': 0.05, 'sigma': 0.2}})
+        self.assertTrue((again.final == result.final).all())
+
+
+class CassetteTest(TestCase):
+    # record模式录下的目录就是parserbench的样本目录。
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def test_record_for_parserbench(self):
+        import io
+        from inv import drivers
+        from inv.management.commands.parserbench import FIXTURES
+        with open(os.path.join(FIXTURES, 'SGE.html'), 'rb') as fi:
+            page = fi.read()
+        resp = mock.Mock(content=page)
+        with override_settings(INV_DRIVER_TRANSPORT='record',
+                               INV_DRIVER_CASSETTE=self.tmpdir.name), \
+                mock.patch('requests.get', return_value=resp):
+            self.assertEqual(drivers.SGE('Au99.99'), '197.68')
+            self.assertEqual(drivers.SGE('PGC30g'), '78.66')
+            self.assertEqual(drivers.SGE('Au99.99'), '197.68')
+        out = io.StringIO()
+        call_command('parserbench', fixtures=self.tmpdir.name, number=1, stdout=out)
+        self.assertEqual([line.split()[:2] for line in out.getvalue().splitlines()],
+                         [['SGE', 'Au99.99'], ['SGE', 'PGC30g']])
+        self.assertIn("'197.68' ok", out.getvalue())
+
+
+class JobQueueTest(TestCase):
+
+    def setUp(self):
+        from inv import jobs
+        self.owner = create_owner()
+        self.jobs = [jobs.enqueue(self.owner, 'update_rates', ids=[]) for i in range(10)]
+
+    def test_claim_past_taken_jobs(self):
+        # 拿第一批任务的时候，前8个都被别的worker抢走了，还要接着往后找。
+        from django.utils import timezone
+        from inv import jobs
+        from inv.models import Job
+        now = timezone.now
+
+        def steal():
+            if not Job.objects.filter(status=Job.RUNNING).exists():
+                ids = [j.id for j in self.jobs[:8]]
+                Job.objects.filter(id__in=ids).update(status=Job.RUNNING)
+            return now()
+
+        with mock.patch('django.utils.timezone.now', side_effect=steal):
+            self.assertEqual(jobs.claim(), self.jobs[8].id)
+            self.assertEqual(jobs.claim(), self.jobs[9].id)
+            self.assertIsNone(jobs.claim())
+
+    def test_reap_stale_jobs(self):
+        from django.utils import timezone
+        from inv import jobs
+        from inv.models import Job
+        first, second, third = [jobs.claim() for i in range(3)]
+        old = timezone.now() - datetime.timedelta(minutes=5)
+        Job.objects.filter(id__in=[first, second]).update(heartbeat=old, started=old)
+        Job.objects.filter(id=third).update(heartbeat=None, started=old)
+        jobs.beat([second])
+        self.assertEqual(jobs.reap(60), 2)
+        self.assertEqual(dict(Job.objects.filter(id__in=[first, second, third]).values_list(
+            'id', 'status')), {first: Job.FAILED, second: Job.RUNNING, third: Job.FAILED})
+        self.assertEqual(Job.objects.get(id=first).error, 'worker stopped')
+
+
+class NavTest(TestCase):
+
+    @quiet
+    def setUp(self):
+        from inv.models import InvProj, InvRec, PriceHist
+        self.owner = create_owner(projects=1)
+        self.proj = InvProj.objects.get()
+        day = functools.partial(datetime.date, 2024, 1)
+        for date, cat, amount, price in ((day(1), 1, 100, '1.00'), (day(3), 1, 100, '1.20'),
+                                         (day(5), 2, 50, '1.20')):
+            InvRec.objects.create(proj=self.proj, cat=cat, amount=amount, price=D(price),
+                                  value=amount*D(price), commission=0, date=date)
+        for date, price in ((day(2), '1.10'), (day(4), '1.08')):
+            PriceHist.objects.create(proj=self.proj, date=date, price=D(price))
+
+    def test_hand_computed(self):
+        # 逐日手算：净值100, 110, 240, 216, 180；第3天流入120，第5天流出60。
+        # 日收益率 10%, 120/110-1, -10%, 240/216-1，累计正好20%，最大回撤10%。
+        from inv import nav
+        result = nav.compute(datetime.date(2024, 1, 1), datetime.date(2024, 1, 5), self.owner)
+        for key in (('total', 0), ('proj', self.proj.id)):
+            self.assertEqual([round(v, 6) for v in result.nav[key]], [100, 110, 240, 216, 180])
+            self.assertEqual([round(v, 6) for v in result.flow[key]], [0, 0, 120, 0, -60])
+            self.assertEqual([round(v, 6) for v in result.index[key]],
+                             [1, 1.1, 1.2, 1.08, 1.2])
+            self.assertAlmostEqual(result.drawdown[key].min(), -0.1)
+        summary = result.summary().loc[('total', 0)]
+        self.assertAlmostEqual(summary['时间加权收益率'], 20)
+        self.assertAlmostEqual(summary['资金净流入'], 60)
+
+
+@override_settings(DATABASE_ROUTERS=[])
+class ApiConditionalTest(TestCase):
+
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        self.owner = create_owner()
+        self.other = get_user_model().objects.create_user('other')
+        self.client = Client()
+        self.client.force_login(self.owner)
+
+    def test_not_modified(self):
+        from inv.models import Account, AccountCategory, AccountRec
+        resp = self.client.get('/inv/api/bal')
+        self.assertEqual(resp.status_code, 200)
+        etag = resp['ETag']
+        # 未变化时不进入报表计算。
+        with mock.patch('inv.views.balance_sheet_env', side_effect=AssertionError):
+            resp = self.client.get('/inv/api/bal', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(self.client.get('/inv/api/ios', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get('/inv/api/bal?date=2024-01-01',
+                                         HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        AccountRec.objects.create(acct=Account.objects.get(), value=D(10),
+                                  cat=AccountCategory.objects.get(cat=1),
+                                  date=datetime.date.today())
+        resp = self.client.get('/inv/api/bal', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], etag)
+
+    def test_other_user(self):
+        # 两个用户的版本号相同时ETag也要不同。
+        from inv.models import Version
+        for user in (self.owner, self.other):
+            Version.objects.update_or_create(name=f'owner:{user.id}', defaults={'version': 7})
+        etag = self.client.get('/inv/api/bal')['ETag']
+        self.client.force_login(self.other)
+        resp = self.client.get('/inv/api/bal', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], etag)
+
+    def test_login_required(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/inv/api/bal').status_code, 401)
+
+
+class PortfolioTest(TestCase):
+
+    def setUp(self):
+        self.owner = create_owner(accounts=2, projects=3)
+
+    def add(self, n):
+        from inv.models import Account, InvProj
+        acct, proj = Account.objects.first(), InvProj.objects.first()
+        for i in range(n):
+            Account.objects.create(name=f'新账户{i}', bank=acct.bank, currency=acct.currency,
+                                   cat=acct.cat)
+            InvProj.objects.create(name=f'新项目{i}', acct=acct, cat=proj.cat, risk=proj.risk,
+                                   isopen=True)
+
+    def test_load_queries(self):
+        # 查询次数固定，和账户、项目的个数无关。
+        from inv import portfolio
+        with self.assertNumQueries(6):
+            pf = portfolio.load(self.owner.id)
+        self.assertEqual((len(pf.accts), len(pf.projs)), (2, 3))
+        self.add(10)
+        with self.assertNumQueries(6):
+            pf = portfolio.load(self.owner.id)
+        self.assertEqual((len(pf.accts), len(pf.projs)), (12, 13))
+
+    def test_scope(self):
+        from inv import portfolio
+        from inv.models import InvProj
+        projs = list(InvProj.objects.all())
+        with portfolio.scope():
+            with self.assertNumQueries(6):
+                pf = portfolio.get(self.owner)
+                self.assertIs(portfolio.current(self.owner.id), pf)
+            with self.assertNumQueries(0):
+                self.assertEqual({p.currency().name for p in projs}, {'CNY'})
+                for p in projs:
+                    p.bank()
+        self.assertIsNone(portfolio.current(self.owner.id))
+
+
+class RatesTest(TestCase):
+
+    TABLE = {'USD': D(1), 'CNY': D('7.2'), 'EUR': D('0.9'), 'JPY': D(0)}
+
+    def test_cross_rates(self):
+        from inv import drivers
+        self.assertEqual(drivers.cross_rates(self.TABLE, ['EUR', 'USD', 'JPY', 'GBP']),
+                         {'EUR': D(8), 'USD': D('7.2')})
+        self.assertEqual(drivers.cross_rates(self.TABLE, ['CNY']), {'CNY': D(1)})
+        self.assertEqual(drivers.cross_rates({'USD': D(1)}, ['USD']), {})
+
+    def test_fallback(self):
+        # 汇率表里没有的币种逐个查询，查不到的记下错误；汇率表取不到时全部逐个查询。
+        from inv import drivers
+
+        def investing(name):
+            if name == 'HKD':
+                raise LookupError(name)
+            return {'GBP': D('9.1'), 'EUR': D('7.9')}[name]
+
+        with mock.patch('inv.drivers.RateTable', return_value=dict(self.TABLE)), \
+                mock.patch('inv.drivers.InvestingCurrency', side_effect=investing) as fallback:
+            rates = drivers.currency_rates(['EUR', 'GBP', 'HKD'])
+        self.assertEqual([c.args for c in fallback.call_args_list], [('GBP',), ('HKD',)])
+        self.assertEqual(rates['EUR'], (D(8), None))
+        self.assertEqual(rates['GBP'], (D('9.1'), None))
+        self.assertIsNone(rates['HKD'][0])
+        self.assertIsInstance(rates['HKD'][1], LookupError)
+
+        with mock.patch('inv.drivers.RateTable', side_effect=OSError), \
+                mock.patch('inv.drivers.InvestingCurrency', side_effect=investing):
+            self.assertEqual(drivers.currency_rates(['EUR', 'GBP']),
+                             {'EUR': (D('7.9'), None), 'GBP': (D('9.1'), None)})
+
+    def test_update_rates(self):
+        from inv.models import Currency, RateHist, Version
+        cny = Currency.objects.create(name='CNY', rate=1)
+        eur = Currency.objects.create(name='EUR', rate=D('7.5'))
+        gbp = Currency.objects.create(name='GBP', rate=D('9'))
+        version = Version.of(None)
+        with mock.patch('inv.drivers.RateTable', return_value=dict(self.TABLE)), \
+                mock.patch('inv.drivers.InvestingCurrency', side_effect=LookupError):
+            results = Currency.update_rates([cny, eur, gbp])
+        self.assertEqual([(c.name, old, new, err is None) for c, old, new, err in results],
+                         [('EUR', D('7.5'), D(8), True), ('GBP', D(9), D(9), False)])
+        self.assertEqual(Currency.objects.get(name='EUR').rate, D(8))
+        self.assertEqual(list(RateHist.objects.values_list('currency__name', 'rate')),
+                         [('EUR', D(8))])
+        # bulk_update不发信号，汇率变化要自己改版本号。
+        self.assertNotEqual(Version.of(None), version)
+
+
+@override_settings(DATABASE_ROUTERS=[])
+class ExportTest(TestCase):
+
+    def setUp(self):
+        from inv.models import Account, AccountCategory, AccountRec
+        self.owner = create_owner()
+        acct = Account.objects.get()
+        for i in range(5):
+            AccountRec.objects.create(acct=acct, cat=AccountCategory.objects.get(cat=1+i % 2),
+                                      value=D(i*100+1)/100, date=datetime.date(2024, 1, 1+i),
+                                      comment=f'记录{i}' if i else None)
+
+    def expected(self):
+        from inv.models import AccountRec
+        return [(r.id, r.date, r.acct_id, '银行', '账户0', 'CNY', r.cat.name, r.cat.cat,
+                 float(r.value), r.comment) for r in AccountRec.objects.order_by('date', 'id')]
+
+    def test_round_trip(self):
+        import io
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        from inv import export
+        data = b''.join(export.stream(self.owner, 'accountrec', 'parquet', row_group=2))
+        pf = pq.ParquetFile(io.BytesIO(data))
+        self.assertEqual(pf.metadata.num_row_groups, 3)
+        table = pf.read()
+        self.assertEqual(table.schema.field('bank').type, pa.dictionary(pa.int32(), pa.string()))
+        self.assertEqual(table.schema.field('date').type, pa.date32())
+        self.assertEqual([tuple(row.values()) for row in table.to_pylist()], self.expected())
+
+        data = b''.join(export.stream(self.owner, 'accountrec', 'arrow', row_group=2))
+        table = pa.ipc.open_stream(data).read_all()
+        self.assertEqual([tuple(row.values()) for row in table.to_pylist()], self.expected())
+
+    def test_view(self):
+        import io
+        import pyarrow.parquet as pq
+        from django.contrib.auth import get_user_model
+        client = Client()
+        client.force_login(self.owner)
+        resp = client.get('/inv/export/accountrec.parquet')
+        self.assertEqual(resp['Content-Type'], 'application/vnd.apache.parquet')
+        table = pq.read_table(io.BytesIO(b''.join(resp.streaming_content)))
+        self.assertEqual(table.num_rows, 5)
+        # 只导出自己的数据。
+        client.force_login(get_user_model().objects.create_user('other'))
+        resp = client.get('/inv/export/accountrec.parquet')
+        self.assertEqual(pq.read_table(io.BytesIO(b''.join(resp.streaming_content))).num_rows, 0)
+        self.assertEqual(client.get('/inv/export/nosuch.parquet').status_code, 404)
+
+
+@override_settings(DATABASE_ROUTERS=[])
+class SearchTest(TestCase):
+
+    def setUp(self):
+        from inv.models import Account, AccountCategory, AccountRec
+        self.owner = create_owner(projects=1)
+        acct, cat = Account.objects.get(), AccountCategory.objects.get(cat=1)
+        self.recs = [AccountRec.objects.create(acct=acct, cat=cat, value=D(1), comment=comment,
+                                               date=datetime.date(2024, 1, 1))
+                     for comment in ('三月工资', 'salary for March', '报销"打车"', None)]
+
+    def found(self, term):
+        from inv import search
+        from inv.models import AccountRec
+        return sorted(search.search(AccountRec.objects.all(), term).values_list('id', flat=True))
+
+    def ids(self, *indexes):
+        return sorted(self.recs[i].id for i in indexes)
+
+    def test_search(self):
+        # 汉字拆成单字按短语匹配，英文按前缀，多个词都要匹配，引号等符号不影响查询。
+        self.assertEqual(self.found('工资'), self.ids(0))
+        self.assertEqual(self.found('资工'), [])
+        self.assertEqual(self.found('sal'), self.ids(1))
+        self.assertEqual(self.found('mar sal'), self.ids(1))
+        self.assertEqual(self.found('"打车'), self.ids(2))
+        self.assertEqual(self.found('月 march'), [])
+        self.assertEqual(self.found('*** "'), [])
+
+    def test_sync(self):
+        from inv import search
+        from inv.models import InvProj
+        rec = self.recs[0]
+        rec.comment = '四月奖金'
+        rec.save()
+        self.assertEqual((self.found('工资'), self.found('奖金')), ([], self.ids(0)))
+        rec.delete()
+        self.assertEqual(self.found('奖金'), [])
+
+        # 只更新统计字段的保存不重建索引，改名要重建。
+        proj = InvProj.objects.get()
+        proj.recompute()
+        self.assertEqual(list(search.search(InvProj.objects.all(), '项目')), [proj])
+        proj.name = '黄金'
+        proj.save()
+        self.assertEqual(list(search.search(InvProj.objects.all(), '项目')), [])
+        self.assertEqual(list(search.search(InvProj.objects.all(), '黄金')), [proj])
+
+    def test_rebuild(self):
+        from django.db import connection
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM inv_accountrec_fts')
+        self.assertEqual(self.found('工资'), [])
+        call_command('searchindex', stdout=open(os.devnull, 'w'))
+        self.assertEqual(self.found('工资'), self.ids(0))
+
+    def test_view(self):
+        from django.contrib.auth import get_user_model
+        client = Client()
+        client.force_login(self.owner)
+        self.assertContains(client.get('/inv/search', {'q': '工资'}), '三月工资')
+        client.force_login(get_user_model().objects.create_user('other'))
+        self.assertNotContains(client.get('/inv/search', {'q': '工资'}), '三月工资')
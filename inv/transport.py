@@ -0,0 +1,159 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+@date: 2026-10-19
+@author: Shell.Xu
+@copyright: 2026, Shell.Xu <shell909090@gmail.com>
+@license: BSD-3-clause
+'''
+import os
+import json
+import time
+import random
+import hashlib
+import tempfile
+import functools
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+
+
+# 驱动通过transport访问网络：
+# live直接访问上游，record访问上游并保存响应，replay从本地的stub server取回保存的响应。
+class LiveTransport(object):
+
+    def url_for(self, url):
+        return url
+
+    def store(self, url, content, driver=None, _id=None):
+        pass
+
+
+# 响应按URL的哈希命名，回放时按URL读取，不依赖索引。
+# index.json和parserbench的样本索引格式相同：[{driver, id, file}, ...]，
+# 只记录drivers.http_drivers里的驱动，同一个驱动和代号只留最后一次的响应，
+# 录下来的目录可以直接用parserbench --fixtures测量。
+# 文件都写到临时文件再改名替换，读到的总是完整的文件。
+class Cassette(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def index_path(self):
+        return os.path.join(self.path, 'index.json')
+
+    def filename(self, url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest() + '.bin'
+
+    def load(self):
+        try:
+            with open(self.index_path()) as fi:
+                return json.load(fi)
+        except FileNotFoundError:
+            return []
+
+    def get(self, url):
+        try:
+            with open(os.path.join(self.path, self.filename(url)), 'rb') as fi:
+                return fi.read()
+        except FileNotFoundError:
+            return
+
+    def replace(self, filename, data, mode):
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix='.tmp')
+        try:
+            with os.fdopen(fd, mode) as fo:
+                fo.write(data)
+            os.replace(tmp, os.path.join(self.path, filename))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def put(self, url, content, driver=None, _id=None):
+        filename = self.filename(url)
+        with self.lock:
+            os.makedirs(self.path, exist_ok=True)
+            self.replace(filename, content, 'wb')
+            if driver is None:
+                return
+            index = [item for item in self.load()
+                     if (item['driver'], item['id']) != (driver, _id)]
+            index.append({'driver': driver, 'id': _id, 'file': filename})
+            index.sort(key=lambda item: (item['driver'], item['id']))
+            self.replace('index.json', json.dumps(index, indent=2, ensure_ascii=False), 'w')
+
+
+class RecordTransport(LiveTransport):
+
+    def __init__(self, path):
+        self.cassette = Cassette(path)
+
+    def store(self, url, content, driver=None, _id=None):
+        self.cassette.put(url, content, driver, _id)
+
+
+class ReplayTransport(LiveTransport):
+
+    def __init__(self, stub):
+        self.stub = stub.rstrip('/')
+
+    def url_for(self, url):
+        return f'{self.stub}/replay?' + urllib.parse.urlencode({'url': url})
+
+
+# 每个进程每种配置只有一个transport，并发请求共用同一个Cassette和它的锁。
+@functools.lru_cache()
+def make_transport(mode, cassette, stub):
+    if mode == 'record':
+        return RecordTransport(cassette)
+    if mode == 'replay':
+        return ReplayTransport(stub)
+    return LiveTransport()
+
+
+def get_transport():
+    return make_transport(settings.INV_DRIVER_TRANSPORT,
+                          settings.INV_DRIVER_CASSETTE, settings.INV_DRIVER_STUB)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        url = query.get('url', [''])[0]
+        delay = server.latency + random.uniform(-server.jitter, server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if random.random() < server.error_rate:
+            self.send_error(503)
+            return
+        content = server.cassette.get(url)
+        if content is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class StubServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, addr, path, latency=0, jitter=0, error_rate=0,
+                 verbose=False):
+        super().__init__(addr, StubHandler)
+        self.cassette = Cassette(path)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.verbose = verbose
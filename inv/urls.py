@@ -6,22 +6,54 @@
 @copyright: 2021, Shell.Xu <shell909090@gmail.com>
 @license: BSD-3-clause
 '''
+from django.conf import settings
 from django.conf.urls import url
 
 from . import views
+from . import aviews
+from . import api
+
+# 在ASGI下使用异步版本的报表。
+if settings.INV_ASYNC_VIEWS:
+    reports = aviews
+else:
+    reports = views
 
 
 app_name = 'inv'
 
 urlpatterns = [
+    # 只读的JSON接口、导出和搜索，放在最前面，避免被下面未锚定的模式匹配。
+    url(r'^api/st/(?P<projid>[0-9]+)$',
+        api.proj_stat, name='api_proj_stat'),
+    url(r'^api/bal$',
+        api.balance_sheet, name='api_balance_sheet'),
+    url(r'^api/ios$',
+        api.income_outgoing_sheet, name='api_income_outgoing_sheet'),
+    url(r'^api/ind$',
+        api.income_details, name='api_income_details'),
+    url(r'^api/ogd$',
+        api.outgoing_details, name='api_outgoing_details'),
+    url(r'^export/(?P<table>[a-z]+)\.(?P<fmt>parquet|arrow)$',
+        views.export_table, name='export_table'),
+    url(r'^search$',
+        views.search_view, name='search'),
     url(r'st/(?P<projid>[0-9]+)',
-        views.proj_stat, name='proj_stat'),
+        reports.proj_stat, name='proj_stat'),
     url(r'bal',
-        views.balance_sheet, name='balance_sheet'),
+        reports.balance_sheet, name='balance_sheet'),
     url(r'ios',
-        views.income_outgoing_sheet, name='income_outgoing_sheet'),
+        reports.income_outgoing_sheet, name='income_outgoing_sheet'),
     url(r'ind',
-        views.income_details, name='income_details'),
+        reports.income_details, name='income_details'),
     url(r'ogd',
-        views.outgoing_details, name='outgoing_details'),
+        reports.outgoing_details, name='outgoing_details'),
+    url(r'nav',
+        reports.nav_report, name='nav_report'),
+    url(r'risk',
+        reports.risk_report, name='risk_report'),
+    url(r'^jobs$',
+        views.job_status, name='jobs'),
+    url(r'refresh',
+        aviews.refresh, name='refresh'),
 ]
@@ -1,23 +1,71 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
+import math
 import decimal
+import asyncio
 import datetime
+import functools
 
-import pandas as pd
-from scipy.optimize import fsolve
+from asgiref.sync import sync_to_async
 
-from django.http import HttpResponse
-from django.shortcuts import render
+from django.contrib.auth.decorators import login_required as sync_login_required
+from django.contrib.auth.views import redirect_to_login
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import router
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render
+from django.utils.safestring import mark_safe
 
-from .models import Currency, Category, Bank, Account, AccountCategory, AccountRec, Risk, InvProj, InvRec
+from .models import Currency, Category, Bank, Account, AccountCategory, AccountRec, Risk, InvProj, InvRec, Job, Version
+from . import archive
+from . import portfolio
+from . import search
 from . import tables
+from .db import replica
 
 
+# django自带的login_required不支持异步视图。
+def login_required(view):
+    if not asyncio.iscoroutinefunction(view):
+        return sync_login_required(view)
+
+    @functools.wraps(view)
+    async def inner(request, *args, **kwargs):
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return inner
+
+
+# 报表模板里的片段按数据版本缓存，模板里的{% cache %}用同样的名字和参数。
+# 视图先查缓存，命中时直接输出片段，未命中才计算数据。计算出错照常抛出，
+# 不会在模板取值时被吞掉，也不会把空白的片段缓存下来。
+def fragment_env(owner, name, vary_on, func, *args, **env):
+    env['version'] = Version.of(owner.id)
+    key = make_template_fragment_key(name, [owner.id, env['version']] + list(vary_on))
+    fragment = cache.get(key)
+    if fragment is None:
+        env['data'] = func(*args)
+    else:
+        env['fragment'] = mark_safe(fragment)
+    return env
+
+
+def proj_stat_data(projid, owner):
+    proj = get_object_or_404(InvProj.objects.owned_by(owner).select_related(
+        'acct__currency', 'acct__bank', 'cat', 'risk', 'lotbook'), id=int(projid))
+    return proj, list(proj.invrec_set.all())
+
+
+@login_required
+@replica
 def proj_stat(request, projid):
-    proj = InvProj.objects.get(id=int(projid))
-    tab = tables.InvRecTable(proj.invrec_set.all(), request=request)
+    proj, recs = proj_stat_data(projid, request.user)
+    tab = tables.InvRecTable(recs, request=request)
     env = {
         'proj': proj,
+        'lots': proj.open_lots(),
         'table': tab,
     }
     return render(request, 'inv/proj_stat.html', env)
@@ -35,16 +83,16 @@ def div_vectory(a, b):
     return [i/j for i, j in zip(a, b) if j != 0]
 
 
-def balance_sheet(request):
-    curs = Currency.objects.all()
+def sheet_env(curs, cats, values, rates):
+    # values: {类别id: {币种名: 金额}}，rates: {币种名: 汇率}。
     sheet = {}
-    for cat in Category.objects.all():
-        values = cat.values_by_currency()
+    for cat in cats:
+        cat_values = values.get(cat.id, {})
         l = []
         total = 0
         for cur in curs:
-            l.append(values.get(cur.name, decimal.Decimal()))
-            total += values.get(cur.name, decimal.Decimal()) * cur.rate
+            l.append(cat_values.get(cur.name, decimal.Decimal()))
+            total += cat_values.get(cur.name, decimal.Decimal()) * rates[cur.name]
         l.append(total)
         sheet.setdefault(cat.cat, [])
         sheet[cat.cat].append((cat, l))
@@ -53,7 +101,7 @@ def balance_sheet(request):
     liabilities = [decimal.Decimal(),]*(len(curs)+1)
     for i in range(1, 6):
         sums = [decimal.Decimal(),]*(len(curs)+1)
-        for name, values in sheet[i]:
+        for name, values in sheet.setdefault(i, []):
             sums = add_vectory(sums, values)
         if i == 1:
             current_asset = sums[:]
@@ -72,7 +120,7 @@ def balance_sheet(request):
     else:
         liquidity_ratio = -1
     debt_asset_ratio = max(div_vectory(map(float, liabilities),
-                                       map(float, assets)))
+                                       map(float, assets)), default=0)
 
     env = {
         'sheet': sheet,
@@ -83,44 +131,142 @@ def balance_sheet(request):
         'liquidity_ratio': liquidity_ratio,
         'debt_asset_ratio': 100*debt_asset_ratio,
     }
-    return render(request, 'inv/balance_sheet.html', env)
+    return env
 
 
-def income_outgoing_sheet(request):
+def balance_sheet_env(owner):
+    pf = portfolio.get(owner)
+    curs = list(pf.curs.values())
+    return sheet_env(curs, pf.categories(), pf.values(),
+                     {cur.name: cur.rate for cur in curs})
+
+
+def balance_sheets(owner, dates):
+    from . import ledger
+    pf = portfolio.get(owner)
+    curs = list(pf.curs.values())
+    cats = pf.categories()
+    result = ledger.values_at(dates, owner)
+    return [(date, sheet_env(curs, cats, *result[date])) for date in dates]
+
+
+def asof_env(owner, date):
+    [(date, env)] = balance_sheets(owner, [date])
+    env['asof'] = date
+    return env
+
+
+# 各期只比较CNY计价的合计数。
+def compare_env(owner, dates):
+    sheets = balance_sheets(owner, dates)
+    first = sheets[0][1]['sheet']
+    sections = []
+    for i, name in enumerate(['流动资产', '流动负债', '固定资产', '长期负债', '投资'], 1):
+        rows = []
+        for j, (cat, _) in enumerate(first[i]):
+            rows.append((cat, [env['sheet'][i][j][1][-1] for date, env in sheets]))
+        sections.append((i, name, rows))
+    env = {
+        'dates': dates,
+        'sections': sections,
+        'assets': [env['assets'][-1] for date, env in sheets],
+        'liabilities': [env['liabilities'][-1] for date, env in sheets],
+        'equity': [env['equity'][-1] for date, env in sheets],
+        'debt_asset_ratio': [env['debt_asset_ratio'] for date, env in sheets],
+    }
+    return env
+
+
+def balance_dates(request):
+    # ?asof=YYYY-MM-DD看某一天，逗号分隔多个日期或?cmp=N（最近N个月末）做对比。
+    if request.GET.get('cmp'):
+        from . import ledger
+        n = max(1, min(int(request.GET['cmp']), 120))
+        today = datetime.date.today()
+        start = today.replace(day=1)
+        for _ in range(n):
+            start = (start-datetime.timedelta(days=1)).replace(day=1)
+        return list(ledger.month_ends(start, today))[-n:]
+    if request.GET.get('asof'):
+        return sorted(parse_date(s, None) for s in request.GET['asof'].split(',') if s)
+    return []
+
+
+def balance_sheet_view(owner, dates):
+    if not dates:
+        return 'inv/balance_sheet.html', fragment_env(
+            owner, 'inv_bal', [None], balance_sheet_env, owner, asof=None)
+    if len(dates) == 1:
+        return 'inv/balance_sheet.html', fragment_env(
+            owner, 'inv_bal', dates, asof_env, owner, dates[0], asof=dates[0])
+    return 'inv/bal_cmp.html', compare_env(owner, dates)
+
+
+@login_required
+@replica
+@portfolio.scoped
+def balance_sheet(request):
+    try:
+        dates = balance_dates(request)
+    except ValueError:
+        return HttpResponseBadRequest('bad date')
+    return render(request, *balance_sheet_view(request.user, dates))
+
+
+def income_outgoing_data(owner):
     lastyear = datetime.date.today()-datetime.timedelta(days=365)
     td = datetime.date.today()
 
     income = []
-    for cat in AccountCategory.objects.filter(cat=1).all():
+    for cat in AccountCategory.objects.owned_by(owner).filter(cat=1):
         num = sum((rec.value for rec in cat.accountrec_set.filter(date__gte=lastyear).all()))
         if num:
             income.append((cat.name, num))
-    s_income = sum((n for c, n in income))
-    income.append(('小计', s_income))
 
     outgoing = []
-    for cat in AccountCategory.objects.filter(cat=2).all():
+    for cat in AccountCategory.objects.owned_by(owner).filter(cat=2):
         num = sum((rec.value for rec in cat.accountrec_set.filter(date__gte=lastyear).all()))
         if num:
             outgoing.append((cat.name, num))
-    s_outgoing = sum((n for c, n in outgoing))
-    outgoing.append(('小计', s_outgoing))
 
+    # 最近一年结束的项目和它们的记录各一次查询读出，币种从组合快照里取。
+    pf = portfolio.get(owner)
+    projs = list(InvProj.objects.owned_by(owner).filter(
+        cat__cat=5, isopen=False, end__gte=lastyear))
+    recs = {}
+    for r in InvRec.objects.filter(proj__in=projs).order_by('date', 'id'):
+        recs.setdefault(r.proj_id, []).append(r)
     investments = []
     iotab = []
-    for cat in Category.objects.filter(cat=5).all():
+    for cat in pf.categories(5):
         num = 0
-        for proj in cat.invproj_set.filter(isopen=False, end__gte=lastyear).all():
-            num -= (proj.value*proj.acct.currency.rate).quantize(decimal.Decimal('1.00'))
-            iotab.extend(proj.calc_iotab(td, True))
+        for proj in projs:
+            if proj.cat_id != cat.id:
+                continue
+            num -= (proj.value*pf.accts[proj.acct_id].currency.rate).quantize(
+                decimal.Decimal('1.00'))
+            iotab.extend(proj.calc_iotab(td, True, recs.get(proj.id, [])))
         if num:
             investments.append((cat.name, num))
+    return income, outgoing, investments, iotab
+
+
+def percent(a, b):
+    return 100*a/b if b else 0
+
+
+def income_outgoing_env(income, outgoing, investments, iotab):
+    from scipy.optimize import fsolve
+    s_income = sum((n for c, n in income))
+    income.append(('小计', s_income))
+    s_outgoing = sum((n for c, n in outgoing))
+    outgoing.append(('小计', s_outgoing))
     s_investments = sum((n for c, n in investments))
     investments.append(('小计', s_investments))
 
     def f(r):
         return sum((value*r**dur for dur, value in iotab))
-    r = fsolve(f, 1.01)[0]
+    r = fsolve(f, 1.01)[0] if iotab else 1
 
     env = {
         'income': income,
@@ -129,67 +275,223 @@ def income_outgoing_sheet(request):
         'total_income': s_income+s_investments,
         'total_outgoing': s_outgoing,
         'net_income': s_income+s_investments-s_outgoing,
-        'saving_rate': 100*(s_income+s_investments-s_outgoing)/(s_income+s_investments),
-        'invest_income_rate': 100*s_investments/(s_income+s_investments),
-        'invest_outgoing_rate': 100*s_investments/s_outgoing,
+        'saving_rate': percent(s_income+s_investments-s_outgoing, s_income+s_investments),
+        'invest_income_rate': percent(s_investments, s_income+s_investments),
+        'invest_outgoing_rate': percent(s_investments, s_outgoing),
         'invest_rate': 365*100*(r-1),
     }
+    return env
+
+
+def income_outgoing_report(owner):
+    return income_outgoing_env(*income_outgoing_data(owner))
+
+
+@login_required
+@replica
+@portfolio.scoped
+def income_outgoing_sheet(request):
+    today = datetime.date.today()
+    env = fragment_env(request.user, 'inv_ios', [today], income_outgoing_report,
+                       request.user, today=today)
     return render(request, 'inv/ios.html', env)
 
 
-def income_details(request):
-    df = pd.DataFrame()
+def accountrec_series(cat):
+    return [(rec.date.replace(day=1), rec.value)
+            for rec in cat.accountrec_set.all()]
 
-    for cat in AccountCategory.objects.filter(cat=1).all():
-        s = pd.Series(name=cat.name)
-        for rec in cat.accountrec_set.all():
-            dt = rec.date.replace(day=1)
-            if dt not in s:
-                s[dt] = rec.value
-            else:
-                s[dt] += rec.value
-        if s.count():
-            df = df.join(s, how='outer')
 
-    for cat in Category.objects.filter(cat=5).all():
-        s = pd.Series(name=cat.name)
-        for proj in cat.invproj_set.filter(isopen=False).all():
-            dt = proj.end.replace(day=1)
+def income_details_data(owner):
+    series = []
+    for cat in AccountCategory.objects.owned_by(owner).filter(cat=1):
+        series.append((cat.name, accountrec_series(cat)))
+
+    # 已归档的项目从归档表里读，金额是归档时的统计数据。
+    archived = archive.archived_projects(owner)
+    for cat in Category.objects.owned_by(owner).filter(cat=5):
+        values = []
+        projs = list(cat.invproj_set.filter(isopen=False).select_related('acct__currency'))
+        for proj in projs + [p for p in archived if p.cat_id == cat.id]:
             value = (proj.value*proj.acct.currency.rate).quantize(decimal.Decimal('1.00'))
+            values.append((proj.end.replace(day=1), -value))
+        series.append((cat.name, values))
+    return series
+
+
+def outgoing_details_data(owner):
+    return [(cat.name, accountrec_series(cat))
+            for cat in AccountCategory.objects.owned_by(owner).filter(cat=2)]
+
+
+def details_frame(series):
+    import pandas as pd
+    df = pd.DataFrame()
+
+    for name, values in series:
+        s = pd.Series(name=name)
+        for dt, value in values:
             if dt not in s:
-                s[dt] = -value
+                s[dt] = value
             else:
-                s[dt] += -value
+                s[dt] += value
         if s.count():
             df = df.join(s, how='outer')
 
     df = df.sort_index()
     df['总计'] = df.sum(axis=1)
+    return df
+
+
+def details_env(title, series):
+    df = details_frame(series)
     env = {
-        'title': '收入细节表',
+        'title': title,
         'code': df.to_html(border=0, classes='table table-striped table-responsive'),
     }
+    return env
+
+
+def details_report(title, data, owner, path):
+    return fragment_env(owner, 'inv_raw', [path],
+                        lambda: details_env(title, data(owner)), title=title)
+
+
+@login_required
+@replica
+def income_details(request):
+    env = details_report('收入细节表', income_details_data, request.user,
+                         request.path)
     return render(request, 'inv/raw.html', env)
 
 
+@login_required
+@replica
 def outgoing_details(request):
-    df = pd.DataFrame()
+    env = details_report('支出细节表', outgoing_details_data, request.user,
+                         request.path)
+    return render(request, 'inv/raw.html', env)
 
-    for cat in AccountCategory.objects.filter(cat=2).all():
-        s = pd.Series(name=cat.name)
-        for rec in cat.accountrec_set.all():
-            dt = rec.date.replace(day=1)
-            if dt not in s:
-                s[dt] = rec.value
-            else:
-                s[dt] += rec.value
-        if s.count():
-            df = df.join(s, how='outer')
-    
-    df = df.sort_index()
-    df['总计'] = df.sum(axis=1)
+
+def parse_date(s, default):
+    if not s:
+        return default
+    return datetime.datetime.strptime(s, '%Y-%m-%d').date()
+
+
+def nav_range(request):
+    end = parse_date(request.GET.get('end'), datetime.date.today())
+    start = parse_date(request.GET.get('start'),
+                       end-datetime.timedelta(days=365))
+    if start > end:
+        raise ValueError('empty range')
+    return start, end
+
+
+def nav_env(start, end, result):
+    classes = 'table table-striped table-responsive'
     env = {
-        'title': '支出细节表',
-        'code': df.to_html(border=0, classes='table table-striped table-responsive'),
+        'start': start,
+        'end': end,
+        'summary': result.summary().to_html(
+            border=0, classes=classes, float_format='{0:0.2f}'.format),
+        'monthly': result.monthly('cat').to_html(
+            border=0, classes=classes, float_format='{0:0.2f}'.format),
     }
-    return render(request, 'inv/raw.html', env)
+    return env
+
+
+@login_required
+@replica
+def nav_report(request):
+    from . import nav
+    try:
+        start, end = nav_range(request)
+    except ValueError:
+        return HttpResponseBadRequest('bad date')
+    result = nav.get_nav(start, end, request.user)
+    return render(request, 'inv/nav.html', nav_env(start, end, result))
+
+
+def positive(value, parse=float):
+    # float()接受inf和nan，取整时会溢出，这里一起拒绝。
+    value = parse(value)
+    if not math.isfinite(value) or value <= 0:
+        raise ValueError(f'not a positive number: {value}')
+    return value
+
+
+def risk_params(request):
+    horizon = positive(request.GET.get('horizon') or 1)
+    paths = positive(request.GET.get('paths') or 20000, int)
+    target = request.GET.get('target')
+    return {
+        'horizon': max(1/12, min(horizon, 30)),
+        'steps': max(1, min(int(round(12*horizon)), 360)),
+        'paths': max(100, min(paths, 100000)),
+        'target': positive(target) if target else None,
+    }
+
+
+def risk_env(params, result):
+    classes = 'table table-striped table-responsive'
+    env = dict(params)
+    if result is not None:
+        env['allocation'] = result.allocation().to_html(
+            border=0, classes=classes, float_format='{0:0.2f}'.format)
+        env['summary'] = result.summary().to_html(
+            border=0, classes=classes, float_format='{0:0.2f}'.format)
+    return env
+
+
+@login_required
+@replica
+def risk_report(request):
+    from . import risk
+    try:
+        params = risk_params(request)
+    except ValueError:
+        return HttpResponseBadRequest('bad parameter')
+    result = risk.run(*risk.load(request.user), **params)
+    return render(request, 'inv/risk.html', risk_env(params, result))
+
+
+# 响应在视图返回之后才生成，这里先确定读哪个库，不依赖replica的上下文。
+@login_required
+@replica
+def export_table(request, table, fmt):
+    from . import export
+    qs, columns = export.tables(request.user).get(table, (None, None))
+    if qs is None:
+        raise Http404('no such table')
+    content = export.stream(request.user, table, fmt,
+                            using=router.db_for_read(qs.model))
+    response = StreamingHttpResponse(content, content_type=export.FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{table}.{fmt}"'
+    return response
+
+
+@login_required
+def job_status(request):
+    jobs = list(Job.objects.owned_by(request.user).order_by('-id')[:50])
+    env = {
+        'jobs': jobs,
+        'active': any(j.status in (Job.WAITING, Job.RUNNING) for j in jobs),
+    }
+    return render(request, 'inv/jobs.html', env)
+
+
+SEARCH_LIMIT = 200
+
+
+@login_required
+@replica
+def search_view(request):
+    term = request.GET.get('q', '').strip()
+    env = {'q': term, 'limit': SEARCH_LIMIT, 'recs': [], 'projs': []}
+    if term:
+        recs = AccountRec.objects.owned_by(request.user).select_related('acct__bank', 'cat')
+        env['recs'] = list(search.search(recs, term).order_by('-date', '-id')[:SEARCH_LIMIT])
+        projs = InvProj.objects.owned_by(request.user).select_related('acct__bank')
+        env['projs'] = list(search.search(projs, term).order_by('-isopen', 'name')[:SEARCH_LIMIT])
+    return render(request, 'inv/search.html', env)
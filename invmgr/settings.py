@@ -58,7 +58,6 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -66,6 +65,14 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # DEBUG下Django默认不缓存编译好的模板。模板文件修改后，
+            # 开发服务器的autoreload会清空这个缓存。
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
@@ -80,7 +87,29 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {'timeout': 20},
+    },
+    # 同一个文件的只读连接，报表和admin列表页的读取走这里，不和写入互相阻塞。
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': 'file:' + os.path.join(BASE_DIR, 'db.sqlite3') + '?mode=ro',
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {'timeout': 20},
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['inv.db.ReportRouter']
+
+# 每个sqlite连接建立时执行。
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256*1024*1024,
+    'cache_size': -64*1024,
+    'temp_store': 'MEMORY',
+    'busy_timeout': 20000,
 }
 
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
@@ -123,3 +152,22 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+LOGIN_URL = '/admin/login/'
+
+
+# invmgr.asgi会打开这个选项，让报表使用异步视图。
+
+INV_ASYNC_VIEWS = os.environ.get('INV_ASYNC_VIEWS') == '1'
+
+
+# 报价驱动的网络访问方式：live, record, replay。
+# record把响应保存到INV_DRIVER_CASSETTE，replay从manage.py driverstub启动的服务读取。
+
+INV_DRIVER_TRANSPORT = os.environ.get('INV_DRIVER_TRANSPORT', 'live')
+
+INV_DRIVER_CASSETTE = os.environ.get(
+    'INV_DRIVER_CASSETTE', os.path.join(BASE_DIR, 'cassette'))
+
+INV_DRIVER_STUB = os.environ.get('INV_DRIVER_STUB', 'http://127.0.0.1:8765')